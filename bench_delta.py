@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量上传基准测试
+
+生成一个文件作为服务端已有的旧版本，按两种场景修改得到新版本：
+少量修改（几处改写、插入和追加数据）和大段修改（改写一半数据并插入数据），
+分别用完整上传（/upload/stream）和增量上传（/upload/delta）上传新版本，
+比较经过网络的字节数和耗时。增量上传的字节数包含下载签名的响应
+
+用法: python bench_delta.py [--size-mb 64]
+"""
+
+import argparse
+import http.client
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def make_old_version(directory, size):
+    """
+    生成旧版本文件
+
+    Returns:
+        str: 旧版本路径
+    """
+    old_path = os.path.join(directory, "old.img")
+    with open(old_path, "wb") as f:
+        f.write(os.urandom(size))
+    return old_path
+
+def edit_small(data, rng):
+    """
+    少量修改：改写10处各4KB的数据，模拟数据库页或磁盘块的修改，
+    中间插入1KB使之后的数据整体错位，最后追加64KB
+    """
+    for _ in range(10):
+        offset = rng.randrange(len(data) - 4096)
+        data[offset:offset + 4096] = os.urandom(4096)
+    middle = len(data) // 2
+    data[middle:middle] = os.urandom(1024)
+    data += os.urandom(64 * 1024)
+
+def edit_large(data, rng):
+    """
+    大段修改：改写中间一半的数据，模拟重装系统后的虚拟机镜像，
+    并在前后未修改的部分各插入一段数据
+    """
+    quarter = len(data) // 4
+    data[quarter:quarter * 3] = os.urandom(quarter * 2)
+    for offset in (rng.randrange(quarter * 3, len(data)), rng.randrange(quarter)):
+        data[offset:offset] = os.urandom(777)
+
+SCENARIOS = [("少量修改", edit_small), ("大段修改", edit_large)]
+
+def make_new_version(directory, old_path, name, edit):
+    """
+    修改旧版本生成新版本文件
+
+    Returns:
+        str: 新版本路径
+    """
+    new_path = os.path.join(directory, f"{name}.img")
+    with open(old_path, "rb") as src, open(new_path, "wb") as dst:
+        data = bytearray(src.read())
+        edit(data, random.Random(0))
+        dst.write(data)
+    return new_path
+
+def main():
+    parser = argparse.ArgumentParser(description="增量上传基准测试")
+    parser.add_argument("--size-mb", type=int, default=64, help="旧版本文件大小（MB）")
+    args = parser.parse_args()
+
+    from werkzeug.serving import make_server
+    from utils.file_utils import file_utils
+    from utils.delta import upload_delta
+    from web import app
+
+    bench_dir = tempfile.mkdtemp(prefix="bench_delta_")
+    try:
+        # 使用基准测试目录作为上传目录，避免污染static/uploads
+        file_utils.__init__(os.path.join(bench_dir, "uploads"))
+        app.config["MAX_CONTENT_LENGTH"] = None
+        old_path = make_old_version(bench_dir, args.size_mb * 1024 * 1024)
+        with open(old_path, "rb") as f:
+            file_utils.save_stream(f, "disk.img")
+
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        server_url = f"http://127.0.0.1:{server.server_port}"
+        with urllib.request.urlopen(f"{server_url}/api/signature/disk.img") as response:
+            signature_bytes = len(response.read())
+
+        for index, (name, edit) in enumerate(SCENARIOS):
+            new_path = make_new_version(bench_dir, old_path, f"new{index}", edit)
+            new_size = os.path.getsize(new_path)
+            print(f"{name}  旧版本: {args.size_mb} MB  新版本: {new_size / 1024 / 1024:.2f} MB")
+            print("=" * 50)
+
+            start = time.time()
+            conn = http.client.HTTPConnection("127.0.0.1", server.server_port)
+            with open(new_path, "rb") as f:
+                conn.request("PUT", f"/upload/stream?filename=full{index}.img", body=f,
+                             headers={"Content-Length": str(new_size)})
+            conn.getresponse().read()
+            conn.close()
+            print(f"完整上传  网络字节数: {new_size:>12}  耗时: {time.time() - start:6.2f} 秒")
+
+            start = time.time()
+            result, sent = upload_delta(server_url, new_path, "disk.img", f"delta{index}.img")
+            elapsed = time.time() - start
+            assert result["success"], result
+            total = signature_bytes + sent
+            print(f"增量上传  网络字节数: {total:>12}  耗时: {elapsed:6.2f} 秒"
+                  f"  (签名 {signature_bytes} + 增量 {sent}, 为完整上传的 {total / new_size:.2%})")
+
+            with open(new_path, "rb") as a, open(os.path.join(file_utils.upload_dir, result["filename"]), "rb") as b:
+                assert a.read() == b.read()
+            print("✓ 增量上传重建的文件与新版本一致")
+            print()
+        server.shutdown()
+    finally:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载吞吐量基准测试
+
+在子进程中启动服务，分别通过原来的send_from_directory实现（legacy）和
+当前的/download路由（开发服务器上使用sendfile）下载同一个文件，
+统计吞吐量和服务端进程消耗的CPU时间（仅Linux可用）
+
+用法: python bench_download.py [--size-mb 512] [--rounds 3]
+"""
+
+import argparse
+import http.client
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BUFFER_SIZE = 1024 * 1024
+
+def serve(bench_dir):
+    """
+    在当前进程中启动服务，并增加一个使用send_from_directory的对照路由
+    """
+    from flask import send_from_directory
+    from werkzeug.serving import make_server
+    from utils.file_utils import file_utils
+    from web import app
+
+    file_utils.__init__(os.path.join(bench_dir, "uploads"))
+    app.config["UPLOAD_FOLDER"] = file_utils.upload_dir
+    # 先计算校验和，避免后台计算占用测量期间的CPU
+    file_utils.get_checksum("bench.bin")
+
+    @app.route("/bench/legacy/<path:filename>")
+    def legacy_download(filename):
+        return send_from_directory(file_utils.upload_dir, filename, as_attachment=True)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+def cpu_seconds(pid):
+    """
+    读取进程已消耗的CPU时间（用户态+内核态）
+
+    Returns:
+        float or None: CPU秒数或None
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except OSError:
+        return None
+
+def download(port, path):
+    """
+    下载一次，客户端使用可重复使用的缓冲区读取，尽量减少客户端自身的开销
+
+    Returns:
+        int: 收到的字节数
+    """
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.request("GET", path)
+    response = conn.getresponse()
+    buffer = bytearray(BUFFER_SIZE)
+    received = 0
+    while True:
+        length = response.readinto(buffer)
+        if not length:
+            break
+        received += length
+    conn.close()
+    return received
+
+def main():
+    parser = argparse.ArgumentParser(description="下载吞吐量基准测试")
+    parser.add_argument("--size-mb", type=int, default=512, help="下载的文件大小（MB）")
+    parser.add_argument("--rounds", type=int, default=3, help="每种方式下载的次数")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    bench_dir = tempfile.mkdtemp(prefix="bench_download_")
+    upload_dir = os.path.join(bench_dir, "uploads")
+    os.makedirs(upload_dir)
+    size = args.size_mb * 1024 * 1024
+    with open(os.path.join(upload_dir, "bench.bin"), "wb") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", bench_dir],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        port = int(server.stdout.readline())
+        print(f"文件大小: {args.size_mb} MB  每种方式下载 {args.rounds} 次")
+        print("=" * 50)
+        for name, path in (("legacy", "/bench/legacy/bench.bin"), ("download", "/download/bench.bin")):
+            # 预热一次，让文件进入页缓存
+            download(port, path)
+            cpu_before = cpu_seconds(server.pid)
+            start = time.time()
+            for _ in range(args.rounds):
+                assert download(port, path) == size
+            elapsed = time.time() - start
+            cpu_after = cpu_seconds(server.pid)
+            throughput = size * args.rounds / elapsed / 1024 / 1024
+            print(f"{name:<10} 吞吐量: {throughput:8.1f} MB/s  ", end="")
+            if cpu_before is None:
+                print("服务端CPU: 不可用")
+            else:
+                per_gb = (cpu_after - cpu_before) / (size * args.rounds / 1024 ** 3)
+                print(f"服务端CPU: {per_gb:.2f} 秒/GB")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
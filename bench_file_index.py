@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件列表基准测试
+
+在包含1k、10k、100k个文件的目录中比较每次扫描目录（原实现：scandir+stat+排序）
+和内存索引获取文件列表的耗时，以及新增、删除一个文件后增量更新索引并重新获取列表的耗时。
+保存文件本身（写blob、refs.json和校验和索引）的耗时不计入。
+另外比较/api/files分页查询一页（100个文件，翻到中间一页、按名称前缀筛选）的耗时，
+以及完整列表和一页的JSON大小
+
+用法: python bench_file_index.py [--counts 1000 10000 100000]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.file_utils import FileUtils
+from utils.file_index import encode_cursor
+
+EMPTY_DIGEST = hashlib.sha256(b"").hexdigest()
+
+def legacy_file_list(file_utils):
+    """
+    原来的实现：每次扫描目录、stat每个文件并排序
+    """
+    file_list = []
+    with os.scandir(file_utils.upload_dir) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            file_stats = entry.stat()
+            sha256 = file_utils.checksums.lookup(entry.name, file_stats)
+            file_list.append({
+                "filename": entry.name,
+                "size": file_utils._logical_size(sha256, file_stats),
+                "mtime": datetime.fromtimestamp(file_stats.st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
+                "sha256": sha256,
+                "url": f"/download/{entry.name}"
+            })
+    file_list.sort(key=lambda x: x["mtime"], reverse=True)
+    return file_list
+
+def populate(directory, count):
+    """
+    生成count个空文件，修改时间各不相同，并预先记录校验和，避免后台计算干扰计时
+    """
+    file_utils = FileUtils(directory)
+    base = time.time() - count
+    for i in range(count):
+        path = os.path.join(directory, f"file_{i:06d}.txt")
+        open(path, "wb").close()
+        os.utime(path, (base + i, base + i))
+        file_stats = os.stat(path)
+        file_utils.checksums.entries[os.path.basename(path)] = {
+            "sha256": EMPTY_DIGEST, "size": 0, "mtime_ns": file_stats.st_mtime_ns
+        }
+    with file_utils.checksums.lock:
+        file_utils.checksums._save_entries()
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+def bench(count):
+    directory = tempfile.mkdtemp(prefix="bench_index_")
+    try:
+        populate(directory, count)
+        file_utils = FileUtils(directory)
+        repeat = max(1, 20000 // count)
+
+        legacy, legacy_files = timed(lambda: legacy_file_list(file_utils), repeat)
+        cold, files = timed(file_utils.get_file_list, 1)
+        assert [f["filename"] for f in files] == [f["filename"] for f in legacy_files]
+        warm, _ = timed(file_utils.get_file_list, 1000)
+
+        # 分页查询：翻到中间一页，以及按名称排序并按前缀筛选
+        middle = encode_cursor("mtime", True, file_utils.file_index.folders[""].files.orders["mtime"][count // 2])
+        page, (page_files, _, _) = timed(lambda: file_utils.query_files(limit=100, cursor=middle), 1000)
+        assert len(page_files) == 100
+        filtered, (filtered_files, _, _) = timed(
+            lambda: file_utils.query_files(sort="name", prefix="file_0005", limit=100), 1000)
+        assert len(filtered_files) == min(100, max(0, count - 500))
+        full_size = len(json.dumps({"files": files}))
+        page_size = len(json.dumps({"files": page_files}))
+
+        # 新增一个文件：增量插入并重新生成列表
+        _, filename = file_utils.save_stream(BytesIO(b"new"), "new.txt")
+        start = time.perf_counter()
+        file_utils.file_index.update(filename)
+        files = file_utils.get_file_list()
+        after_save = time.perf_counter() - start
+        assert files[0]["filename"] == filename
+        file_utils.delete_file(filename)
+        start = time.perf_counter()
+        file_utils.file_index.remove(filename)
+        files = file_utils.get_file_list()
+        after_delete = time.perf_counter() - start
+        assert len(files) == count
+
+        print(f"{count:>8} | {legacy * 1000:>10.2f} | {cold * 1000:>10.2f} | {warm * 1e6:>10.2f} | "
+              f"{after_save * 1000:>10.2f} | {after_delete * 1000:>10.2f} | {page * 1e6:>10.2f} | "
+              f"{filtered * 1e6:>10.2f} | {full_size / 1024:>10.1f} | {page_size / 1024:>10.1f}")
+    finally:
+        shutil.rmtree(directory)
+
+def main():
+    parser = argparse.ArgumentParser(description="文件列表基准测试")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 100000], help="目录中的文件数")
+    args = parser.parse_args()
+
+    print(f"{'文件数':>6} | {'扫描(ms)':>8} | {'首次建索引(ms)':>6} | {'索引(µs)':>8} | "
+          f"{'新增后(ms)':>7} | {'删除后(ms)':>7} | {'分页(µs)':>8} | {'前缀筛选(µs)':>6} | "
+          f"{'全量JSON(KB)':>8} | {'单页JSON(KB)':>8}")
+    print("-" * 124)
+    for count in args.counts:
+        bench(count)
+
+if __name__ == "__main__":
+    main()
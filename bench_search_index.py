@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名搜索基准测试
+
+在1k、10k、100k个文件名上比较逐个检查所有文件名（原来在浏览器中筛选完整列表的做法）
+和三元组索引的搜索耗时，以及建立索引、增量加入和删除一个文件名的耗时。
+查询包括常见的子串（匹配很多文件）、少见的子串（匹配几个文件）和拼错的名称（模糊匹配）
+
+用法: python bench_search_index.py [--counts 1000 10000 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.search_index import TrigramIndex
+
+WORDS = ["report", "invoice", "photo", "holiday", "meeting", "notes", "draft", "final", "budget",
+         "scan", "lecture", "slides", "homework", "project", "backup", "screenshot"]
+EXTENSIONS = ["pdf", "docx", "jpg", "png", "xlsx", "txt", "zip", "mp4"]
+QUERIES = {"常见": "photo", "少见": "budget_0042", "模糊": "lectrue_slides_01"}
+
+def make_names(count):
+    rng = random.Random(count)
+    return [f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{i:06d}.{rng.choice(EXTENSIONS)}" for i in range(count)]
+
+def linear_search(names, query, limit):
+    query = query.lower()
+    return [name for name in names if query in name.lower()][:limit]
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+def bench(count):
+    names = make_names(count)
+    index = TrigramIndex()
+    build, _ = timed(lambda: [index.add(name, name) for name in names], 1)
+    row = [f"{count:8d}", f"{build * 1000:10.1f}"]
+    for query in QUERIES.values():
+        linear, _ = timed(lambda: linear_search(names, query, 50), 5)
+        indexed, _ = timed(lambda: index.search(query, 50), 20)
+        row += [f"{linear * 1000:8.2f}", f"{indexed * 1000:8.2f}"]
+    update, _ = timed(lambda: (index.add("new_report.pdf", "new_report.pdf"), index.remove("new_report.pdf")), 1000)
+    row.append(f"{update * 1e6:8.1f}")
+    print(" | ".join(row))
+
+def main():
+    parser = argparse.ArgumentParser(description="文件名搜索基准测试")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    headers = ["文件数", "建索引ms"]
+    for label in QUERIES:
+        headers += [f"{label}逐个ms", f"{label}索引ms"]
+    headers.append("增删us")
+    print(" | ".join(headers))
+    for count in args.counts:
+        bench(count)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传内存占用和磁盘写入量基准测试
+
+分别在独立子进程中启动服务并上传同样大小的数据，统计每上传1GB数据的
+峰值内存（RSS）增量和实际写入磁盘的字节数：
+  spool      - 旧路径：multipart先缓冲到系统临时文件，再复制到上传目录
+  multipart  - multipart直接写入上传目录内的临时文件，保存时重命名
+  stream     - /upload/stream，请求体直接流式写入目标文件
+
+用法: python bench_upload_stream.py [--size-mb 256]
+"""
+
+import argparse
+import http.client
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ["spool", "multipart", "stream"]
+BLOCK_SIZE = 1024 * 1024
+
+def read_write_bytes():
+    """
+    读取当前进程写入块设备的字节数，仅Linux可用
+
+    Returns:
+        int or None: 写入字节数或None
+    """
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def peak_rss_kb():
+    """
+    获取当前进程的峰值内存（KB）
+    """
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return 0
+
+def generate_body(size, prefix=b"", suffix=b""):
+    """
+    按块生成请求体，客户端不会把整份数据放进内存
+    """
+    yield prefix
+    block = os.urandom(BLOCK_SIZE)
+    remaining = size
+    while remaining > 0:
+        length = min(remaining, BLOCK_SIZE)
+        yield block[:length]
+        remaining -= length
+    yield suffix
+
+def run_mode(mode, size):
+    """
+    在当前进程中启动服务并上传一次，打印测量结果
+    """
+    from werkzeug.serving import make_server
+    from flask import Request
+    from utils.file_utils import file_utils
+    from web import app
+
+    bench_dir = os.environ["BENCH_DIR"]
+    # 使用基准测试目录作为上传目录，避免污染static/uploads
+    file_utils.__init__(os.path.join(bench_dir, "uploads"))
+    # 基准测试的数据量可能超过配置的单文件大小限制
+    app.config["MAX_CONTENT_LENGTH"] = None
+    if mode == "spool":
+        app.request_class = Request
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    rss_before = peak_rss_kb()
+    written_before = read_write_bytes()
+
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_port)
+    if mode == "stream":
+        body = generate_body(size)
+        headers = {"Content-Length": str(size), "Content-Type": "application/octet-stream"}
+        conn.request("PUT", "/upload/stream?filename=bench.bin", body=body, headers=headers)
+    else:
+        boundary = "benchboundary"
+        prefix = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench.bin\"\r\n"
+                  f"Content-Type: application/octet-stream\r\n\r\n").encode()
+        suffix = f"\r\n--{boundary}--\r\n".encode()
+        body = generate_body(size, prefix, suffix)
+        headers = {
+            "Content-Length": str(size + len(prefix) + len(suffix)),
+            "Content-Type": f"multipart/form-data; boundary={boundary}"
+        }
+        conn.request("POST", "/upload", body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+
+    # 确保数据真正落盘后再统计写入量
+    os.sync()
+    written_after = read_write_bytes()
+    server.shutdown()
+
+    gb = size / (1024 ** 3)
+    rss_mb = (peak_rss_kb() - rss_before) / 1024
+    print(f"{mode:<10} 状态码: {response.status}  峰值内存增量: {rss_mb:8.1f} MB  ", end="")
+    if written_before is None:
+        print("磁盘写入量: 不可用")
+    else:
+        written = written_after - written_before
+        print(f"每GB写入磁盘: {written / gb / (1024 ** 3):.2f} GB")
+
+def main():
+    parser = argparse.ArgumentParser(description="上传内存占用和磁盘写入量基准测试")
+    parser.add_argument("--size-mb", type=int, default=256, help="每次上传的数据大小（MB）")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    if args.mode:
+        run_mode(args.mode, size)
+        return
+
+    print(f"上传数据大小: {args.size_mb} MB")
+    print("=" * 50)
+    for mode in MODES:
+        bench_dir = tempfile.mkdtemp(prefix="bench_upload_")
+        try:
+            # 让werkzeug的临时文件也落在同一磁盘上，便于统计
+            env = dict(os.environ, BENCH_DIR=bench_dir, TMPDIR=bench_dir)
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode,
+                            "--size-mb", str(args.size_mb)], env=env, check=True)
+        finally:
+            shutil.rmtree(bench_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户缓存查找基准测试
+
+在1k、10k、100k个历史用户上比较逐个遍历用户列表（原来的做法）和字典索引的查找耗时：
+按IP查找（登录）、按用户ID查找（发消息）、按socket_id查找以及获取在线用户（断开连接时广播）。
+在线用户数固定为60，模拟一个教室的设备
+
+用法: python bench_user_cache.py [--counts 1000 10000 100000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.user_cache import UserCache
+
+ONLINE = 60
+
+def linear_by_ip(cache, ip_address):
+    for user in cache.get_all_users():
+        if user.get("ip_address") == ip_address:
+            return user
+    return None
+
+def linear_by_id(cache, user_id):
+    for user in cache.get_all_users():
+        if user["user_id"] == user_id:
+            return user
+    return None
+
+def linear_by_socket(cache, socket_id):
+    for user_id, sockets in cache.user_connections.items():
+        if socket_id in sockets:
+            return user_id
+    return None
+
+def linear_online(cache):
+    return [user for user in cache.get_all_users() if user.get("user_id") in cache.online_users]
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+def bench(count, tmp_dir):
+    cache_file = os.path.join(tmp_dir, f"users_{count}.json")
+    users = [{"user_id": f"user-{i}", "username": f"用户_{i + 1}", "ip_address": f"10.{i >> 16}.{(i >> 8) & 255}.{i & 255}",
+              "device_info": "", "last_seen": ""} for i in range(count)]
+    with open(cache_file, "w", encoding="utf-8") as f:
+        json.dump({"users": users}, f)
+    cache = UserCache(cache_file)
+    # 在线的是最近的用户，逐个遍历时需要走到列表末尾
+    for i in range(count - ONLINE, count):
+        cache.add_online_user(f"user-{i}", f"socket-{i}")
+    last = users[-1]
+    cases = [
+        (lambda: linear_by_ip(cache, last["ip_address"]), lambda: cache.get_user_by_ip(last["ip_address"])),
+        (lambda: linear_by_id(cache, last["user_id"]), lambda: cache.get_user_by_id(last["user_id"])),
+        (lambda: linear_by_socket(cache, f"socket-{count - 1}"), lambda: cache.get_user_by_socket_id(f"socket-{count - 1}")),
+        (lambda: linear_online(cache), lambda: cache.get_online_users()),
+    ]
+    row = [f"{count:8d}"]
+    for linear, indexed in cases:
+        assert linear() == indexed()
+        row += [f"{timed(linear, 20) * 1e6:10.1f}", f"{timed(indexed, 2000) * 1e6:8.2f}"]
+    print(" | ".join(row))
+
+def main():
+    parser = argparse.ArgumentParser(description="用户缓存查找基准测试")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    headers = ["用户数"]
+    for label in ("按IP", "按ID", "按socket", "在线用户"):
+        headers += [f"{label}遍历us", f"{label}索引us"]
+    print(" | ".join(headers))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for count in args.counts:
+            bench(count, tmp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户缓存持久化基准测试
+
+在1k、10k个历史用户上测量：
+- 写入一次users.json的耗时（临时文件 + fsync + 替换）
+- 60台设备同时重新连接（登录并在断开时更新最后在线时间，共120次修改）的耗时和写文件次数，
+  比较原来每次修改都重写整个文件和合并写入两种方式
+
+用法: python bench_user_persistence.py [--counts 1000 10000] [--interval 0.5]
+100k个用户时每次重写的方式需要约两分钟，需要时用--counts 100000指定
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.user_cache import UserCache
+from utils.user_store import JsonUserStore
+
+DEVICES = 60
+
+class WriteThroughUserStore(JsonUserStore):
+    """
+    原来的做法：每次修改都直接重写整个文件
+    """
+
+    def _mark_dirty(self):
+        self.writer.snapshot_seq += 1
+        with open(self.cache_file, "w", encoding="utf-8") as f:
+            json.dump({"users": self.users}, f, ensure_ascii=False, indent=2)
+
+def write_users(cache_file, count):
+    users = [{"user_id": f"user-{i}", "username": f"用户_{i + 1}", "ip_address": f"10.{i >> 16}.{(i >> 8) & 255}.{i & 255}",
+              "device_info": "", "last_seen": ""} for i in range(count)]
+    with open(cache_file, "w", encoding="utf-8") as f:
+        json.dump({"users": users}, f)
+
+def reconnect(cache):
+    """
+    一个教室的设备重新连接：新设备登录，断开时更新最后在线时间
+
+    Returns:
+        float: 耗时（秒）
+    """
+    start = time.perf_counter()
+    for i in range(DEVICES):
+        user = cache.create_user(f"192.168.0.{i}", "bench")
+        cache.update_user_last_seen(user["user_id"])
+    return time.perf_counter() - start
+
+def bench(count, interval, tmp_dir):
+    cache_file = os.path.join(tmp_dir, "users.json")
+    write_users(cache_file, count)
+    store = JsonUserStore(cache_file, interval)
+    store.get_all()
+    store.writer.dirty = True
+    start = time.perf_counter()
+    store.flush()
+    flush = time.perf_counter() - start
+
+    write_users(cache_file, count)
+    legacy = UserCache(store=WriteThroughUserStore(cache_file))
+    legacy_time = reconnect(legacy)
+    legacy_writes = legacy.store.writer.snapshot_seq
+
+    write_users(cache_file, count)
+    cache = UserCache(cache_file, save_interval=interval)
+    batched_time = reconnect(cache)
+    # 立即写入定时器尚未写入的修改
+    cache.close()
+    batched_writes = cache.store.writer.snapshot_seq
+    print(f"{count:8d} | {flush * 1000:10.1f} | {legacy_time * 1000:10.1f} | {legacy_writes:6d} | "
+          f"{batched_time * 1000:10.2f} | {batched_writes:6d}")
+
+def main():
+    parser = argparse.ArgumentParser(description="用户缓存持久化基准测试")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--interval", type=float, default=0.5, help="合并写入的最短间隔（秒）")
+    args = parser.parse_args()
+    print(f"{DEVICES}台设备重新连接，共{DEVICES * 2}次修改")
+    print("用户数 | 写入一次ms | 每次重写ms | 写入次数 | 合并写入ms | 写入次数")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for count in args.counts:
+            bench(count, args.interval, tmp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户信息存储基准测试
+
+在1k、10k、100k个历史用户上比较JSON文件和SQLite两种存储：
+- 启动耗时：打开存储并完成第一次按IP查找（JSON需要读入整个文件）
+- 按IP和按用户ID查找的耗时
+- 修改一个用户并写入磁盘的耗时（JSON需要重写整个文件，SQLite只写一行）
+SQLite数据库由同一个users.json导入生成，导入耗时单独列出
+
+用法: python bench_user_store.py [--counts 1000 10000 100000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.user_cache import UserCache
+from utils.user_store import JsonUserStore, SqliteUserStore
+
+def write_users(cache_file, count):
+    users = [{"user_id": f"user-{i}", "username": f"用户_{i + 1}", "ip_address": f"10.{i >> 16}.{(i >> 8) & 255}.{i & 255}",
+              "device_info": "", "last_seen": ""} for i in range(count)]
+    with open(cache_file, "w", encoding="utf-8") as f:
+        json.dump({"users": users}, f, ensure_ascii=False, indent=2)
+    return users[-1]
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+def bench_store(make_store, last, repeat):
+    """
+    Returns:
+        list: 启动、按IP查找、按ID查找（微秒）和修改一个用户并写入（毫秒）的耗时
+    """
+    start = time.perf_counter()
+    cache = UserCache(store=make_store())
+    cache.get_user_by_ip(last["ip_address"])
+    startup = time.perf_counter() - start
+    by_ip = timed(lambda: cache.get_user_by_ip(last["ip_address"]), 2000)
+    by_id = timed(lambda: cache.get_user_by_id(last["user_id"]), 2000)
+    write = timed(lambda: (cache.update_user_last_seen(last["user_id"]), cache.flush()), repeat)
+    cache.close()
+    return [startup * 1000, by_ip * 1e6, by_id * 1e6, write * 1000]
+
+def bench(count, tmp_dir):
+    cache_file = os.path.join(tmp_dir, f"users_{count}.json")
+    db_path = os.path.join(tmp_dir, f"users_{count}.db")
+    last = write_users(cache_file, count)
+    start = time.perf_counter()
+    SqliteUserStore(db_path, cache_file).close()
+    migrate = time.perf_counter() - start
+    repeat = max(3, 1000000 // count // 10)
+    json_row = bench_store(lambda: JsonUserStore(cache_file, save_interval=0), last, repeat)
+    sqlite_row = bench_store(lambda: SqliteUserStore(db_path), last, repeat)
+    for name, row in (("json", json_row), ("sqlite", sqlite_row)):
+        print(f"{count:8d} | {name:6s} | {row[0]:8.1f} | {row[1]:8.2f} | {row[2]:8.2f} | {row[3]:10.3f}")
+    print(f"{count:8d} | 导入   | {migrate * 1000:8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="用户信息存储基准测试")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    print("用户数 | 存储 | 启动ms | 按IPus | 按IDus | 修改并写入ms")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for count in args.counts:
+            bench(count, tmp_dir)
+
+if __name__ == "__main__":
+    main()
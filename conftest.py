@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+pytest在收集测试模块之前加载本文件，先在临时目录中创建全局实例，
+测试不会写入项目的static/uploads、users.json和app.log
+"""
+
+import pytest
+
+import temp_workspace
+
+temp_workspace.enter()
+
+@pytest.fixture
+def file_utils(tmp_path):
+    """
+    在测试的临时目录中创建FileUtils，测试结束后关闭
+    """
+    with temp_workspace.open_file_utils(tmp_path) as instance:
+        yield instance
@@ -9,8 +9,14 @@ import logging
 from PIL import Image, ImageTk
 import qrcode
 from web import app, socketio
+from utils.bandwidth import bandwidth_manager
+from utils.user_cache import user_cache
+from utils.file_utils import file_utils
 from utils.logger import logger
 
+# 带宽设置界面中的速率单位（字节/秒）
+RATE_UNIT = 1024 * 1024
+
 class FileTransferGUI(tk.Tk):
     """
     文件传输工具GUI类
@@ -58,9 +64,21 @@ class FileTransferGUI(tk.Tk):
                 "server_port": 5000,
                 "upload_dir": "static/uploads",
                 "user_cache_file": "users.json",
+                "user_store": "json",
                 "log_level": "INFO",
                 "auto_open_browser": True,
-                "max_file_size": 104857600
+                "max_file_size": 104857600,
+                "upload_chunk_size": 4194304,
+                "upload_session_ttl": 3600,
+                "max_upload_sessions": 16,
+                "min_free_space": 536870912,
+                "storage_compression": None,
+                "variant_cache_size": 1073741824,
+                "thumbnail_cache_size": 268435456,
+                "watch_upload_dir": True,
+                "watch_poll_interval": 2.0,
+                "user_save_interval": 0.5,
+                "bandwidth_limits": {}
             }
     
     def _create_widgets(self):
@@ -95,6 +113,22 @@ class FileTransferGUI(tk.Tk):
         url_entry = ttk.Entry(url_frame, textvariable=self.url_var, state="readonly", font=("Arial", 10))
         url_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
         
+        # 带宽限制设置区
+        bandwidth_frame = ttk.LabelFrame(main_frame, text="带宽限制（MB/s，留空不限速）", padding="10")
+        bandwidth_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        limits = bandwidth_manager.get_limits()
+        self.bandwidth_vars = {}
+        fields = [("download", "global", "下载总计"), ("download", "per_user", "下载每用户"),
+                  ("upload", "global", "上传总计"), ("upload", "per_user", "上传每用户")]
+        for direction, scope, text in fields:
+            ttk.Label(bandwidth_frame, text=f"{text}:").pack(side=tk.LEFT, padx=(0, 5))
+            rate = limits[direction][scope]
+            var = tk.StringVar(value="" if rate is None else f"{rate / RATE_UNIT:g}")
+            ttk.Entry(bandwidth_frame, textvariable=var, width=8).pack(side=tk.LEFT, padx=(0, 10))
+            self.bandwidth_vars[(direction, scope)] = var
+        ttk.Button(bandwidth_frame, text="应用", command=self._apply_bandwidth_limits).pack(side=tk.LEFT)
+        
         # 二维码和日志区
         content_frame = ttk.Frame(main_frame)
         content_frame.pack(fill=tk.BOTH, expand=True)
@@ -114,6 +148,27 @@ class FileTransferGUI(tk.Tk):
         self.log_text.pack(fill=tk.BOTH, expand=True)
         self.log_text.configure(state="disabled")
     
+    def _apply_bandwidth_limits(self):
+        """
+        应用界面中的带宽限制，立即对正在进行的传输生效并保存到配置文件
+        """
+        try:
+            data = {"upload": {}, "download": {}}
+            for (direction, scope), var in self.bandwidth_vars.items():
+                value = var.get().strip()
+                data[direction][scope] = float(value) * RATE_UNIT if value else None
+            bandwidth_manager.update_limits(data)
+        except ValueError:
+            messagebox.showerror("错误", "请输入有效的非负数字")
+            return
+        
+        self.config["bandwidth_limits"] = bandwidth_manager.get_limits()
+        try:
+            with open("config.json", "w") as f:
+                json.dump(self.config, f, indent=4)
+        except Exception as e:
+            logger.error(f"保存配置文件失败: {e}")
+    
     def _setup_logging(self):
         """
         设置日志重定向，将日志显示到GUI文本框中
@@ -254,6 +309,9 @@ class FileTransferGUI(tk.Tk):
             if hasattr(self, 'server_thread') and self.server_thread.is_alive():
                 # 由于Flask-SocketIO的run()方法是阻塞的，我们需要强制终止线程
                 # 这不是最佳实践，但对于我们的简单应用来说是可行的
+                # SIGTERM不会执行atexit注册的清理，先写入尚未保存的用户信息和文件索引
+                user_cache.close()
+                file_utils.close()
                 import os
                 import signal
                 os.kill(os.getpid(), signal.SIGTERM)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试用的临时工作目录
+
+全局的file_utils、upload_session_manager、user_cache和日志在创建时按当前目录确定
+static/uploads、users.json和app.log的位置。测试在导入utils和web之前调用enter，
+在临时目录中创建这些全局实例，不会写入项目中的这些文件。
+测试用的FileUtils由open_file_utils在给定目录中创建，结束时关闭，
+pytest通过conftest.py中的file_utils夹具使用，直接运行测试脚本时通过run_with_file_utils使用
+"""
+
+import contextlib
+import os
+import shutil
+import tempfile
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_workspace = None
+
+def enter():
+    """
+    在临时工作目录中读取config.json的副本并创建全局实例，之后切换回原来的目录。
+    多次调用只创建一次，程序退出时删除临时目录
+
+    Returns:
+        str: 临时工作目录
+    """
+    global _workspace
+    if _workspace is None:
+        _workspace = tempfile.TemporaryDirectory(prefix="file_transfer_test_")
+        shutil.copy(os.path.join(PROJECT_DIR, "config.json"), _workspace.name)
+        cwd = os.getcwd()
+        os.chdir(_workspace.name)
+        try:
+            import web  # noqa: F401
+        finally:
+            os.chdir(cwd)
+    return _workspace.name
+
+@contextlib.contextmanager
+def open_file_utils(upload_dir):
+    """
+    在上传目录中创建FileUtils，结束时写入尚未保存的索引，
+    之后删除目录时不会与延迟写入冲突
+
+    Args:
+        upload_dir: 上传目录
+
+    Yields:
+        FileUtils: 文件处理工具
+    """
+    # 导入utils会创建全局实例，调用时才导入，保证在enter之后
+    from utils.file_utils import FileUtils
+    file_utils = FileUtils(str(upload_dir))
+    try:
+        yield file_utils
+    finally:
+        file_utils.close()
+
+def run_with_file_utils(test):
+    """
+    直接运行测试脚本时调用需要file_utils夹具的测试，FileUtils创建在临时目录中
+
+    Args:
+        test: 测试函数，参数为FileUtils
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir, open_file_utils(tmp_dir) as file_utils:
+        test(file_utils)
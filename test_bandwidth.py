@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试带宽限制和公平分配
+"""
+
+import http.client
+import os
+import sys
+import threading
+import time
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from werkzeug.serving import make_server
+from web import app
+from utils.bandwidth import fair_share, TokenBucket, bandwidth_manager
+from utils.file_utils import file_utils
+
+CONTENT = os.urandom(256 * 1024)
+RATE = 1024 * 1024
+UNLIMITED = {
+    "upload": {"global": None, "per_user": None, "per_transfer": None},
+    "download": {"global": None, "per_user": None, "per_transfer": None}
+}
+
+def approx(a, b):
+    return abs(a - b) < 1e-3
+
+def test_fair_share():
+    """
+    测试最大最小公平分配
+    """
+    print("测试1: 公平分配")
+    print("-" * 50)
+
+    rates = fair_share([("a", "u1", None), ("b", "u1", None), ("c", "u2", None)], 300)
+    assert all(approx(rate, 100) for rate in rates.values())
+    print("✓ 全局带宽在传输间平分")
+
+    rates = fair_share([("a", "u1", 20), ("b", "u1", None), ("c", "u2", None)], 300)
+    assert approx(rates["a"], 20) and approx(rates["b"], 140) and approx(rates["c"], 140)
+    print("✓ 用不完份额的传输让出剩余带宽")
+
+    rates = fair_share([("a", "u1", None), ("b", "u1", None), ("c", "u2", None)], 300, {"u1": 60})
+    assert approx(rates["a"], 30) and approx(rates["b"], 30) and approx(rates["c"], 240)
+    print("✓ 用户合计不超过用户限制，剩余带宽分给其他用户")
+
+    rates = fair_share([("a", "u1", 50), ("b", "u2", None)], None, {"u2": 80})
+    assert rates == {"a": 50, "b": 80}
+    rates = fair_share([("a", "u1", None)])
+    assert rates == {"a": None}
+    print("✓ 没有全局限制时各自按自身限制")
+    print()
+
+def test_token_bucket():
+    """
+    测试令牌桶的等待时间
+    """
+    print("测试2: 令牌桶")
+    print("-" * 50)
+
+    bucket = TokenBucket(100 * 1024)
+    # 初始令牌用完后按速率等待
+    assert bucket.consume(64 * 1024) == 0
+    delay = bucket.consume(100 * 1024)
+    assert 0.95 < delay <= 1.0
+    bucket.set_rate(None)
+    assert bucket.consume(10 ** 9) == 0
+    print("✓ 超出速率时返回需要等待的时间，不限速时不等待")
+    print()
+
+def test_throttled_download():
+    """
+    测试下载和上传按限制降速
+    """
+    print("测试3: 传输限速")
+    print("-" * 50)
+
+    client = app.test_client()
+    _, filename = file_utils.save_stream(BytesIO(CONTENT), "bandwidth_test.bin")
+    try:
+        # 测试客户端不会自动关闭响应，关闭后传输才结束
+        start = time.monotonic()
+        with client.get(f"/download/{filename}") as response:
+            assert response.data == CONTENT
+        assert time.monotonic() - start < 0.1
+        print("✓ 默认不限速")
+
+        bandwidth_manager.update_limits({"download": {"global": RATE}})
+        start = time.monotonic()
+        with client.get(f"/download/{filename}") as response:
+            assert response.data == CONTENT
+        elapsed = time.monotonic() - start
+        # 新传输的令牌桶初始为空，256KB按1MB/s约0.25秒
+        assert 0.15 < elapsed < 0.5, elapsed
+        print(f"✓ 下载按限制降速 ({elapsed:.2f}秒)")
+
+        response = client.get("/api/files")
+        assert response.status_code == 200
+        print("✓ 非传输请求不受影响")
+
+        bandwidth_manager.update_limits({"upload": {"per_transfer": RATE}})
+        start = time.monotonic()
+        with client.put("/upload/stream?filename=bandwidth_upload.bin", data=CONTENT) as response:
+            assert response.get_json()["success"]
+        elapsed = time.monotonic() - start
+        file_utils.delete_file(response.get_json()["filename"])
+        assert 0.15 < elapsed < 0.5, elapsed
+        print(f"✓ 上传按限制降速 ({elapsed:.2f}秒)")
+        assert bandwidth_manager.get_transfers() == []
+        print("✓ 传输结束后释放带宽")
+    finally:
+        bandwidth_manager.update_limits(UNLIMITED)
+        file_utils.delete_file(filename)
+    print()
+
+def test_throttled_sendfile():
+    """
+    测试开发服务器上通过sendfile发送的下载同样受限制
+    """
+    print("测试4: sendfile限速")
+    print("-" * 50)
+
+    _, filename = file_utils.save_stream(BytesIO(CONTENT), "bandwidth_sendfile.bin")
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        bandwidth_manager.update_limits({"download": {"per_user": RATE}})
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        start = time.monotonic()
+        conn.request("GET", f"/download/{filename}")
+        data = conn.getresponse().read()
+        elapsed = time.monotonic() - start
+        conn.close()
+        assert data == CONTENT
+        assert 0.15 < elapsed < 0.5, elapsed
+        print(f"✓ sendfile分块发送并限速 ({elapsed:.2f}秒)")
+    finally:
+        server.shutdown()
+        bandwidth_manager.update_limits(UNLIMITED)
+        file_utils.delete_file(filename)
+    print()
+
+def test_admin_api():
+    """
+    测试管理接口
+    """
+    print("测试5: 管理接口")
+    print("-" * 50)
+
+    client = app.test_client()
+    try:
+        response = client.put("/api/admin/bandwidth", json={
+            "download": {"global": 5 * RATE},
+            "users": {"user-1": {"upload": RATE}}
+        })
+        assert response.status_code == 200
+        limits = response.get_json()["limits"]
+        assert limits["download"]["global"] == 5 * RATE
+        assert limits["users"] == {"user-1": {"upload": RATE}}
+        assert response.get_json()["transfers"] == []
+        print("✓ 运行时修改限制")
+
+        response = client.put("/api/admin/bandwidth", json={"users": {"user-1": {"upload": None}}})
+        assert response.get_json()["limits"]["users"] == {}
+        print("✓ 清除用户单独的限制")
+
+        response = client.put("/api/admin/bandwidth", json={"download": {"global": -1}})
+        assert response.status_code == 400
+        response = client.put("/api/admin/bandwidth", json={"download": {"unknown": 1}})
+        assert response.status_code == 400
+        assert bandwidth_manager.get_limits()["download"]["global"] == 5 * RATE
+        print("✓ 无效的限制返回400且不做修改")
+
+        response = client.put("/api/admin/transfers/missing/limit", json={"limit": RATE})
+        assert response.status_code == 404
+        print("✓ 不存在的传输返回404")
+
+        response = client.get("/api/admin/bandwidth", environ_base={"REMOTE_ADDR": "192.168.1.20"})
+        assert response.status_code == 403
+        print("✓ 只允许本机访问")
+    finally:
+        bandwidth_manager.update_limits(UNLIMITED)
+    print()
+
+if __name__ == "__main__":
+    print("开始测试带宽限制...")
+    print("=" * 60)
+    test_fair_share()
+    test_token_bucket()
+    test_throttled_download()
+    test_throttled_sendfile()
+    test_admin_api()
+    print("所有测试通过!")
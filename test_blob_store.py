@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试内容寻址存储：相同内容只保存一份，秒传探测无需传输数据
+"""
+
+import hashlib
+import os
+import sys
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import temp_workspace
+from utils.file_utils import FileUtils
+
+def test_duplicate_upload(file_utils):
+    """
+    测试重复上传相同内容
+    """
+    print("测试1: 重复上传相同内容")
+    print("-" * 50)
+
+    content = os.urandom(20000)
+
+    _, first = file_utils.save_stream(BytesIO(content), "setup.exe")
+    success, again = file_utils.save_stream(BytesIO(content), "setup.exe")
+    assert success and again == first
+    print("✓ 同名同内容的文件不会生成_1副本")
+
+    _, other = file_utils.save_stream(BytesIO(content), "installer.exe")
+    blob_store = file_utils.blob_store
+    assert blob_store.get_digest(first) == blob_store.get_digest(other)
+    assert blob_store.ref_counts == {blob_store.get_digest(first): 2}
+    print(f"✓ 不同文件名引用同一份内容: {first}, {other}")
+
+    _, changed = file_utils.save_stream(BytesIO(b"new version"), "setup.exe")
+    assert changed == "setup_1.exe"
+    print(f"✓ 同名但内容不同的文件保存为: {changed}")
+
+    print()
+
+def test_probe(file_utils):
+    """
+    测试秒传探测
+    """
+    print("测试2: 秒传探测")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    content = os.urandom(20000)
+    digest = hashlib.sha256(content).hexdigest()
+
+    exists, _ = file_utils.save_blob_reference(digest, "data.csv")
+    assert not exists
+    print("✓ 服务端没有该内容时需要上传")
+
+    file_utils.save_stream(BytesIO(content), "data.csv")
+    exists, filename = file_utils.save_blob_reference(digest, "copy.csv")
+    assert exists and filename == "copy.csv"
+    with open(os.path.join(upload_dir, filename), "rb") as f:
+        assert f.read() == content
+    print(f"✓ 服务端已有该内容，直接创建文件: {filename}")
+
+    exists, _ = file_utils.save_blob_reference("../" + digest[3:], "evil.csv")
+    assert not exists
+    print("✓ 拒绝格式错误的哈希")
+
+    print()
+
+def test_delete_releases_blob(file_utils):
+    """
+    测试删除最后一个引用时删除blob
+    """
+    print("测试3: 删除文件释放blob")
+    print("-" * 50)
+
+    content = os.urandom(1000)
+    digest = hashlib.sha256(content).hexdigest()
+
+    _, first = file_utils.save_stream(BytesIO(content), "a.bin")
+    _, second = file_utils.save_stream(BytesIO(content), "b.bin")
+    blob_path = file_utils.blob_store.blob_path(digest)
+
+    file_utils.delete_file(first)
+    assert os.path.exists(blob_path)
+    print("✓ 仍有文件名引用时保留blob")
+
+    file_utils.delete_file(second)
+    assert not os.path.exists(blob_path)
+    print("✓ 最后一个引用删除后blob被删除")
+
+    print()
+
+def test_edited_in_place(file_utils):
+    """
+    测试文件在外部被就地修改后不再复用原来的blob
+    """
+    print("测试4: 就地修改文件")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    content = os.urandom(5000)
+    digest = hashlib.sha256(content).hexdigest()
+    _, first = file_utils.save_stream(BytesIO(content), "report.doc")
+    _, second = file_utils.save_stream(BytesIO(content), "copy.doc")
+
+    # 管理员直接打开文件修改，不替换文件
+    with open(os.path.join(upload_dir, first), "r+b") as f:
+        f.write(b"edited")
+    with open(os.path.join(upload_dir, second), "rb") as f:
+        linked = f.read() != content
+    print(f"✓ 文件名之间{'为硬链接' if linked else '互不影响'}")
+
+    exists, probed = file_utils.save_blob_reference(digest, "probe.doc")
+    if exists:
+        with open(os.path.join(upload_dir, probed), "rb") as f:
+            assert f.read() == content
+    else:
+        # 硬链接时blob随之被修改，已被丢弃
+        assert linked and not file_utils.blob_store.has_blob(digest)
+        assert file_utils.blob_store.get_digest(second) is None
+    print("✓ 秒传不会得到修改后的内容")
+
+    _, saved = file_utils.save_stream(BytesIO(content), "report.doc")
+    assert saved != first
+    with open(os.path.join(upload_dir, saved), "rb") as f:
+        assert f.read() == content
+    print(f"✓ 重新上传原内容保存为新文件: {saved}")
+
+    print()
+
+def test_batched_metadata_writes(file_utils):
+    """
+    测试引用表合并写入，关闭前立即写入
+    """
+    print("测试5: 合并写入引用表")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    for i in range(100):
+        file_utils.save_stream(BytesIO(b"%d" % (i % 10)), f"f{i}.txt")
+    writer = file_utils.blob_store.writers["refs"]
+    assert file_utils.close() and writer.snapshot_seq <= 5
+    reloaded = FileUtils(upload_dir)
+    assert len(reloaded.blob_store.refs) == 100
+    assert sorted(reloaded.blob_store.ref_counts.values()) == [10] * 10
+    assert len(reloaded.blob_store.stats) == 10
+    print(f"✓ 100次上传写入引用表{writer.snapshot_seq}次，重新加载后一致")
+    reloaded.close()
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试内容寻址存储...")
+    print("=" * 50)
+
+    temp_workspace.run_with_file_utils(test_duplicate_upload)
+    temp_workspace.run_with_file_utils(test_probe)
+    temp_workspace.run_with_file_utils(test_delete_releases_blob)
+    temp_workspace.run_with_file_utils(test_edited_in_place)
+    temp_workspace.run_with_file_utils(test_batched_metadata_writes)
+
+    print("=" * 50)
+    print("内容寻址存储测试完成!")
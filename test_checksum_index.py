@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试上传时增量计算的校验和以及校验和索引的失效和重新计算
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from utils.file_utils import FileUtils
+from utils.upload_session import UploadSessionManager
+
+def test_checksum_recorded_on_upload(file_utils):
+    """
+    测试上传完成后校验和已记录，列表中直接返回
+    """
+    print("测试1: 上传时记录校验和")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    content = os.urandom(30000)
+    digest = hashlib.sha256(content).hexdigest()
+
+    _, filename = file_utils.save_stream(BytesIO(content), "data.bin")
+    files = {f["filename"]: f for f in file_utils.get_file_list()}
+    assert files[filename]["sha256"] == digest
+    print(f"✓ 文件列表包含校验和: {digest[:16]}...")
+
+    # 写入索引后重新加载仍然有效
+    assert file_utils.close()
+    reloaded = FileUtils(upload_dir)
+    file_path = os.path.join(upload_dir, filename)
+    assert reloaded.checksums.lookup(filename, os.stat(file_path)) == digest
+    print("✓ 校验和持久化保存")
+    reloaded.close()
+
+    print()
+
+def test_chunked_upload_checksum(file_utils):
+    """
+    测试分块上传按顺序增量计算哈希
+    """
+    print("测试2: 分块上传增量计算哈希")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    manager = UploadSessionManager(file_utils)
+    content = os.urandom(10000)
+    upload_id = manager.create_session("video.mp4", len(content), chunk_size=1024)["upload_id"]
+
+    # 乱序到达的分块在前面的分块补齐后再计算
+    offsets = list(range(0, len(content), 1024))
+    for offset in offsets[1:] + offsets[:1]:
+        _, info = manager.write_chunk(upload_id, offset, BytesIO(content[offset:offset + 1024]))
+    assert info["completed"]
+
+    file_path = os.path.join(upload_dir, info["filename"])
+    assert file_utils.checksums.lookup(info["filename"], os.stat(file_path)) == hashlib.sha256(content).hexdigest()
+    print("✓ 分块上传完成时校验和正确")
+
+    print()
+
+def test_stale_checksum(file_utils):
+    """
+    测试文件在外部被修改后校验和失效并重新计算
+    """
+    print("测试3: 文件变化后重新计算")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    _, filename = file_utils.save_stream(BytesIO(b"version 1"), "notes.txt")
+    file_path = os.path.join(upload_dir, filename)
+
+    # 模拟管理员直接覆盖文件（先断开与blob的硬链接）
+    os.remove(file_path)
+    with open(file_path, "wb") as f:
+        f.write(b"version 2 is longer")
+    assert file_utils.checksums.lookup(filename, os.stat(file_path)) is None
+    print("✓ 文件大小或修改时间变化后校验和失效")
+
+    assert file_utils.get_checksum(filename) == hashlib.sha256(b"version 2 is longer").hexdigest()
+    print("✓ 需要时重新计算校验和")
+
+    print()
+
+def test_checksum_outside_file_list():
+    """
+    测试上传目录之外的路径和内部目录中的文件不计算校验和
+    """
+    print("测试4: 只回答文件列表中的文件")
+    print("-" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        upload_dir = os.path.join(tmp_dir, "uploads")
+        os.makedirs(upload_dir)
+        with open(os.path.join(tmp_dir, "secret.txt"), "wb") as f:
+            f.write(b"secret")
+        file_utils = FileUtils(upload_dir)
+        file_utils.save_stream(BytesIO(b"visible"), "visible.txt")
+        for filename in ("../secret.txt", "a/../../secret.txt", ".meta/checksums.json", ".blobs/refs.json",
+                         "missing.txt", ""):
+            assert file_utils.get_checksum(filename) is None, filename
+        assert set(file_utils.checksums.entries) == {"visible.txt"}
+        print("✓ 上级目录、内部目录和不存在的文件返回None，不写入索引")
+        file_utils.close()
+
+    from web import app
+    client = app.test_client()
+    for path in ("..%252f..%252fetc%252fpasswd", ".meta/checksums.json", ".blobs/refs.json"):
+        assert client.get(f"/api/checksum/{path}").status_code == 404, path
+    print("✓ API返回404")
+
+    print()
+
+def test_batched_index_writes(file_utils):
+    """
+    测试多次记录合并写入索引文件
+    """
+    print("测试5: 合并写入索引")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    writer = file_utils.checksums.writer
+    for i in range(200):
+        file_utils.save_stream(BytesIO(b"%d" % i), f"f{i}.txt")
+    # 第一次记录立即写入，之后每0.5秒最多写入一次
+    assert file_utils.close() and not writer.dirty and writer.snapshot_seq <= 5
+    reloaded = FileUtils(upload_dir)
+    assert len(reloaded.checksums.entries) == 200
+    print(f"✓ 200次记录写入{writer.snapshot_seq}次")
+    reloaded.close()
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试校验和索引...")
+    print("=" * 50)
+
+    temp_workspace.run_with_file_utils(test_checksum_recorded_on_upload)
+    temp_workspace.run_with_file_utils(test_chunked_upload_checksum)
+    temp_workspace.run_with_file_utils(test_stale_checksum)
+    test_checksum_outside_file_list()
+    temp_workspace.run_with_file_utils(test_batched_index_writes)
+
+    print("=" * 50)
+    print("校验和索引测试完成!")
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试分块上传、断点续传和并发乱序分块
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import temp_workspace
+from utils.file_utils import InsufficientSpaceError
+from utils.upload_session import UploadSessionManager, TooManySessionsError
+
+def test_chunked_upload(file_utils):
+    """
+    测试分块上传完整流程，最后一个分块到达后自动提交
+    """
+    print("测试1: 分块上传完整流程")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    manager = UploadSessionManager(file_utils)
+    content = os.urandom(10000)
+
+    session = manager.create_session("big.iso", len(content), chunk_size=4096)
+    upload_id = session["upload_id"]
+    assert os.path.getsize(manager._data_path(upload_id)) == len(content)
+    print(f"✓ 创建上传会话并预分配文件: {upload_id}")
+
+    for offset in range(0, len(content), 4096):
+        success, info = manager.write_chunk(upload_id, offset, BytesIO(content[offset:offset + 4096]))
+        assert success, info
+    assert info["completed"] and info["filename"] == "big.iso"
+    print("✓ 所有分块上传成功，文件自动提交")
+
+    with open(os.path.join(upload_dir, info["filename"]), "rb") as f:
+        assert f.read() == content
+    assert manager.get_session(upload_id) is None
+    print(f"✓ 文件内容一致: {info['filename']}")
+
+    print()
+
+def test_resume_upload(file_utils):
+    """
+    测试断点续传：中断后重新加载会话，只补传缺失的分块
+    """
+    print("测试2: 断点续传")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    manager = UploadSessionManager(file_utils)
+    content = os.urandom(10000)
+
+    upload_id = manager.create_session("video.mp4", len(content), chunk_size=2000)["upload_id"]
+    manager.write_chunk(upload_id, 0, BytesIO(content[:2000]))
+    manager.write_chunk(upload_id, 6000, BytesIO(content[6000:8000]))
+    # 连接中断导致分块不完整时不标记为已接收
+    success, message = manager.write_chunk(upload_id, 2000, BytesIO(content[2000:3000]))
+    assert not success
+    print(f"✓ 不完整的分块不被确认: {message}")
+
+    success, message = manager.complete_session(upload_id)
+    assert not success
+    print(f"✓ 数据不完整时拒绝完成: {message}")
+
+    # 模拟服务重启，从会话目录重新加载
+    manager = UploadSessionManager(file_utils)
+    session = manager.get_session(upload_id)
+    assert session["received"] == [[0, 2000], [6000, 8000]]
+    assert session["next_offset"] == 2000
+    print(f"✓ 重启后恢复会话，续传起点: {session['next_offset']}")
+
+    for offset in (8000, 2000, 4000):
+        success, session = manager.write_chunk(upload_id, offset, BytesIO(content[offset:offset + 2000]))
+        assert success
+    assert session["completed"]
+    with open(os.path.join(upload_dir, session["filename"]), "rb") as f:
+        assert f.read() == content
+    print("✓ 续传完成，文件内容一致")
+
+    print()
+
+def test_parallel_chunks(file_utils):
+    """
+    测试多个线程乱序并发上传同一文件的分块
+    """
+    print("测试3: 并发乱序上传分块")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    manager = UploadSessionManager(file_utils)
+    chunk_size = 1024
+    content = os.urandom(chunk_size * 64 + 100)
+    upload_id = manager.create_session("parallel.bin", len(content), chunk_size=chunk_size)["upload_id"]
+
+    offsets = list(range(0, len(content), chunk_size))
+    random.shuffle(offsets)
+    results = []
+
+    def upload(offset):
+        results.append(manager.write_chunk(upload_id, offset, BytesIO(content[offset:offset + chunk_size])))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(upload, offsets))
+
+    assert all(success for success, _ in results)
+    completed = [info for _, info in results if info["completed"]]
+    assert len(completed) == 1
+    with open(os.path.join(upload_dir, completed[0]["filename"]), "rb") as f:
+        assert f.read() == content
+    print(f"✓ {len(offsets)} 个分块并发上传完成，文件只提交一次")
+
+    print()
+
+class BlockingStream(BytesIO):
+    """
+    等到事件被设置后才返回数据的流，模拟传输较慢的分块
+    """
+
+    def __init__(self, data, event):
+        super().__init__(data)
+        self.event = event
+
+    def read(self, size=-1):
+        self.event.wait()
+        return super().read(size)
+
+    def readinto(self, buffer):
+        self.event.wait()
+        return super().readinto(buffer)
+
+def test_chunk_during_commit(file_utils):
+    """
+    测试提交时等待仍在写入的重复分块，提交后到达的分块被拒绝
+    """
+    print("测试4: 提交与并发分块")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    manager = UploadSessionManager(file_utils)
+    content = os.urandom(8)
+    upload_id = manager.create_session("race.bin", len(content), chunk_size=4)["upload_id"]
+    results = {}
+
+    def upload(name, offset, stream):
+        results[name] = manager.write_chunk(upload_id, offset, stream)
+
+    # 客户端超时后重发了第二个分块，第一次发送的请求仍在传输
+    release = threading.Event()
+    slow = threading.Thread(target=upload, args=("slow", 4, BlockingStream(content[4:], release)))
+    slow.start()
+    while not manager.writing.get(upload_id):
+        time.sleep(0.01)
+    assert manager.write_chunk(upload_id, 0, BytesIO(content[:4]))[0]
+    last = threading.Thread(target=upload, args=("last", 4, BytesIO(content[4:])))
+    last.start()
+    time.sleep(0.2)
+    assert last.is_alive() and os.path.exists(manager._data_path(upload_id))
+    print("✓ 提交前等待仍在写入的分块")
+
+    release.set()
+    slow.join()
+    last.join()
+    assert results["slow"] == (False, "上传会话不存在")
+    assert results["last"][0] and results["last"][1]["completed"]
+    file_path = os.path.join(upload_dir, results["last"][1]["filename"])
+    print("✓ 提交期间写完的分块被拒绝")
+
+    assert manager.write_chunk(upload_id, 0, BytesIO(b"evil")) == (False, "上传会话不存在")
+    assert manager.complete_session(upload_id) == (False, "上传会话不存在")
+    assert not manager.cancel_session(upload_id) and manager.get_session(upload_id) is None
+    with open(file_path, "rb") as f:
+        assert f.read() == content
+    print("✓ 提交后到达的分块、完成和取消请求不影响已保存的文件")
+
+    print()
+
+def test_invalid_chunk(file_utils):
+    """
+    测试越界分块和取消会话
+    """
+    print("测试5: 越界分块和取消会话")
+    print("-" * 50)
+
+    manager = UploadSessionManager(file_utils)
+    upload_id = manager.create_session("small.txt", 10, chunk_size=4)["upload_id"]
+
+    success, message = manager.write_chunk(upload_id, 5, BytesIO(b"0123"))
+    assert not success
+    print(f"✓ 拒绝未对齐的分块: {message}")
+
+    success, message = manager.write_chunk(upload_id, 8, BytesIO(b"0123"))
+    assert not success
+    print(f"✓ 拒绝越界分块: {message}")
+
+    assert manager.cancel_session(upload_id)
+    assert manager.get_session(upload_id) is None
+    assert not os.listdir(manager.session_dir)
+    print("✓ 取消会话后数据被清理")
+
+    print()
+
+def test_idle_sessions(file_utils):
+    """
+    测试闲置会话被清理，每个客户端的会话数有上限
+    """
+    print("测试6: 闲置会话和会话数上限")
+    print("-" * 50)
+
+    manager = UploadSessionManager(file_utils, session_ttl=60, max_sessions_per_client=2)
+    idle = manager.create_session("idle.bin", 100, chunk_size=50, client="10.0.0.1")["upload_id"]
+    active = manager.create_session("active.bin", 100, chunk_size=50, client="10.0.0.1")["upload_id"]
+    try:
+        manager.create_session("third.bin", 100, client="10.0.0.1")
+        assert False
+    except TooManySessionsError:
+        pass
+    manager.create_session("other.bin", 100, client="10.0.0.2")
+    print("✓ 同一客户端的会话数达到上限时拒绝创建")
+
+    manager.sessions[idle]["last_active"] -= 120
+    manager.sessions[active]["last_active"] -= 120
+    assert manager.write_chunk(active, 0, BytesIO(b"a" * 50))[0]
+    assert manager.expire_sessions() == 1
+    assert manager.get_session(idle) is None and manager.get_session(active) is not None
+    assert not os.path.exists(manager._data_path(idle)) and not os.path.exists(manager._meta_path(idle))
+    print("✓ 闲置会话被清理，仍在上传的会话保留")
+
+    manager.create_session("third.bin", 100, client="10.0.0.1")
+    print("✓ 清理后可以创建新会话")
+
+    # 服务停止期间过期的会话在重启时删除
+    manager.sessions[active]["last_active"] -= 120
+    manager._save_session(manager.sessions[active])
+    manager = UploadSessionManager(file_utils, session_ttl=60)
+    assert manager.get_session(active) is None and not os.path.exists(manager._data_path(active))
+    assert len(manager.sessions) == 2
+    print("✓ 重启时删除已过期的会话")
+
+    print()
+
+def test_concurrent_session_limit(file_utils):
+    """
+    测试同一客户端并发创建会话时不超出上限，创建失败时释放占用的名额
+    """
+    print("测试7: 并发创建会话")
+    print("-" * 50)
+
+    manager = UploadSessionManager(file_utils, max_sessions_per_client=2)
+    reserve_space = file_utils.reserve_space
+
+    def slow_reserve(key, size):
+        # 拉长检查上限和加入会话之间的时间，所有请求都在此期间到达
+        time.sleep(0.2)
+        reserve_space(key, size)
+
+    def create(i):
+        try:
+            return manager.create_session(f"{i}.bin", 100, client="10.0.0.1")["upload_id"]
+        except TooManySessionsError:
+            return None
+
+    file_utils.reserve_space = slow_reserve
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        created = [upload_id for upload_id in executor.map(create, range(8)) if upload_id]
+    assert len(created) == 2 and len(manager.sessions) == 2
+    print("✓ 8个并发请求只创建了2个会话")
+
+    for upload_id in created:
+        manager.cancel_session(upload_id)
+
+    def full_disk(key, size):
+        raise InsufficientSpaceError("磁盘空间不足")
+
+    file_utils.reserve_space = full_disk
+    for _ in range(3):
+        try:
+            manager.create_session("full.bin", 100, client="10.0.0.1")
+            assert False
+        except InsufficientSpaceError:
+            pass
+    file_utils.reserve_space = reserve_space
+    manager.create_session("a.bin", 100, client="10.0.0.1")
+    manager.create_session("b.bin", 100, client="10.0.0.1")
+    assert manager.creating == {}
+    print("✓ 预留空间失败时释放占用的名额")
+
+    manager.max_sessions_per_client = None
+    original_save = manager._save_session
+
+    def failing_save(session):
+        raise OSError("写入元数据失败")
+
+    manager._save_session = failing_save
+    try:
+        manager.create_session("broken.bin", 100, client="10.0.0.1")
+        assert False
+    except OSError:
+        pass
+    manager._save_session = original_save
+    assert len(manager.sessions) == 2 and file_utils.reserved_bytes == 200
+    assert len(os.listdir(manager.session_dir)) == 4
+    print("✓ 创建文件失败时释放预留空间并删除数据文件")
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试分块上传功能...")
+    print("=" * 50)
+
+    temp_workspace.run_with_file_utils(test_chunked_upload)
+    temp_workspace.run_with_file_utils(test_resume_upload)
+    temp_workspace.run_with_file_utils(test_parallel_chunks)
+    temp_workspace.run_with_file_utils(test_chunk_during_commit)
+    temp_workspace.run_with_file_utils(test_invalid_chunk)
+    temp_workspace.run_with_file_utils(test_idle_sessions)
+    temp_workspace.run_with_file_utils(test_concurrent_session_limit)
+
+    print("=" * 50)
+    print("分块上传功能测试完成!")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试存储压缩：文本类文件压缩存储，列表显示原始大小，下载时按客户端支持的编码发送
+"""
+
+import gzip
+import hashlib
+import os
+import sys
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from utils.upload_session import UploadSessionManager
+
+CSV_CONTENT = b"".join(f"{i},user_{i},{i * 7 % 13}\n".encode() for i in range(20000))
+
+def test_compress_on_stream(file_utils):
+    """
+    测试流式上传时边接收边压缩
+    """
+    print("测试1: 流式上传时压缩")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    file_utils.compression = "gzip"
+
+    success, filename = file_utils.save_stream(BytesIO(CSV_CONTENT), "data.csv")
+    assert success
+    stored_size = os.path.getsize(os.path.join(upload_dir, filename))
+    assert stored_size < len(CSV_CONTENT) / 3
+    print(f"✓ 压缩存储: {len(CSV_CONTENT)} -> {stored_size} 字节")
+
+    info = file_utils.get_file_list()[0]
+    assert info["size"] == len(CSV_CONTENT)
+    assert info["sha256"] == hashlib.sha256(CSV_CONTENT).hexdigest()
+    print("✓ 文件列表返回原始大小和原始内容的校验和")
+
+    with file_utils.open_file(filename) as f:
+        assert f.read() == CSV_CONTENT
+    print("✓ 读取时自动解压")
+
+    _, filename = file_utils.save_stream(BytesIO(b"\x89PNG" + os.urandom(5000)), "image.png")
+    assert file_utils.get_file_encoding(filename) == (None, 5004)
+    print("✓ 已压缩的文件类型不再压缩")
+
+    print()
+
+def test_compress_on_commit(file_utils):
+    """
+    测试无法边接收边压缩的临时文件在提交时压缩
+    """
+    print("测试2: 提交时压缩")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    file_utils.compression = "gzip"
+    part_path = os.path.join(upload_dir, "upload.part")
+    with open(part_path, "wb") as f:
+        f.write(CSV_CONTENT)
+
+    success, filename = file_utils.commit_file(part_path, "chunked.log")
+    assert success and not os.path.exists(part_path)
+    assert file_utils.get_file_encoding(filename) == ("gzip", len(CSV_CONTENT))
+    with open(os.path.join(upload_dir, filename), "rb") as f:
+        assert gzip.decompress(f.read()) == CSV_CONTENT
+    print("✓ 未压缩的临时文件在提交时压缩")
+
+    # 相同内容共享同一个压缩的blob，最后一个引用删除后压缩信息一并清理
+    _, copy = file_utils.save_stream(BytesIO(CSV_CONTENT), "copy.log")
+    digest = hashlib.sha256(CSV_CONTENT).hexdigest()
+    assert file_utils.get_file_encoding(copy) == ("gzip", len(CSV_CONTENT))
+    file_utils.delete_file(filename)
+    file_utils.delete_file(copy)
+    assert file_utils.blob_store.get_encoding(digest) is None
+    print("✓ 删除文件后清理压缩信息")
+
+    print()
+
+def no_recompress(temp_path):
+    raise AssertionError("上传的数据被再写了一遍")
+
+def test_compress_while_receiving(file_utils):
+    """
+    测试分块上传和multipart上传边接收边压缩，提交时不再重写整个文件
+    """
+    print("测试3: 分块和multipart上传时压缩")
+    print("-" * 50)
+
+    file_utils.compression = "gzip"
+    file_utils._compress_temp_file = no_recompress
+    manager = UploadSessionManager(file_utils)
+    chunk_size = 64 * 1024
+    upload_id = manager.create_session("chunked.csv", len(CSV_CONTENT), chunk_size=chunk_size)["upload_id"]
+    offsets = list(range(0, len(CSV_CONTENT), chunk_size))
+    # 乱序到达的分块等前面的分块收到后再按顺序压缩
+    for offset in offsets[1:] + offsets[:1]:
+        success, info = manager.write_chunk(upload_id, offset, BytesIO(CSV_CONTENT[offset:offset + chunk_size]))
+        assert success
+    assert info["completed"]
+    assert file_utils.get_file_encoding(info["filename"]) == ("gzip", len(CSV_CONTENT))
+    with file_utils.open_file(info["filename"]) as f:
+        assert f.read() == CSV_CONTENT
+    assert os.listdir(file_utils.temp_dir) == [] and os.listdir(manager.session_dir) == []
+    print("✓ 分块按顺序哈希时同时压缩")
+
+    upload_id = manager.create_session("cancelled.csv", len(CSV_CONTENT), chunk_size=chunk_size)["upload_id"]
+    assert manager.write_chunk(upload_id, 0, BytesIO(CSV_CONTENT[:chunk_size]))[0]
+    assert len(os.listdir(file_utils.temp_dir)) == 1
+    assert manager.cancel_session(upload_id) and os.listdir(file_utils.temp_dir) == []
+    print("✓ 取消会话时删除压缩的临时文件")
+
+    from web import app
+    from utils.file_utils import file_utils
+
+    client = app.test_client()
+    compression = file_utils.compression
+    file_utils.compression = "gzip"
+    file_utils._compress_temp_file = no_recompress
+    try:
+        response = client.post("/upload", data={"file": (BytesIO(CSV_CONTENT), "multipart.csv")},
+                               content_type="multipart/form-data")
+        assert response.status_code == 200
+        filename = response.get_json()["filename"]
+        assert file_utils.get_file_encoding(filename) == ("gzip", len(CSV_CONTENT))
+        with file_utils.open_file(filename) as f:
+            assert f.read() == CSV_CONTENT
+        print("✓ multipart上传解析请求时压缩")
+    finally:
+        file_utils.compression = compression
+        del file_utils._compress_temp_file
+        file_utils.delete_file(filename)
+
+    print()
+
+def test_download_encoding():
+    """
+    测试下载时按Accept-Encoding发送压缩数据或解压后的数据
+    """
+    print("测试4: 下载时协商编码")
+    print("-" * 50)
+
+    from web import app
+    from utils.file_utils import file_utils
+
+    client = app.test_client()
+    compression = file_utils.compression
+    file_utils.compression = "gzip"
+    try:
+        _, filename = file_utils.save_stream(BytesIO(CSV_CONTENT), "compression_test.csv")
+
+        response = client.get(f"/download/{filename}", headers={"Accept-Encoding": "gzip, deflate"})
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(response.data) == CSV_CONTENT
+        print(f"✓ 支持gzip的客户端直接收到压缩数据: {len(response.data)} 字节")
+
+        response = client.get(f"/download/{filename}", headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["Content-Length"] == str(len(CSV_CONTENT))
+        assert response.data == CSV_CONTENT
+        print("✓ 不支持gzip的客户端收到解压后的数据")
+        response.close()
+    finally:
+        file_utils.compression = compression
+        file_utils.delete_file(filename)
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试存储压缩...")
+    print("=" * 50)
+
+    temp_workspace.run_with_file_utils(test_compress_on_stream)
+    temp_workspace.run_with_file_utils(test_compress_on_commit)
+    temp_workspace.run_with_file_utils(test_compress_while_receiving)
+    test_download_encoding()
+
+    print("=" * 50)
+    print("存储压缩测试完成!")
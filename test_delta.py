@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试增量上传：只传输新版本中变化的部分，服务端用已有文件重建新版本
+"""
+
+import os
+import random
+import sys
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from utils.delta import compute_signature, iter_delta, apply_delta
+
+BLOCK_SIZE = 4096
+
+def make_versions():
+    """
+    生成旧版本和修改后的新版本：中间改写一段、插入一段、删除一段并在末尾追加
+    """
+    rng = random.Random(1)
+    old = bytes(rng.getrandbits(8) for _ in range(300000))
+    new = (old[:50000] + b"changed" * 100 + old[50700:120000] + b"inserted" * 50
+           + old[120000:200000] + old[210000:] + b"appended")
+    return old, new
+
+def test_delta_roundtrip():
+    """
+    测试增量数据的生成和重建
+    """
+    print("测试1: 生成和应用增量数据")
+    print("-" * 50)
+
+    old, new = make_versions()
+    signatures = compute_signature(BytesIO(old), BLOCK_SIZE)
+    assert len(signatures) == len(old) // BLOCK_SIZE
+    delta = b"".join(iter_delta(signatures, BLOCK_SIZE, BytesIO(new)))
+    assert len(delta) < len(new) / 10
+    print(f"✓ 新版本 {len(new)} 字节，增量数据 {len(delta)} 字节")
+
+    rebuilt = BytesIO()
+    assert apply_delta(BytesIO(old), BytesIO(delta), rebuilt, BLOCK_SIZE) == len(new)
+    assert rebuilt.getvalue() == new
+    print("✓ 服务端重建的文件与新版本一致")
+
+    # 大段修改之后的数据错位，仍能找到之后未修改的块
+    rng = random.Random(2)
+    changed = bytes(rng.getrandbits(8) for _ in range(150333))
+    heavily_edited = old[:20000] + changed + old[170000:]
+    delta = b"".join(iter_delta(signatures, BLOCK_SIZE, BytesIO(heavily_edited)))
+    assert len(delta) < 2 * len(changed) + 2 * BLOCK_SIZE
+    rebuilt = BytesIO()
+    apply_delta(BytesIO(old), BytesIO(delta), rebuilt, BLOCK_SIZE)
+    assert rebuilt.getvalue() == heavily_edited
+    print(f"✓ 大段修改后错位的块仍被复用，增量数据 {len(delta)} 字节")
+
+    delta = b"".join(iter_delta([], BLOCK_SIZE, BytesIO(new)))
+    rebuilt = BytesIO()
+    apply_delta(BytesIO(b""), BytesIO(delta), rebuilt, BLOCK_SIZE)
+    assert rebuilt.getvalue() == new
+    print("✓ 没有可复用的块时全部作为字面数据发送")
+
+    try:
+        apply_delta(BytesIO(old), BytesIO(b"C" + (1000).to_bytes(8, "big") + (1).to_bytes(8, "big")),
+                    BytesIO(), BLOCK_SIZE)
+        assert False, "引用不存在的块时应抛出异常"
+    except ValueError:
+        print("✓ 拒绝引用不存在的块的增量数据")
+
+    print()
+
+def test_save_delta(file_utils):
+    """
+    测试服务端根据增量数据保存新版本
+    """
+    print("测试2: 保存增量上传的新版本")
+    print("-" * 50)
+
+    old, new = make_versions()
+    upload_dir = file_utils.upload_dir
+    file_utils.save_stream(BytesIO(old), "disk.img")
+
+    signature = file_utils.get_signature("disk.img", BLOCK_SIZE)
+    assert signature["size"] == len(old)
+    delta = b"".join(iter_delta(signature["signatures"], BLOCK_SIZE, BytesIO(new)))
+    success, filename = file_utils.save_delta("disk.img", BytesIO(delta), "disk.img", BLOCK_SIZE)
+    assert success and filename == "disk_1.img"
+    with open(os.path.join(upload_dir, filename), "rb") as f:
+        assert f.read() == new
+    assert os.listdir(file_utils.temp_dir) == []
+    print(f"✓ 新版本保存为: {filename}")
+
+    print()
+
+def test_delta_routes():
+    """
+    测试签名和增量上传接口
+    """
+    print("测试3: 签名和增量上传接口")
+    print("-" * 50)
+
+    from web import app
+    from utils.file_utils import file_utils
+
+    client = app.test_client()
+    old, new = make_versions()
+    _, base = file_utils.save_stream(BytesIO(old), "delta_test.bin")
+    filename = None
+    try:
+        signature = client.get(f"/api/signature/{base}").get_json()
+        assert signature["success"] and signature["size"] == len(old)
+        print(f"✓ 获取签名: {len(signature['signatures'])} 块，每块 {signature['block_size']} 字节")
+
+        delta = b"".join(iter_delta(signature["signatures"], signature["block_size"], BytesIO(new)))
+        response = client.post(f"/upload/delta?base={base}&filename=delta_test.bin"
+                               f"&block_size={signature['block_size']}&size={len(new)}", data=delta)
+        result = response.get_json()
+        assert result["success"], result
+        filename = result["filename"]
+        with open(os.path.join(file_utils.upload_dir, filename), "rb") as f:
+            assert f.read() == new
+        print(f"✓ 增量上传成功: {filename}")
+
+        response = client.post("/upload/delta?base=missing.bin&block_size=4096", data=delta)
+        assert response.status_code == 404
+        print("✓ 基准文件不存在时返回404")
+
+        response = client.post(f"/upload/delta?base={base}&block_size={signature['block_size']}&size=-1000000",
+                               data=delta)
+        assert response.status_code == 400 and file_utils.reserved_bytes == 0
+        print("✓ 声明的大小为负数时返回400")
+    finally:
+        file_utils.delete_file(base)
+        if filename:
+            file_utils.delete_file(filename)
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试增量上传...")
+    print("=" * 50)
+
+    test_delta_roundtrip()
+    temp_workspace.run_with_file_utils(test_save_delta)
+    test_delta_routes()
+
+    print("=" * 50)
+    print("增量上传测试完成!")
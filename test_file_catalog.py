@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件元数据目录（上传者、下载次数、标签）
+"""
+
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from utils.file_catalog import FileCatalog
+from utils.file_utils import FileUtils
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_reconcile():
+    """
+    测试启动时与上传目录核对，以及数据库的WAL模式
+    """
+    print("测试1: 与上传目录核对")
+    print("-" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        catalog = FileCatalog(os.path.join(tmp_dir, "standalone", "catalog.db"))
+        assert catalog.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        print("✓ 使用WAL模式")
+
+        rows = [("a.txt", "", "a.txt", 1, 100, None), ("docs/b.txt", "docs", "b.txt", 2, 200, None)]
+        assert catalog.reconcile(rows) == (2, 0)
+        catalog.record_upload("a.txt", "user-1", "a.txt")
+        assert catalog.reconcile(rows) == (0, 0)
+        assert catalog.reconcile([("a.txt", "", "a.txt", 5, 300, "ab" * 32)]) == (1, 1)
+        metadata = catalog.get_metadata(["a.txt", "docs/b.txt"])
+        assert list(metadata) == ["a.txt"] and metadata["a.txt"]["uploader"] == "user-1"
+        print("✓ 只更新有变化的文件，删除已不存在的，保留上传者")
+        catalog.close()
+
+        upload_dir = os.path.join(tmp_dir, "uploads")
+        os.makedirs(upload_dir)
+        with open(os.path.join(upload_dir, "external.txt"), "wb") as f:
+            f.write(b"external")
+        file_utils = FileUtils(upload_dir)
+        files, _, total = file_utils.query_files()
+        assert total == 1 and files[0]["filename"] == "external.txt"
+        assert files[0]["uploader"] is None and files[0]["download_count"] == 0 and files[0]["tags"] == []
+        assert os.path.exists(os.path.join(upload_dir, ".meta", "catalog.db"))
+        os.remove(os.path.join(upload_dir, "external.txt"))
+        assert file_utils.sync_files({"external.txt"})
+        assert file_utils.catalog.get_metadata(["external.txt"]) == {}
+        print("✓ 外部复制和删除的文件同步到目录")
+        file_utils.close()
+
+    print()
+
+def test_metadata(file_utils):
+    """
+    测试上传者、下载次数和标签的记录与查询
+    """
+    print("测试2: 元数据")
+    print("-" * 50)
+
+    assert file_utils.create_folder("docs")
+    _, first = file_utils.save_stream(BytesIO(b"one"), "report.txt", uploader="alice")
+    _, second = file_utils.save_stream(BytesIO(b"two"), "report.txt", uploader="bob")
+    _, third = file_utils.save_file(BytesIO(b"three"), "docs/notes.txt", uploader="alice")
+    assert second == "report_1.txt"
+    info = file_utils.query_files(uploader="bob")[0][0]
+    assert info["filename"] == second and info["original_name"] == "report.txt"
+    assert info["uploaded_at"] is not None
+    print("✓ 记录上传者和原始文件名")
+
+    file_utils.record_download(first)
+    file_utils.record_download(first)
+    assert file_utils.query_files(uploader="alice")[0][0]["download_count"] == 2
+    print("✓ 记录下载次数")
+
+    info = file_utils.set_file_tags(first, [" work ", "urgent", "work", ""])
+    assert info["tags"] == ["urgent", "work"]
+    file_utils.set_file_tags(second, ["work"])
+    assert file_utils.set_file_tags("missing.txt", ["x"]) is None
+    for invalid in (["x" * 100], [str(i) for i in range(100)]):
+        try:
+            file_utils.set_file_tags(first, invalid)
+            assert False
+        except ValueError:
+            pass
+    print("✓ 设置标签，去重并检查长度和数量")
+
+    files, cursor, total = file_utils.query_files(tag="work", sort="name", limit=1)
+    assert [f["filename"] for f in files] == [first] and total == 2
+    files, cursor, _ = file_utils.query_files(tag="work", sort="name", limit=1, cursor=cursor)
+    assert [f["filename"] for f in files] == [second] and cursor is None
+    assert file_utils.query_files(tag="work", sort="name", descending=True)[0][0]["filename"] == second
+    assert file_utils.query_files(uploader="alice")[2] == 1
+    assert file_utils.query_files("docs", uploader="alice")[0][0]["filename"] == third
+    assert file_utils.query_files(uploader="carol")[2] == 0
+    print("✓ 按标签和上传者分页查询，排序和游标与普通查询一致")
+
+    assert wait_for(lambda: all(f["sha256"] for f in file_utils.get_file_list()))
+    digest = file_utils.get_checksum(first)
+    assert [f["filename"] for f in file_utils.query_files(sha256=digest)[0]] == [first]
+    print("✓ 按校验和查询")
+
+    # 重新上传同名文件时覆盖原来的元数据
+    file_utils.delete_file(first)
+    assert file_utils.catalog.get_metadata([first]) == {}
+    _, again = file_utils.save_stream(BytesIO(b"again"), "report.txt", uploader="carol")
+    assert again == first
+    info = file_utils.query_files(uploader="carol")[0][0]
+    assert info["download_count"] == 0 and info["tags"] == []
+    print("✓ 删除文件后元数据随之删除")
+
+    try:
+        file_utils.query_files("missing", tag="work")
+        assert False
+    except FileNotFoundError:
+        pass
+    try:
+        file_utils.query_files(tag="work", sort="color")
+        assert False
+    except ValueError:
+        pass
+    print("✓ 无效的参数和文件夹")
+
+    print()
+
+def test_catalog_api():
+    """
+    测试标签API和文件列表的元数据筛选
+    """
+    print("测试3: 元数据API")
+    print("-" * 50)
+
+    from web import app
+    from utils.file_utils import file_utils
+
+    client = app.test_client()
+    response = client.put("/upload/stream?filename=catalog_api_test.txt", data=b"catalog")
+    filename = response.get_json()["filename"]
+    try:
+        response = client.put(f"/api/tags/{filename}", json={"tags": ["catalog-api"]})
+        assert response.status_code == 200 and response.get_json()["file"]["tags"] == ["catalog-api"]
+        assert client.put(f"/api/tags/{filename}", json={"tags": "x"}).status_code == 400
+        assert client.put(f"/api/tags/{filename}", json={"tags": ["x" * 100]}).status_code == 400
+        assert client.put("/api/tags/missing_file.txt", json={"tags": []}).status_code == 404
+        print("✓ 设置标签，无效参数返回400，文件不存在返回404")
+
+        response = client.get(f"/download/{filename}")
+        assert response.status_code == 200
+        etag = response.headers["ETag"].strip('"')
+        client.get(f"/download/{filename}", headers={"Range": "bytes=3-"})
+        data = client.get("/api/files?tag=catalog-api").get_json()
+        assert [f["filename"] for f in data["files"]] == [filename] and data["total"] == 1
+        assert data["files"][0]["download_count"] == 1
+        print("✓ 按标签筛选文件列表，续传请求不重复计数")
+
+        assert client.head(f"/download/{filename}").status_code == 200
+        assert client.get(f"/download/{filename}", headers={"If-None-Match": f'"{etag}"'}).status_code == 304
+        assert client.get(f"/download/{filename}", headers={"Range": "bytes=100-"}).status_code == 416
+        assert file_utils.catalog.get_metadata([filename])[filename]["download_count"] == 1
+        print("✓ HEAD、304和416不计数")
+
+        response = client.get(f"/download/{filename}", headers={"Range": "bytes=3-", "If-Range": '"stale"'})
+        assert response.status_code == 200
+        assert client.get(f"/download/{filename}", headers={"Range": "bytes=0-1,4-5"}).status_code == 206
+        assert file_utils.catalog.get_metadata([filename])[filename]["download_count"] == 3
+        print("✓ If-Range不匹配时发送的整个文件和从开头开始的分段下载计数")
+    finally:
+        file_utils.delete_file(filename)
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试文件元数据目录...")
+    print("=" * 60)
+    test_reconcile()
+    temp_workspace.run_with_file_utils(test_metadata)
+    test_catalog_api()
+    print("所有测试通过!")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试内存中的文件列表索引
+"""
+
+import hashlib
+import os
+import sys
+from datetime import datetime
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+
+def test_incremental_updates(file_utils):
+    """
+    测试保存和删除文件时增量更新列表
+    """
+    print("测试1: 增量更新")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    # 启动前已存在的文件在首次获取列表时读取
+    existing = os.path.join(upload_dir, "old.txt")
+    with open(existing, "wb") as f:
+        f.write(b"old")
+    os.utime(existing, (1000000000, 1000000000))
+    assert [f["filename"] for f in file_utils.get_file_list()] == ["old.txt"]
+    print("✓ 首次获取时扫描目录")
+
+    _, first = file_utils.save_stream(BytesIO(b"first"), "a.txt")
+    _, second = file_utils.save_stream(BytesIO(b"second"), "b.txt")
+    files = file_utils.get_file_list()
+    assert [f["filename"] for f in files] == [second, first, "old.txt"]
+    assert files[0]["sha256"] == hashlib.sha256(b"second").hexdigest()
+    assert files[0]["size"] == len(b"second")
+    print("✓ 保存文件后按真实修改时间倒序插入")
+
+    assert file_utils.get_file_list() is files
+    print("✓ 列表未变化时直接返回")
+
+    # 同一秒内修改的文件按纳秒级修改时间排序
+    first_path = os.path.join(upload_dir, first)
+    second_stats = os.stat(os.path.join(upload_dir, second))
+    os.utime(first_path, ns=(second_stats.st_mtime_ns + 1, second_stats.st_mtime_ns + 1))
+    file_utils.file_index.update(first)
+    assert [f["filename"] for f in file_utils.get_file_list()] == [first, second, "old.txt"]
+    assert [f["filename"] for f in files] == [second, first, "old.txt"]
+    print("✓ 文件修改后重新排序，之前返回的列表不受影响")
+
+    file_utils.delete_file(second)
+    assert [f["filename"] for f in file_utils.get_file_list()] == [first, "old.txt"]
+    print("✓ 删除文件后从列表移除")
+
+    os.remove(first_path)
+    file_utils.file_index.update(first)
+    assert [f["filename"] for f in file_utils.get_file_list()] == ["old.txt"]
+    print("✓ 更新已不存在的文件时从列表移除")
+
+    print()
+
+def test_query(file_utils):
+    """
+    测试分页、排序和筛选
+    """
+    print("测试2: 分页查询")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    base = 1700000000
+    for i in range(25):
+        filename = f"{'img' if i % 2 else 'doc'}_{i:02d}.{'jpg' if i % 2 else 'txt'}"
+        path = os.path.join(upload_dir, filename)
+        with open(path, "wb") as f:
+            f.write(b"x" * (i * 10))
+        os.utime(path, (base + i * 3600, base + i * 3600))
+
+    # 逐页读取，拼起来与完整列表一致
+    names, cursor, pages = [], None, 0
+    while True:
+        files, cursor, total = file_utils.query_files(limit=10, cursor=cursor)
+        names += [f["filename"] for f in files]
+        pages += 1
+        if cursor is None:
+            break
+    assert total == 25 and pages == 3
+    assert names == [f["filename"] for f in file_utils.get_file_list()]
+    print("✓ 按游标逐页读取完整列表")
+
+    files, _, _ = file_utils.query_files(sort="name", limit=3)
+    assert [f["filename"] for f in files] == ["doc_00.txt", "doc_02.txt", "doc_04.txt"]
+    files, _, _ = file_utils.query_files(sort="size", limit=2)
+    assert [f["size"] for f in files] == [240, 230]
+    files, _, _ = file_utils.query_files(sort="mtime", descending=False, limit=1)
+    assert files[0]["filename"] == "doc_00.txt"
+    print("✓ 按名称、大小、修改时间排序")
+
+    files, cursor, _ = file_utils.query_files(extensions={"jpg"}, limit=100)
+    assert len(files) == 12 and cursor is None
+    assert all(f["filename"].endswith(".jpg") for f in files)
+    files, _, _ = file_utils.query_files(sort="size", descending=False, min_size=50, max_size=100)
+    assert [f["size"] for f in files] == [50, 60, 70, 80, 90, 100]
+    since = (base + 20 * 3600) * 10**9
+    files, _, _ = file_utils.query_files(since=since, until=since + 3600 * 10**9)
+    assert [f["filename"] for f in files] == ["img_21.jpg", "doc_20.txt"]
+    files, _, _ = file_utils.query_files(sort="name", prefix="IMG_1")
+    assert [f["filename"] for f in files] == ["img_11.jpg", "img_13.jpg", "img_15.jpg", "img_17.jpg",
+                                              "img_19.jpg"]
+    print("✓ 按扩展名、大小范围、时间范围、文件名前缀筛选")
+
+    # 翻页期间文件有增删，游标仍然有效
+    files, cursor, _ = file_utils.query_files(sort="name", limit=5)
+    file_utils.delete_file("doc_00.txt")
+    file_utils.delete_file("doc_10.txt")
+    files, _, _ = file_utils.query_files(sort="name", limit=2, cursor=cursor)
+    assert [f["filename"] for f in files] == ["doc_12.txt", "doc_14.txt"]
+    print("✓ 翻页期间文件变化不影响游标")
+
+    for invalid in ({"sort": "owner"}, {"limit": 0}, {"cursor": "bogus"},
+                    {"sort": "size", "cursor": cursor}):
+        try:
+            file_utils.query_files(**invalid)
+            assert False, invalid
+        except ValueError:
+            pass
+    print("✓ 无效的参数和游标被拒绝")
+
+    print()
+
+def test_files_api():
+    """
+    测试文件列表API的查询参数
+    """
+    print("测试3: 文件列表API")
+    print("-" * 50)
+
+    from web import app
+    from utils.file_utils import file_utils
+
+    client = app.test_client()
+    _, first = file_utils.save_stream(BytesIO(b"api first"), "api_query.txt")
+    _, second = file_utils.save_stream(BytesIO(b"api second"), "api_query.txt")
+    try:
+        data = client.get("/api/files?limit=1&prefix=api_query&ext=.TXT").get_json()
+        assert [f["filename"] for f in data["files"]] == [second]
+        assert data["next_cursor"] and data["total"] >= 2
+        data = client.get(f"/api/files?limit=1&prefix=api_query&ext=txt&cursor={data['next_cursor']}").get_json()
+        assert [f["filename"] for f in data["files"]] == [first]
+        print("✓ 按游标获取下一页")
+
+        today = datetime.now().strftime("%Y-%m-%d")
+        data = client.get(f"/api/files?prefix=api_query&since={today}&until={today}&max_size=100").get_json()
+        assert len(data["files"]) == 2
+        data = client.get("/api/files?prefix=api_query&until=2000-01-01").get_json()
+        assert data["files"] == []
+        print("✓ 按日期和大小筛选")
+
+        for query in ("sort=owner", "order=up", "limit=abc", "limit=5000", "since=yesterday", "cursor=bogus"):
+            response = client.get(f"/api/files?{query}")
+            assert response.status_code == 400, query
+            assert response.get_json()["success"] is False
+        print("✓ 无效参数返回400")
+    finally:
+        file_utils.delete_file(first)
+        file_utils.delete_file(second)
+
+    print()
+
+def test_checksum_on_request(file_utils):
+    """
+    测试列表不计算外部添加的文件的校验和，请求时算出后同步到列表
+    """
+    print("测试4: 请求时计算校验和")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    assert file_utils.get_file_list() == []
+    with open(os.path.join(upload_dir, "copied.bin"), "wb") as f:
+        f.write(b"copied in")
+    info = file_utils.file_index.update("copied.bin")
+    assert info["sha256"] is None
+    assert file_utils.get_file_list()[0]["sha256"] is None and file_utils.checksums.entries == {}
+    digest = hashlib.sha256(b"copied in").hexdigest()
+    assert file_utils.get_checksum("copied.bin") == digest
+    assert file_utils.get_file_list()[0]["sha256"] == digest
+    print("✓ 列表中不计算，请求校验和后列表随之更新")
+
+    file_utils.clear_upload_dir()
+    assert file_utils.get_file_list() == []
+    print("✓ 清空上传目录后列表为空")
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试文件列表索引...")
+    print("=" * 60)
+    temp_workspace.run_with_file_utils(test_incremental_updates)
+    temp_workspace.run_with_file_utils(test_query)
+    test_files_api()
+    temp_workspace.run_with_file_utils(test_checksum_on_request)
+    print("所有测试通过!")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件列表的增量推送
+"""
+
+import os
+import sys
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from utils import file_index as file_index_module
+
+def test_changes_since(file_utils):
+    """
+    测试按版本计算增量变化
+    """
+    print("测试1: 计算增量变化")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    index = file_utils.file_index
+    _, base = index.versioned_list()
+    _, kept = file_utils.save_stream(BytesIO(b"kept"), "kept.txt")
+    _, gone = file_utils.save_stream(BytesIO(b"gone"), "gone.txt")
+    _, version = index.versioned_list()
+
+    delta = index.changes_since(base)
+    assert delta["base"] == base and delta["version"] == version
+    assert sorted(f["filename"] for f in delta["added"]) == [gone, kept]
+    assert delta["changed"] == [] and delta["removed"] == []
+    print("✓ 新增的文件")
+
+    with open(os.path.join(upload_dir, kept), "ab") as f:
+        f.write(b" and changed")
+    index.update(kept)
+    file_utils.delete_file(gone)
+    delta = index.changes_since(version)
+    assert [f["filename"] for f in delta["changed"]] == [kept]
+    assert delta["changed"][0]["size"] == len(b"kept and changed")
+    assert delta["removed"] == [gone] and delta["added"] == []
+    print("✓ 修改和删除的文件")
+
+    # 从更早的版本算起，同一文件的多次变化合并为最终状态
+    delta = index.changes_since(base)
+    assert [f["filename"] for f in delta["added"]] == [kept]
+    assert delta["changed"] == [] and delta["removed"] == []
+    print("✓ 多次变化合并，新增后又删除的文件不出现")
+
+    _, version = index.versioned_list()
+    index.update(kept)
+    assert index.versioned_list()[1] == version
+    assert index.changes_since(version)["changed"] == []
+    print("✓ 文件未变化时版本号不变")
+
+    index.reset()
+    assert index.changes_since(version) is None
+    assert index.changes_since(index.version)["added"] == []
+    print("✓ 重置后旧版本需要重新获取完整列表")
+
+    # 变更记录超出上限后丢弃最早的记录
+    original_size = file_index_module.CHANGE_LOG_SIZE
+    file_index_module.CHANGE_LOG_SIZE = 3
+    try:
+        _, version = index.versioned_list()
+        for i in range(5):
+            file_utils.save_stream(BytesIO(b"x"), f"log_{i}.txt")
+        assert index.changes_since(version) is None
+        assert len(index.changes_since(index.version - 3)["added"]) == 3
+    finally:
+        file_index_module.CHANGE_LOG_SIZE = original_size
+    print("✓ 落后太多的版本需要重新获取完整列表")
+
+    print()
+
+def test_socket_events():
+    """
+    测试登录、增量推送和重新获取完整列表的Socket事件
+    """
+    print("测试2: Socket事件")
+    print("-" * 50)
+
+    from web import app, socketio
+    from utils.file_utils import file_utils
+
+    first = socketio.test_client(app)
+    second = socketio.test_client(app)
+    http = app.test_client()
+    uploaded = []
+    try:
+        first.emit("user_login", {"device_info": "test"})
+        second.emit("user_login", {"device_info": "test", "file_list": False})
+        received = first.get_received()
+        snapshots = [event["args"][0] for event in received if event["name"] == "file_list_update"]
+        assert len(snapshots) == 1
+        version = snapshots[0]["version"]
+        assert isinstance(snapshots[0]["files"], list)
+        assert not [event for event in second.get_received() if event["name"] == "file_list_update"]
+        assert not [event for event in first.get_received() if event["name"] == "file_list_update"]
+        print("✓ 只向登录的客户端发送完整列表，可以不要")
+
+        response = http.put("/upload/stream?filename=delta_test.txt", data=b"delta")
+        filename = response.get_json()["filename"]
+        uploaded.append(filename)
+        deltas = [event["args"][0] for event in first.get_received() if event["name"] == "file_list_delta"]
+        assert len(deltas) == 1
+        assert [f["filename"] for f in deltas[0]["added"]] == [filename]
+        assert deltas[0]["base"] <= version < deltas[0]["version"]
+        assert [event["args"][0] for event in second.get_received()
+                if event["name"] == "file_list_delta"] == deltas
+        print("✓ 上传后向所有客户端推送只包含新文件的增量")
+
+        http.delete(f"/delete/{filename}")
+        uploaded.remove(filename)
+        delta = [event["args"][0] for event in first.get_received() if event["name"] == "file_list_delta"][0]
+        assert delta["removed"] == [filename] and delta["base"] == deltas[0]["version"]
+        print("✓ 删除后推送删除的文件名，版本号连续")
+
+        first.emit("request_file_list")
+        snapshots = [event["args"][0] for event in first.get_received() if event["name"] == "file_list_update"]
+        assert snapshots[0]["version"] == delta["version"]
+        assert filename not in [f["filename"] for f in snapshots[0]["files"]]
+        assert not [event for event in second.get_received() if event["name"] == "file_list_update"]
+        print("✓ 落后的客户端可以重新获取完整列表")
+    finally:
+        for filename in uploaded:
+            file_utils.delete_file(filename)
+        first.disconnect()
+        second.disconnect()
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试文件列表增量推送...")
+    print("=" * 60)
+    temp_workspace.run_with_file_utils(test_changes_since)
+    test_socket_events()
+    print("所有测试通过!")
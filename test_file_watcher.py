@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试上传目录监视器
+"""
+
+import os
+import queue
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import temp_workspace
+from utils.file_watcher import FileWatcher, InotifyWatcher, PollingWatcher, create_watcher
+
+def collect(events, timeout=3):
+    """
+    收集timeout秒内的第一次回调，以及紧随其后的回调
+    """
+    changed = set()
+    try:
+        names = events.get(timeout=timeout)
+        if names is None:
+            return None
+        changed |= names
+        while True:
+            names = events.get(timeout=0.5)
+            if names is None:
+                return None
+            changed |= names
+    except queue.Empty:
+        return changed
+
+def wait_changes(changes, expected, timeout=3):
+    """
+    等待文件列表变为expected，文件夹和其中的文件可能分几次通知
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if changes.get(timeout=max(0, deadline - time.monotonic())) == expected:
+                return True
+        except queue.Empty:
+            break
+    return False
+
+def check_watcher(watcher_class, **kwargs):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        events = queue.Queue()
+        watcher = watcher_class(tmp_dir, events.put, **kwargs)
+        watcher.start()
+        try:
+            # 连续的多次写入合并为一次回调
+            start = time.monotonic()
+            for i in range(20):
+                with open(os.path.join(tmp_dir, f"copy_{i}.txt"), "w") as f:
+                    f.write("data")
+            assert collect(events) == {f"copy_{i}.txt" for i in range(20)}
+            print(f"✓ 新建文件，多个事件合并通知 ({time.monotonic() - start:.2f}秒)")
+
+            with open(os.path.join(tmp_dir, "copy_0.txt"), "a") as f:
+                f.write("more")
+            assert collect(events) == {"copy_0.txt"}
+            print("✓ 修改文件")
+
+            os.rename(os.path.join(tmp_dir, "copy_1.txt"), os.path.join(tmp_dir, "renamed.txt"))
+            assert collect(events) == {"copy_1.txt", "renamed.txt"}
+            print("✓ 移动文件，新旧文件名都通知")
+
+            os.remove(os.path.join(tmp_dir, "copy_2.txt"))
+            assert collect(events) == {"copy_2.txt"}
+            print("✓ 删除文件")
+
+            os.mkdir(os.path.join(tmp_dir, "sub"))
+            assert collect(events) == {"sub"}
+            with open(os.path.join(tmp_dir, "sub", "inner.txt"), "w") as f:
+                f.write("data")
+            assert collect(events) == {"sub/inner.txt"}
+            print("✓ 新建子目录，之后其中的文件变化也通知")
+
+            os.mkdir(os.path.join(tmp_dir, ".hidden"))
+            with open(os.path.join(tmp_dir, ".hidden", "part"), "w") as f:
+                f.write("data")
+            assert collect(events, timeout=1) == set()
+            print("✓ 内部目录不通知")
+        finally:
+            watcher.stop()
+
+def test_inotify_watcher():
+    """
+    测试inotify监视器
+    """
+    print("测试1: inotify监视器")
+    print("-" * 50)
+
+    if not sys.platform.startswith("linux"):
+        print("非Linux系统，跳过")
+        print()
+        return
+    check_watcher(InotifyWatcher)
+    print()
+
+def test_polling_watcher():
+    """
+    测试轮询监视器
+    """
+    print("测试2: 轮询监视器")
+    print("-" * 50)
+
+    check_watcher(PollingWatcher, interval=0.2)
+    print()
+
+def test_sync_file_list(file_utils):
+    """
+    测试外部变化同步到文件列表
+    """
+    print("测试3: 同步文件列表")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    assert file_utils.get_file_list() == []
+    changes = queue.Queue()
+
+    def on_change(filenames):
+        if file_utils.sync_files(filenames):
+            changes.put([f["filename"] for f in file_utils.get_file_list()])
+
+    watcher = create_watcher(upload_dir, on_change, poll_interval=0.2)
+    watcher.start()
+    try:
+        with open(os.path.join(upload_dir, "external.txt"), "w") as f:
+            f.write("copied by admin")
+        assert changes.get(timeout=3) == ["external.txt"]
+        print("✓ 外部复制的文件出现在列表中")
+
+        # 程序自己保存的文件已在列表中，不会重复通知
+        file_utils.save_stream(open(os.path.join(upload_dir, "external.txt"), "rb"), "own.txt")
+        try:
+            unexpected = changes.get(timeout=1.5)
+        except queue.Empty:
+            unexpected = None
+        assert unexpected is None, unexpected
+        print("✓ 程序自己保存的文件不重复通知")
+
+        os.remove(os.path.join(upload_dir, "external.txt"))
+        assert changes.get(timeout=3) == ["own.txt"]
+        print("✓ 外部删除的文件从列表移除")
+
+        os.makedirs(os.path.join(upload_dir, "folder", "nested"))
+        with open(os.path.join(upload_dir, "folder", "nested", "deep.txt"), "w") as f:
+            f.write("copied folder")
+        assert wait_changes(changes, ["folder/nested/deep.txt", "own.txt"])
+        info, subfolders = file_utils.get_folder("folder")
+        assert info["file_count"] == 1 and [f["name"] for f in subfolders] == ["nested"]
+        print("✓ 外部复制的文件夹及其中的文件出现在列表中")
+    finally:
+        watcher.stop()
+
+    assert file_utils.sync_files(None)
+    assert [f["filename"] for f in file_utils.get_file_list()] == ["folder/nested/deep.txt", "own.txt"]
+    print("✓ 丢失事件时重新扫描目录")
+
+    print()
+
+def test_polling_changed_dirs():
+    """
+    测试轮询时只重新列出修改时间变化了的目录
+    """
+    print("测试4: 只重新列出变化的目录")
+    print("-" * 50)
+
+    try:
+        FileWatcher("", print)
+        assert False
+    except TypeError:
+        pass
+    print("✓ 监视器基类不能直接创建")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        old = time.time() - 3600
+        for folder in ("a", "b", "b/c", "d"):
+            os.makedirs(os.path.join(tmp_dir, folder))
+            with open(os.path.join(tmp_dir, folder, "old.txt"), "w") as f:
+                f.write("old")
+        for path in ("a/old.txt", "b/old.txt", "b/c/old.txt", "d/old.txt", "b/c", "a", "b", "d", ""):
+            os.utime(os.path.join(tmp_dir, path), (old, old))
+        watcher = PollingWatcher(tmp_dir, print)
+        scanned = []
+        scan_dir = watcher._scan_dir
+        watcher._scan_dir = lambda directory: scanned.append(directory) or scan_dir(directory)
+        assert watcher._poll() == set() and scanned == []
+        print("✓ 没有变化时不列出任何目录")
+
+        with open(os.path.join(tmp_dir, "b", "c", "new.txt"), "w") as f:
+            f.write("new")
+        assert watcher._poll() == {"b/c/new.txt"} and scanned == ["b/c"]
+        with open(os.path.join(tmp_dir, "b", "c", "new.txt"), "a") as f:
+            f.write(" and more")
+        assert watcher._poll() == {"b/c/new.txt"}
+        print("✓ 只列出变化的目录，最近新建的文件被修改时也能发现")
+
+        os.rename(os.path.join(tmp_dir, "b", "c"), os.path.join(tmp_dir, "a", "c"))
+        assert watcher._poll() == {"b/c", "b/c/old.txt", "b/c/new.txt", "a/c", "a/c/old.txt", "a/c/new.txt"}
+        print("✓ 移动子目录时报告其中的各项")
+
+        # 就地修改较旧的文件不改变目录的修改时间，完整扫描时发现
+        with open(os.path.join(tmp_dir, "d", "old.txt"), "a") as f:
+            f.write(" edited")
+        assert watcher._poll() == set()
+        assert watcher._poll(full=True) == {"d/old.txt"}
+        print("✓ 就地修改的旧文件在完整扫描时发现")
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试目录监视...")
+    print("=" * 60)
+    test_inotify_watcher()
+    test_polling_watcher()
+    temp_workspace.run_with_file_utils(test_sync_file_list)
+    test_polling_changed_dirs()
+    print("所有测试通过!")
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件夹及其文件数和大小的汇总
+"""
+
+import io
+import os
+import sys
+import zipfile
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from utils.file_utils import normalize_path
+
+def test_normalize_path():
+    """
+    测试路径规范化
+    """
+    print("测试1: 路径规范化")
+    print("-" * 50)
+
+    assert normalize_path("") == ""
+    assert normalize_path("/photos//2024/") == "photos/2024"
+    assert normalize_path("photos\\2024") == "photos/2024"
+    print("✓ 去掉多余的分隔符，统一使用/")
+
+    for invalid in ("../etc", "photos/../../etc", ".blobs", "photos/.tmp"):
+        try:
+            normalize_path(invalid)
+            assert False, invalid
+        except ValueError:
+            pass
+    print("✓ 拒绝上级目录和内部目录")
+
+    print()
+
+def test_folder_totals(file_utils):
+    """
+    测试文件夹的文件数和大小随文件变化增量更新
+    """
+    print("测试2: 文件夹汇总")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    os.makedirs(os.path.join(upload_dir, "photos", "2024"))
+    with open(os.path.join(upload_dir, "photos", "2024", "old.jpg"), "wb") as f:
+        f.write(b"x" * 100)
+    with open(os.path.join(upload_dir, "top.txt"), "wb") as f:
+        f.write(b"top")
+
+    info, subfolders = file_utils.get_folder("")
+    assert info["file_count"] == 2 and info["size"] == 103
+    assert [f["name"] for f in subfolders] == ["photos"]
+    assert subfolders[0]["file_count"] == 1 and subfolders[0]["size"] == 100
+    print("✓ 启动时扫描已有的文件夹")
+
+    assert file_utils.create_folder("photos/2025")
+    _, first = file_utils.save_stream(BytesIO(b"y" * 50), "photos/2025/new.jpg")
+    assert first == "photos/2025/new.jpg"
+    info, subfolders = file_utils.get_folder("photos")
+    assert info["file_count"] == 2 and info["size"] == 150
+    assert [(f["name"], f["size"]) for f in subfolders] == [("2024", 100), ("2025", 50)]
+    assert file_utils.get_folder("")[0]["size"] == 153
+    print("✓ 保存文件后各级上级文件夹的汇总随之更新")
+
+    with open(os.path.join(upload_dir, first), "ab") as f:
+        f.write(b"y" * 10)
+    file_utils.file_index.update(first)
+    assert file_utils.get_folder("photos")[0]["size"] == 160
+    file_utils.delete_file("photos/2024/old.jpg")
+    info, _ = file_utils.get_folder("photos")
+    assert info["file_count"] == 1 and info["size"] == 60
+    print("✓ 修改和删除文件后汇总随之更新")
+
+    files, cursor, total = file_utils.query_files("photos/2025")
+    assert [f["name"] for f in files] == ["new.jpg"] and total == 1 and cursor is None
+    assert [f["folder"] for f in files] == ["photos/2025"]
+    assert file_utils.query_files("photos")[2] == 0
+    assert [f["filename"] for f in file_utils.get_file_list()] == [first, "top.txt"]
+    print("✓ 按文件夹查询只返回直接包含的文件，完整列表包括所有文件夹")
+
+    try:
+        file_utils.query_files("missing")
+        assert False
+    except FileNotFoundError:
+        pass
+    print("✓ 不存在的文件夹")
+
+    # 外部复制进来的文件夹
+    os.makedirs(os.path.join(upload_dir, "copied", "inner"))
+    with open(os.path.join(upload_dir, "copied", "inner", "a.bin"), "wb") as f:
+        f.write(b"z" * 7)
+    assert file_utils.sync_files({"copied"})
+    info, subfolders = file_utils.get_folder("copied")
+    assert info["file_count"] == 1 and info["size"] == 7
+    assert [f["name"] for f in subfolders] == ["inner"]
+    delta = file_utils.file_index.changes_since(file_utils.file_index.version - 2)
+    assert "copied" in delta["folders"]
+    assert [f["filename"] for f in delta["added"]] == ["copied/inner/a.bin"]
+    print("✓ 同步外部复制的文件夹")
+
+    assert file_utils.delete_folder("photos")
+    assert not os.path.exists(os.path.join(upload_dir, "photos"))
+    assert [f["name"] for f in file_utils.get_folder("")[1]] == ["copied"]
+    assert file_utils.get_folder("")[0]["size"] == 10
+    print("✓ 删除文件夹及其中的文件")
+
+    print()
+
+def test_folder_api():
+    """
+    测试文件夹相关的API
+    """
+    print("测试3: 文件夹API")
+    print("-" * 50)
+
+    from web import app
+    from utils.file_utils import file_utils
+
+    client = app.test_client()
+    folder = "api_folder_test"
+    try:
+        response = client.post("/api/folders", json={"path": f"{folder}/sub"})
+        assert response.status_code == 200
+        assert response.get_json()["folder"]["path"] == f"{folder}/sub"
+        for path in ("", "../outside", f"{folder}/.hidden"):
+            assert client.post("/api/folders", json={"path": path}).status_code == 400
+        print("✓ 创建文件夹，无效路径返回400")
+
+        response = client.put(f"/upload/stream?filename=a.txt&folder={folder}/sub", data=b"streamed")
+        assert response.get_json()["filename"] == f"{folder}/sub/a.txt"
+        response = client.post("/upload", data={"folder": folder, "file": (io.BytesIO(b"form"), "b.txt")},
+                               content_type="multipart/form-data")
+        assert response.status_code == 200
+        response = client.put("/upload/stream?filename=a.txt&folder=../outside", data=b"bad")
+        assert response.status_code == 400
+        print("✓ 上传到指定文件夹")
+
+        data = client.get(f"/api/files?folder={folder}").get_json()
+        assert data["folder"]["file_count"] == 2 and data["folder"]["size"] == len(b"streamedform")
+        assert [f["name"] for f in data["folders"]] == ["sub"]
+        assert [f["filename"] for f in data["files"]] == [f"{folder}/b.txt"]
+        assert client.get("/api/files?folder=missing_folder").status_code == 404
+        assert client.get("/api/files?folder=../x").status_code == 400
+        print("✓ 按文件夹获取文件列表")
+
+        response = client.get(f"/download-zip?folder={folder}")
+        assert response.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+            assert sorted(archive.namelist()) == [f"{folder}/b.txt", f"{folder}/sub/a.txt"]
+        response = client.get(f"/download-zip?folder={folder}/sub")
+        with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+            assert archive.namelist() == ["sub/a.txt"]
+        print("✓ 打包下载文件夹，保留目录结构")
+
+        response = client.delete(f"/api/folders/{folder}")
+        assert response.status_code == 200
+        assert client.get(f"/api/files?folder={folder}").status_code == 404
+        assert client.delete(f"/api/folders/{folder}").status_code == 404
+        print("✓ 删除文件夹")
+    finally:
+        if file_utils.file_index.get_folder(folder) is not None:
+            file_utils.delete_folder(folder)
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试文件夹...")
+    print("=" * 60)
+    test_normalize_path()
+    temp_workspace.run_with_file_utils(test_folder_totals)
+    test_folder_api()
+    print("所有测试通过!")
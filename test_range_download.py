@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试下载的Range、多区间Range、If-Range和条件请求
+"""
+
+import hashlib
+import http.client
+import os
+import sys
+import threading
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from web import app
+from web.file_response import FileBody, send_file_ranges
+from utils.file_utils import file_utils
+
+CONTENT = os.urandom(300000)
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+def save_test_file():
+    _, filename = file_utils.save_stream(BytesIO(CONTENT), "range_test.bin")
+    return filename
+
+def test_single_range():
+    """
+    测试完整下载和单个区间
+    """
+    print("测试1: 完整下载和单个区间")
+    print("-" * 50)
+
+    client = app.test_client()
+    filename = save_test_file()
+    try:
+        response = client.get(f"/download/{filename}")
+        assert response.status_code == 200 and response.data == CONTENT
+        assert response.headers["Accept-Ranges"] == "bytes"
+        assert response.headers["ETag"] == f'"{DIGEST}"'
+        print("✓ 完整下载返回基于内容哈希的强ETag")
+
+        with app.test_request_context(f"/download/{filename}", method="HEAD"):
+            response = send_file_ranges(os.path.join(file_utils.upload_dir, filename), filename, DIGEST)
+        assert response.status_code == 200 and response.content_length == len(CONTENT)
+        assert not isinstance(response.response, FileBody)
+        print("✓ HEAD请求返回文件大小，不打开文件")
+
+        response = client.get(f"/download/{filename}", headers={"Range": "bytes=1000-1999"})
+        assert response.status_code == 206 and response.data == CONTENT[1000:2000]
+        assert response.headers["Content-Range"] == f"bytes 1000-1999/{len(CONTENT)}"
+        print("✓ 单个区间返回206")
+
+        response = client.get(f"/download/{filename}", headers={"Range": "bytes=-500"})
+        assert response.data == CONTENT[-500:]
+        response = client.get(f"/download/{filename}", headers={"Range": "bytes=299000-"})
+        assert response.data == CONTENT[299000:]
+        print("✓ 支持后缀区间和开放区间")
+
+        response = client.get(f"/download/{filename}", headers={"Range": "bytes=400000-"})
+        assert response.status_code == 416
+        assert response.headers["Content-Range"] == f"bytes */{len(CONTENT)}"
+        print("✓ 无法满足的区间返回416")
+    finally:
+        file_utils.delete_file(filename)
+
+    print()
+
+def test_multi_range():
+    """
+    测试多区间Range
+    """
+    print("测试2: 多区间Range")
+    print("-" * 50)
+
+    client = app.test_client()
+    filename = save_test_file()
+    try:
+        response = client.get(f"/download/{filename}", headers={"Range": "bytes=0-9,5000-5009"})
+        assert response.status_code == 206
+        assert response.mimetype == "multipart/byteranges"
+        boundary = response.mimetype_params["boundary"].encode()
+        assert int(response.headers["Content-Length"]) == len(response.data)
+        parts = response.data.split(b"--" + boundary)[1:-1]
+        assert len(parts) == 2
+        assert parts[0].endswith(b"\r\n\r\n" + CONTENT[0:10] + b"\r\n")
+        assert b"Content-Range: bytes 5000-5009/" in parts[1]
+        assert parts[1].endswith(CONTENT[5000:5010] + b"\r\n")
+        print("✓ 多个区间以multipart/byteranges返回")
+
+        response = client.get(f"/download/{filename}", headers={"Range": "bytes=0-99,50-149"})
+        assert response.headers["Content-Range"] == f"bytes 0-149/{len(CONTENT)}"
+        print("✓ 重叠的区间合并为一个")
+    finally:
+        file_utils.delete_file(filename)
+
+    print()
+
+def test_conditional():
+    """
+    测试If-Range和If-None-Match
+    """
+    print("测试3: 条件请求")
+    print("-" * 50)
+
+    client = app.test_client()
+    filename = save_test_file()
+    try:
+        response = client.get(f"/download/{filename}",
+                              headers={"Range": "bytes=100-", "If-Range": f'"{DIGEST}"'})
+        assert response.status_code == 206 and response.data == CONTENT[100:]
+        print("✓ If-Range匹配时继续断点续传")
+
+        response = client.get(f"/download/{filename}",
+                              headers={"Range": "bytes=100-", "If-Range": '"changed"'})
+        assert response.status_code == 200 and response.data == CONTENT
+        print("✓ 文件已变化时返回完整文件")
+
+        response = client.get(f"/download/{filename}", headers={"If-None-Match": f'"{DIGEST}"'})
+        assert response.status_code == 304
+        print("✓ If-None-Match匹配时返回304")
+    finally:
+        file_utils.delete_file(filename)
+
+    print()
+
+def test_sendfile_server():
+    """
+    测试开发服务器上通过sendfile发送的响应
+    """
+    print("测试4: 开发服务器上的sendfile")
+    print("-" * 50)
+
+    from werkzeug.serving import make_server
+
+    filename = save_test_file()
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        for headers, expected in (({}, CONTENT), ({"Range": "bytes=123-45678"}, CONTENT[123:45679])):
+            conn = http.client.HTTPConnection("127.0.0.1", server.server_port)
+            conn.request("GET", f"/download/{filename}", headers=headers)
+            response = conn.getresponse()
+            assert response.read() == expected
+            conn.close()
+        print("✓ 完整下载和区间下载的内容正确")
+    finally:
+        server.shutdown()
+        file_utils.delete_file(filename)
+
+    print()
+
+def test_internal_files():
+    """
+    测试上级目录和内部目录中的文件不能下载
+    """
+    print("测试5: 内部文件不能下载")
+    print("-" * 50)
+
+    client = app.test_client()
+    filename = save_test_file()
+    file_utils.close()
+    try:
+        for path in (".meta/checksums.json", ".meta/catalog.db", ".blobs/refs.json", f".blobs/{DIGEST[:2]}/{DIGEST}",
+                     "%2e%2e/%2e%2e/config.json", "..%252f..%252fconfig.json", ".sessions"):
+            assert client.get(f"/download/{path}").status_code == 404, path
+            assert client.get(f"/api/signature/{path}").status_code == 404, path
+            assert client.get(f"/thumb/{path}").status_code == 404, path
+        assert client.get(f"/download/{filename}").status_code == 200
+        print("✓ 元数据、blob和上级目录中的文件返回404")
+    finally:
+        file_utils.delete_file(filename)
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试断点续传下载...")
+    print("=" * 50)
+
+    test_single_range()
+    test_multi_range()
+    test_conditional()
+    test_sendfile_server()
+    test_internal_files()
+
+    print("=" * 50)
+    print("断点续传下载测试完成!")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件名搜索索引
+"""
+
+import os
+import sys
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from utils.search_index import TrigramIndex
+
+def test_trigram_index():
+    """
+    测试三元组索引的子串搜索、排序和模糊匹配
+    """
+    print("测试1: 三元组索引")
+    print("-" * 50)
+
+    index = TrigramIndex()
+    for path in ("report.pdf", "Annual_Report_2024.xlsx", "misreported.txt", "photos/report",
+                 "photos/IMG_0001.jpg", "notes.txt"):
+        index.add(path, path.rsplit("/", 1)[-1])
+
+    assert index.search("REPORT") == ["photos/report", "report.pdf", "Annual_Report_2024.xlsx",
+                                      "misreported.txt"]
+    print("✓ 完全相同、名称开头、单词开头、名称中间依次排列")
+
+    assert index.search("report", limit=2) == ["photos/report", "report.pdf"]
+    assert index.search("img_0001") == ["photos/IMG_0001.jpg"]
+    assert index.search("xyz") == []
+    print("✓ 限制结果数，不区分大小写")
+
+    assert index.search("tx") == ["notes.txt", "misreported.txt"]
+    print("✓ 不足3个字符的查询")
+
+    assert index.search("anual_report") == ["Annual_Report_2024.xlsx"]
+    # 相同的三元组太少时不算相近
+    assert index.search("reprot") == []
+    print("✓ 拼错时返回相近的名称")
+
+    assert index.search("report", accept=lambda path: path.startswith("photos/")) == ["photos/report"]
+    print("✓ 按路径筛选")
+
+    assert index.remove("report.pdf") and not index.remove("report.pdf")
+    index.add("notes.txt", "renamed.md")
+    assert "report.pdf" not in index.search("report")
+    assert index.search("notes") == [] and index.search("renamed") == ["notes.txt"]
+    assert all(doc_ids for doc_ids in index.postings.values())
+    assert len(index) == 5 and len(index.free_ids) == 1
+    print("✓ 删除和改名后索引随之更新，不留空的倒排表")
+
+    print()
+
+def test_search_files(file_utils):
+    """
+    测试保存、删除文件时增量更新搜索索引
+    """
+    print("测试2: 搜索文件")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    os.makedirs(os.path.join(upload_dir, "holiday", "beach"))
+    with open(os.path.join(upload_dir, "holiday", "beach", "sunset.jpg"), "wb") as f:
+        f.write(b"sunset")
+
+    results = file_utils.search_files("sunset")
+    assert [(r["type"], r["filename"]) for r in results] == [("file", "holiday/beach/sunset.jpg")]
+    results = file_utils.search_files("beach")
+    assert [(r["type"], r["path"], r["file_count"]) for r in results] == [("folder", "holiday/beach", 1)]
+    print("✓ 启动时已有的文件和文件夹")
+
+    _, saved = file_utils.save_stream(BytesIO(b"sunrise"), "holiday/sunrise.jpg")
+    assert [r["filename"] for r in file_utils.search_files("sun")] == ["holiday/beach/sunset.jpg",
+                                                                       "holiday/sunrise.jpg"]
+    assert [r["filename"] for r in file_utils.search_files("sun", folder="holiday/beach")] == [
+        "holiday/beach/sunset.jpg"]
+    print("✓ 保存的文件立即可以搜索，可以限定文件夹")
+
+    file_utils.delete_file(saved)
+    assert [r["filename"] for r in file_utils.search_files("sun")] == ["holiday/beach/sunset.jpg"]
+    file_utils.delete_folder("holiday")
+    assert file_utils.search_files("sun") == [] and file_utils.search_files("beach") == []
+    print("✓ 删除文件和文件夹后不再出现")
+
+    for invalid in ({"limit": 0}, {"limit": 10000}):
+        try:
+            file_utils.search_files("x", **invalid)
+            assert False, invalid
+        except ValueError:
+            pass
+    try:
+        file_utils.search_files("x", folder="missing")
+        assert False
+    except FileNotFoundError:
+        pass
+    print("✓ 无效的参数和文件夹")
+
+    print()
+
+def test_search_api():
+    """
+    测试搜索API
+    """
+    print("测试3: 搜索API")
+    print("-" * 50)
+
+    from web import app
+    from utils.file_utils import file_utils
+
+    client = app.test_client()
+    _, saved = file_utils.save_stream(BytesIO(b"searchable"), "search_api_quarterly.txt")
+    try:
+        data = client.get("/api/search?q=API_QUARTER").get_json()
+        assert [r["filename"] for r in data["results"]] == [saved]
+        assert data["results"][0]["type"] == "file"
+        print("✓ 按名称搜索")
+
+        for query in ("q=", "q=x&limit=abc", "q=x&limit=0", "q=x&folder=../etc"):
+            response = client.get(f"/api/search?{query}")
+            assert response.status_code == 400, query
+            assert response.get_json()["success"] is False
+        assert client.get("/api/search?q=x&folder=missing_folder").status_code == 404
+        print("✓ 无效参数返回400，文件夹不存在返回404")
+    finally:
+        file_utils.delete_file(saved)
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试文件名搜索...")
+    print("=" * 60)
+    test_trigram_index()
+    temp_workspace.run_with_file_utils(test_search_files)
+    test_search_api()
+    print("所有测试通过!")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试上传中的文件不会出现在文件列表中，以及启动时清理遗留的临时文件
+"""
+
+import os
+import sys
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import temp_workspace
+from utils.upload_session import UploadSessionManager
+
+class SlowStream:
+    """
+    模拟传输到一半暂停的上传数据流
+    """
+
+    def __init__(self):
+        self.parts = [b"first half", b"second half"]
+        self.paused = threading.Event()
+        self.resume = threading.Event()
+
+    def read(self, size=-1):
+        if len(self.parts) == 1:
+            self.paused.set()
+            self.resume.wait(5)
+        return self.parts.pop(0) if self.parts else b""
+
+def test_partial_upload_hidden(file_utils):
+    """
+    测试上传进行中文件列表里看不到该文件
+    """
+    print("测试1: 上传中的文件不出现在列表中")
+    print("-" * 50)
+
+    stream = SlowStream()
+    result = []
+    thread = threading.Thread(target=lambda: result.append(file_utils.save_stream(stream, "movie.mkv")))
+    thread.start()
+
+    assert stream.paused.wait(5)
+    assert file_utils.get_file_list() == []
+    print("✓ 上传进行中文件列表为空")
+
+    stream.resume.set()
+    thread.join()
+    files = file_utils.get_file_list()
+    assert [f["filename"] for f in files] == ["movie.mkv"]
+    assert files[0]["size"] == len(b"first halfsecond half")
+    print("✓ 上传完成后文件以完整大小出现")
+
+    print()
+
+def test_cleanup_on_startup(file_utils):
+    """
+    测试启动时清理遗留的临时文件
+    """
+    print("测试2: 清理遗留的临时文件")
+    print("-" * 50)
+
+    file_utils.create_temp_file().close()
+    file_utils.create_temp_file().close()
+    assert file_utils.cleanup_staging() == 2
+    assert os.listdir(file_utils.temp_dir) == []
+    print("✓ 临时目录中的遗留文件被删除")
+
+    manager = UploadSessionManager(file_utils)
+    upload_id = manager.create_session("resume.iso", 100)["upload_id"]
+    orphan = os.path.join(manager.session_dir, "orphan.part")
+    open(orphan, "wb").close()
+
+    manager = UploadSessionManager(file_utils)
+    assert not os.path.exists(orphan)
+    assert manager.get_session(upload_id) is not None
+    print("✓ 删除无元数据的会话文件，保留可续传的会话")
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试临时文件处理...")
+    print("=" * 50)
+
+    temp_workspace.run_with_file_utils(test_partial_upload_hidden)
+    temp_workspace.run_with_file_utils(test_cleanup_on_startup)
+
+    print("=" * 50)
+    print("临时文件处理测试完成!")
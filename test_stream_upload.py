@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试流式上传：请求体直接写入目标文件，multipart临时文件重命名而不复制
+"""
+
+import os
+import sys
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from werkzeug.datastructures import FileStorage
+import temp_workspace
+from utils.file_utils import copy_stream, UploadTooLargeError
+
+def test_copy_stream():
+    """
+    测试固定缓冲区复制和大小限制
+    """
+    print("测试1: 固定缓冲区复制")
+    print("-" * 50)
+
+    content = os.urandom(100000)
+    dst = BytesIO()
+    copied = copy_stream(BytesIO(content), dst, buffer_size=4096)
+    assert copied == len(content) and dst.getvalue() == content
+    print(f"✓ 复制 {copied} 字节成功")
+
+    try:
+        copy_stream(BytesIO(content), BytesIO(), max_bytes=1000, buffer_size=4096)
+        assert False, "超出限制时应抛出异常"
+    except UploadTooLargeError:
+        print("✓ 超出大小限制时抛出异常")
+
+    print()
+
+def test_save_stream(file_utils):
+    """
+    测试从数据流直接保存文件
+    """
+    print("测试2: 流式保存文件")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    content = os.urandom(50000)
+
+    success, filename = file_utils.save_stream(BytesIO(content), "stream.bin")
+    assert success and filename == "stream.bin"
+    with open(os.path.join(upload_dir, filename), "rb") as f:
+        assert f.read() == content
+    print(f"✓ 流式保存成功: {filename}")
+
+    success, filename = file_utils.save_file(BytesIO(content[::-1]), "stream.bin")
+    assert success and filename == "stream_1.bin"
+    print(f"✓ BytesIO保存成功: {filename}")
+
+    print()
+
+def test_multipart_temp_file_rename(file_utils):
+    """
+    测试multipart临时文件保存时直接重命名
+    """
+    print("测试3: multipart临时文件重命名")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    stream = file_utils.create_temp_file()
+    stream.write(b"multipart content")
+    stream.seek(0)
+    temp_path = stream.name
+
+    success, filename = file_utils.save_file(FileStorage(stream, "upload.txt"), "upload.txt")
+    assert success
+    assert not os.path.exists(temp_path)
+    with open(os.path.join(upload_dir, filename), "rb") as f:
+        assert f.read() == b"multipart content"
+    print("✓ 临时文件被重命名为目标文件")
+
+    stream = file_utils.create_temp_file()
+    temp_path = stream.name
+    file_utils.discard_temp_file(FileStorage(stream, "unused.txt"))
+    assert not os.path.exists(temp_path)
+    print("✓ 未保存的临时文件被清理")
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试流式上传功能...")
+    print("=" * 50)
+
+    test_copy_stream()
+    temp_workspace.run_with_file_utils(test_save_stream)
+    temp_workspace.run_with_file_utils(test_multipart_temp_file_rename)
+
+    print("=" * 50)
+    print("流式上传功能测试完成!")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试缩略图缓存和缩略图接口
+"""
+
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from web import app
+from utils.file_utils import file_utils
+from utils.thumbnail import ThumbnailCache, Image
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def fake_render(data):
+    return lambda size: (data * size, "jpg")
+
+def test_thumbnail_cache():
+    """
+    测试缩略图缓存的生成、淘汰和删除
+    """
+    print("测试1: 缩略图缓存")
+    print("-" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = ThumbnailCache(temp_dir, max_size=500)
+        assert cache.get("k1", "small") is None
+        assert cache.schedule("k1", "small", fake_render(b"a"))
+        assert wait_for(lambda: cache.get("k1", "small") is not None)
+        with open(cache.get("k1", "small"), "rb") as f:
+            assert f.read() == b"a" * 128
+        print("✓ 在线程池中生成并缓存缩略图")
+
+        # 再写入两个缩略图超出上限，最久未使用的被淘汰
+        assert cache.schedule("k2", "small", fake_render(b"b"))
+        assert wait_for(lambda: cache.get("k2", "small") is not None)
+        cache.get("k1", "small")
+        assert cache.schedule("k3", "medium", fake_render(b"c"))
+        assert wait_for(lambda: cache.get("k3", "medium") is not None)
+        assert cache.get("k2", "small") is None
+        assert cache.get("k1", "small") is not None
+        assert cache.total_size == 128 + 256
+        print("✓ 超出大小上限时按最近使用时间淘汰")
+
+        def broken(size):
+            raise ValueError("无法识别的图片")
+        assert cache.schedule("bad", "small", broken)
+        assert wait_for(lambda: ("bad", "small") not in cache.pending)
+        assert not cache.schedule("bad", "small", broken)
+        print("✓ 生成失败后不再重复尝试")
+
+        reloaded = ThumbnailCache(temp_dir, max_size=500)
+        assert reloaded.get("k1", "small") is not None and reloaded.total_size == cache.total_size
+        cache.remove("k1")
+        assert cache.get("k1", "small") is None
+        assert not os.path.exists(os.path.join(temp_dir, "k1.small.jpg"))
+        print("✓ 重启后恢复缓存，删除内容时删除缩略图")
+
+        disabled = ThumbnailCache(temp_dir, max_size=0)
+        assert not disabled.schedule("k4", "small", fake_render(b"d"))
+        print("✓ 大小上限为0时不生成")
+        cache.executor.shutdown(wait=True)
+    print()
+
+def test_thumbnail_route():
+    """
+    测试缩略图接口
+    """
+    print("测试2: 缩略图接口")
+    print("-" * 50)
+
+    client = app.test_client()
+    _, text_name = file_utils.save_stream(BytesIO(b"not an image"), "thumb_test.txt")
+    _, image_name = file_utils.save_stream(BytesIO(b"fake jpeg"), "thumb_test.jpg")
+    try:
+        assert client.get("/thumb/missing.jpg").status_code == 404
+        assert client.get(f"/thumb/{image_name}?size=huge").status_code == 400
+        assert client.get(f"/thumb/{text_name}").status_code == 415
+        print("✓ 文件不存在返回404，尺寸无效返回400，不支持的文件返回415")
+
+        # 不依赖Pillow，直接放入缓存后由接口发送
+        key = file_utils.get_etag(image_name)
+        file_utils.thumbnails.schedule(key, "small", fake_render(b"t"))
+        assert wait_for(lambda: file_utils.thumbnails.get(key, "small") is not None)
+        response = client.get(f"/thumb/{image_name}")
+        assert response.status_code == 200
+        assert response.data == b"t" * 128
+        assert response.mimetype == "image/jpeg"
+        assert "Content-Disposition" not in response.headers
+        etag = response.headers["ETag"]
+        assert client.get(f"/thumb/{image_name}", headers={"If-None-Match": etag}).status_code == 304
+        print("✓ 已生成的缩略图直接发送，支持条件请求")
+
+        thumbnail_path = file_utils.thumbnails.get(key, "small")
+        file_utils.delete_file(image_name)
+        assert not os.path.exists(thumbnail_path)
+        print("✓ 删除文件时删除缩略图")
+    finally:
+        file_utils.delete_file(text_name)
+        file_utils.delete_file(image_name)
+    print()
+
+def test_render_image():
+    """
+    测试用Pillow生成图片缩略图
+    """
+    print("测试3: 生成图片缩略图")
+    print("-" * 50)
+
+    if Image is None:
+        print("未安装Pillow，跳过")
+        print()
+        return
+
+    client = app.test_client()
+    buffer = BytesIO()
+    Image.new("RGB", (1200, 800), (200, 30, 30)).save(buffer, "JPEG")
+    _, filename = file_utils.save_stream(BytesIO(buffer.getvalue()), "thumb_photo.jpg")
+    try:
+        response = client.get(f"/thumb/{filename}?size=medium")
+        assert response.status_code in (200, 202)
+        assert wait_for(lambda: client.get(f"/thumb/{filename}?size=medium").status_code == 200)
+        response = client.get(f"/thumb/{filename}?size=medium")
+        with Image.open(BytesIO(response.data)) as thumb:
+            assert thumb.format == "JPEG" and thumb.size == (256, 171)
+        print("✓ 按最长边缩小并保持宽高比")
+    finally:
+        file_utils.delete_file(filename)
+    print()
+
+if __name__ == "__main__":
+    print("开始测试缩略图...")
+    print("=" * 60)
+    test_thumbnail_cache()
+    test_thumbnail_route()
+    test_render_image()
+    print("所有测试通过!")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试重名文件的文件名分配：O(1)分配，并发上传同名文件不会冲突
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import temp_workspace
+from utils.file_utils import FileUtils
+
+def test_sequential_names(file_utils):
+    """
+    测试顺序上传同名文件
+    """
+    print("测试1: 顺序上传同名文件")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    names = [file_utils.save_stream(BytesIO(f"content {i}".encode()), "IMG_0001.jpg")[1] for i in range(4)]
+    assert names == ["IMG_0001.jpg", "IMG_0001_1.jpg", "IMG_0001_2.jpg", "IMG_0001_3.jpg"]
+    print(f"✓ 文件名依次为: {names}")
+
+    # 服务重启后跳过已存在的文件
+    file_utils.close()
+    restarted = FileUtils(upload_dir)
+    _, filename = restarted.save_stream(BytesIO(b"after restart"), "IMG_0001.jpg")
+    assert filename == "IMG_0001_4.jpg"
+    print(f"✓ 重启后跳过已存在的文件: {filename}")
+    restarted.close()
+
+    # 重启后按目录中已有的最大序号继续编号，不逐个尝试已占用的序号
+    with open(os.path.join(upload_dir, "IMG_0002_7.jpg"), "wb") as f:
+        f.write(b"copied by hand")
+    restarted = FileUtils(upload_dir)
+    attempts = []
+
+    def create(name, path):
+        attempts.append(name)
+        open(path, "xb").close()
+
+    assert restarted._allocate_filename("IMG_0001.jpg", create) == "IMG_0001_5.jpg"
+    assert restarted._allocate_filename("IMG_0002.jpg", create) == "IMG_0002.jpg"
+    assert restarted._allocate_filename("IMG_0002.jpg", create) == "IMG_0002_8.jpg"
+    assert attempts == ["IMG_0001.jpg", "IMG_0001_5.jpg", "IMG_0002.jpg", "IMG_0002.jpg", "IMG_0002_8.jpg"]
+    print("✓ 重启后从已有的最大序号之后开始分配")
+    restarted.close()
+
+    print()
+
+def test_concurrent_same_name(file_utils):
+    """
+    压力测试：多个线程同时上传同名文件
+    """
+    print("测试2: 并发上传同名文件")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    count = 200
+
+    def upload(i):
+        return file_utils.save_stream(BytesIO(f"photo {i}".encode()), "IMG_0001.jpg")
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(upload, range(count)))
+
+    assert all(success for success, _ in results)
+    names = [name for _, name in results]
+    assert len(set(names)) == count
+    assert len([name for name in os.listdir(upload_dir) if name.startswith("IMG_0001")]) == count
+    print(f"✓ {count} 个并发上传得到 {len(set(names))} 个不同的文件名")
+
+    for i, name in enumerate(names):
+        with open(os.path.join(upload_dir, name), "rb") as f:
+            assert f.read() == f"photo {i}".encode()
+    print("✓ 每个文件的内容都没有被覆盖")
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试文件名分配...")
+    print("=" * 50)
+
+    temp_workspace.run_with_file_utils(test_sequential_names)
+    temp_workspace.run_with_file_utils(test_concurrent_same_name)
+
+    print("=" * 50)
+    print("文件名分配测试完成!")
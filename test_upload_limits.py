@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试上传大小限制和磁盘空间准入检查
+"""
+
+import os
+import shutil
+import sys
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from utils.file_utils import FileUtils, UploadTooLargeError, InsufficientSpaceError
+from utils.upload_session import UploadSessionManager
+
+def test_stream_limit(file_utils):
+    """
+    测试流式接收时超出大小限制立即停止
+    """
+    print("测试1: 流式接收时检查大小")
+    print("-" * 50)
+
+    file_utils.max_file_size = 1000
+
+    success, _ = file_utils.save_stream(BytesIO(b"x" * 1000), "ok.bin")
+    assert success
+    print("✓ 未超出限制的文件保存成功")
+
+    try:
+        file_utils.save_stream(BytesIO(b"x" * 1001), "big.bin")
+        assert False, "超出限制时应抛出异常"
+    except UploadTooLargeError:
+        pass
+    assert [f["filename"] for f in file_utils.get_file_list()] == ["ok.bin"]
+    assert os.listdir(file_utils.temp_dir) == []
+    print("✓ 超出限制时拒绝并删除已接收的数据")
+
+    print()
+
+def test_space_admission(file_utils):
+    """
+    测试磁盘空间准入检查和空间预留
+    """
+    print("测试2: 磁盘空间准入检查")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    free = shutil.disk_usage(upload_dir).free
+
+    try:
+        file_utils.reserve_space("huge", free + 1)
+        assert False, "空间不足时应抛出异常"
+    except InsufficientSpaceError:
+        print("✓ 超出剩余空间的上传被拒绝")
+
+    # 已预留的空间会从剩余空间中扣除
+    file_utils.min_free_space = free // 2
+    file_utils.reserve_space("first", free // 3)
+    try:
+        file_utils.reserve_space("second", free // 3)
+        assert False, "扣除预留后空间不足时应抛出异常"
+    except InsufficientSpaceError:
+        print("✓ 进行中的上传预留的空间被扣除")
+    file_utils.release_space("first")
+    file_utils.reserve_space("second", free // 3)
+    file_utils.release_space("second")
+    assert file_utils.reserved_bytes == 0
+    print("✓ 上传结束后释放预留空间")
+
+    try:
+        file_utils.reserve_space("negative", -free)
+        assert False, "负数的预留应抛出异常"
+    except ValueError:
+        pass
+    assert file_utils.reserved_bytes == 0
+    print("✓ 拒绝负数的预留")
+
+    print()
+
+def test_session_limit(file_utils):
+    """
+    测试分块上传会话在创建时检查大小
+    """
+    print("测试3: 分块上传会话的大小检查")
+    print("-" * 50)
+
+    file_utils.max_file_size = 1000
+    manager = UploadSessionManager(file_utils)
+
+    try:
+        manager.create_session("big.iso", 1001)
+        assert False, "超出限制时应抛出异常"
+    except UploadTooLargeError:
+        print("✓ 声明大小超出限制时不创建会话")
+
+    upload_id = manager.create_session("small.iso", 1000)["upload_id"]
+    assert file_utils.reserved_bytes == 1000
+    manager.cancel_session(upload_id)
+    assert file_utils.reserved_bytes == 0
+    print("✓ 会话取消后释放预留空间")
+
+    print()
+
+def test_reservation_lifetime(file_utils):
+    """
+    测试预留空间只在会话进行期间有效：随接收的数据减少，会话超时后释放
+    """
+    print("测试4: 预留空间随会话结束释放")
+    print("-" * 50)
+
+    upload_dir = file_utils.upload_dir
+    manager = UploadSessionManager(file_utils, session_ttl=60)
+    upload_id = manager.create_session("movie.mkv", 1000, chunk_size=300)["upload_id"]
+    manager.write_chunk(upload_id, 900, BytesIO(b"x" * 100))
+    manager.write_chunk(upload_id, 0, BytesIO(b"x" * 300))
+    assert file_utils.reservations[upload_id] == 600
+    print("✓ 已接收的数据不再重复预留")
+
+    # 模拟服务重启，只预留尚未接收的部分
+    reloaded = FileUtils(upload_dir)
+    manager = UploadSessionManager(reloaded, session_ttl=60)
+    assert reloaded.reserved_bytes == 600
+    print("✓ 重启后只预留尚未接收的部分")
+
+    manager.sessions[upload_id]["last_active"] -= 61
+    assert manager.expire_sessions() == 1
+    assert reloaded.reserved_bytes == 0 and reloaded.reservations == {}
+    assert not os.listdir(manager.session_dir)
+    print("✓ 会话超时后释放预留空间并删除数据")
+
+    # 反复创建后放弃的会话不会一直占用空间，数据文件是稀疏文件，不实际占用磁盘
+    size = 100 * 1024 * 1024
+    reloaded.min_free_space = shutil.disk_usage(upload_dir).free - size * 3 // 2
+    manager.create_session("a.bin", size)
+    try:
+        manager.create_session("b.bin", size)
+        assert False, "扣除预留后空间不足时应抛出异常"
+    except InsufficientSpaceError:
+        pass
+    for session in manager.sessions.values():
+        session["last_active"] -= 61
+    manager.create_session("b.bin", size)
+    assert reloaded.reserved_bytes == size
+    print("✓ 超时的会话释放空间后可以创建新会话")
+    reloaded.close()
+
+    print()
+
+def test_routes_reject_early():
+    """
+    测试路由在读取请求体前返回413
+    """
+    print("测试5: 路由提前返回413")
+    print("-" * 50)
+
+    from web import app
+    from utils.file_utils import file_utils
+
+    client = app.test_client()
+    limit = file_utils.max_file_size
+    response = client.post("/upload/init", json={"filename": "big.iso", "size": limit + 1})
+    assert response.status_code == 413
+    print(f"✓ 分块上传初始化返回413: {response.get_json()['message']}")
+
+    # 只声明Content-Length而不发送数据，服务端不应读取请求体
+    response = client.put("/upload/stream?filename=big.iso", input_stream=BytesIO(),
+                          environ_overrides={"CONTENT_LENGTH": str(limit + 1)})
+    assert response.status_code == 413
+    print("✓ 流式上传按Content-Length返回413")
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试上传限制...")
+    print("=" * 50)
+
+    temp_workspace.run_with_file_utils(test_stream_limit)
+    temp_workspace.run_with_file_utils(test_space_admission)
+    temp_workspace.run_with_file_utils(test_session_limit)
+    temp_workspace.run_with_file_utils(test_reservation_lifetime)
+    test_routes_reject_early()
+
+    print("=" * 50)
+    print("上传限制测试完成!")
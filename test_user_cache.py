@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试用户缓存的索引、合并写入和SQLite存储
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.user_cache import UserCache
+from utils.user_store import SqliteUserStore, UserStore, create_user_store
+
+def test_user_indexes():
+    """
+    测试按用户ID、IP地址和socket_id查找，以及修改后索引随之更新
+    """
+    print("测试1: 用户索引")
+    print("-" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_file = os.path.join(tmp_dir, "users.json")
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump({"users": [
+                {"user_id": "a", "username": "A", "ip_address": "10.0.0.1"},
+                {"user_id": "b", "username": "B", "ip_address": "10.0.0.2"},
+                {"user_id": "c", "username": "C", "ip_address": "10.0.0.2"},
+            ]}, f)
+        cache = UserCache(cache_file, save_interval=0)
+        assert cache.get_user_by_id("b")["username"] == "B"
+        assert cache.get_user_by_ip("10.0.0.2")["user_id"] == "b"
+        assert cache.get_user_by_id("x") is None and cache.get_user_by_ip("10.0.0.9") is None
+        print("✓ 加载时建立索引，同一IP取靠前的用户")
+
+        user = cache.create_user("10.0.0.3", "phone")
+        assert cache.get_user_by_ip("10.0.0.3") is user and cache.get_user_by_id(user["user_id"]) is user
+        assert cache.create_user("10.0.0.3") is user and len(cache.get_all_users()) == 4
+        print("✓ 新用户加入索引，相同IP不重复创建")
+
+        assert cache.update_user("b", {"ip_address": "10.0.0.4", "user_id": "z"})["user_id"] == "b"
+        assert cache.get_user_by_ip("10.0.0.4")["user_id"] == "b"
+        assert cache.get_user_by_ip("10.0.0.2")["user_id"] == "c"
+        assert cache.update_user("x", {"username": "X"}) is None
+        print("✓ 修改IP后索引随之更新，用户ID不可修改")
+
+        cache.add_online_user("c", "s1")
+        cache.add_online_user("a", "s2")
+        cache.add_online_user("a", "s3")
+        assert cache.get_user_by_socket_id("s3") == "a"
+        assert [u["user_id"] for u in cache.get_online_users()] == ["c", "a"]
+        cache.remove_online_user("a", "s2")
+        assert cache.get_user_by_socket_id("s2") is None
+        assert [u["user_id"] for u in cache.get_online_users()] == ["c", "a"]
+        cache.remove_online_user("a", "s3")
+        cache.remove_online_user("c", "s1")
+        assert cache.get_online_users() == [] and cache.socket_users == {} and cache.user_connections == {}
+        print("✓ 按socket_id查找，断开连接后索引随之更新")
+
+    print()
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def load_user_ids(cache_file):
+    with open(cache_file, "r", encoding="utf-8") as f:
+        return [user["user_id"] for user in json.load(f)["users"]]
+
+def test_write_behind():
+    """
+    测试修改合并写入文件
+    """
+    print("测试2: 合并写入")
+    print("-" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_file = os.path.join(tmp_dir, "users.json")
+        cache = UserCache(cache_file, save_interval=0.3)
+        users = [cache.create_user(f"10.0.1.{i}") for i in range(20)]
+        for user in users:
+            cache.update_user_last_seen(user["user_id"])
+        writer = cache.store.writer
+        assert writer.snapshot_seq <= 1
+        # 等待定时器写入最后一个快照
+        assert wait_for(lambda: not writer.dirty and writer.saved_seq == writer.snapshot_seq)
+        assert load_user_ids(cache_file) == [user["user_id"] for user in users]
+        assert writer.snapshot_seq <= 2
+        assert not os.path.exists(cache_file + ".tmp")
+        print("✓ 40次修改合并为最多2次写入")
+
+        cache.update_user(users[0]["user_id"], {"username": "改名"})
+        assert writer.dirty and cache.close() and not writer.dirty
+        assert UserCache(cache_file).get_user_by_id(users[0]["user_id"])["username"] == "改名"
+        print("✓ 关闭时立即写入未保存的修改")
+
+        writer.path = os.path.join(tmp_dir, "missing", "users.json")
+        cache.update_user(users[0]["user_id"], {})
+        assert not cache.close() and writer.dirty
+        print("✓ 写入失败时保留未保存的标记")
+
+    print()
+
+def test_sqlite_store():
+    """
+    测试SQLite存储以及从users.json导入
+    """
+    print("测试3: SQLite存储")
+    print("-" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_file = os.path.join(tmp_dir, "users.json")
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump({"users": [
+                {"user_id": "a", "username": "A", "ip_address": "10.0.0.1", "device_info": "", "last_seen": ""},
+                {"user_id": "b", "username": "B", "ip_address": "10.0.0.2", "device_info": "", "last_seen": ""},
+                {"user_id": "c", "username": "C", "ip_address": "10.0.0.2", "device_info": "", "last_seen": ""},
+            ]}, f)
+        with open(cache_file, "rb") as f:
+            original = f.read()
+        store = create_user_store("sqlite", cache_file)
+        assert isinstance(store, SqliteUserStore) and store.db_path == os.path.join(tmp_dir, "users.db")
+        cache = UserCache(store=store)
+        assert [u["user_id"] for u in cache.get_all_users()] == ["a", "b", "c"]
+        assert cache.get_user_by_ip("10.0.0.2")["user_id"] == "b"
+        assert cache.get_user_by_id("c")["username"] == "C" and cache.get_user_by_id("x") is None
+        print("✓ 首次启动时导入users.json，按ID和IP查找")
+
+        user = cache.create_user("10.0.0.3", "phone")
+        assert user["username"] == "用户_4" and cache.create_user("10.0.0.3")["user_id"] == user["user_id"]
+        assert cache.update_user("b", {"username": "BB", "ip_address": "10.0.0.4"})["username"] == "BB"
+        assert cache.get_user_by_ip("10.0.0.2")["user_id"] == "c"
+        cache.add_online_user("b", "s1")
+        assert [u["username"] for u in cache.get_online_users()] == ["BB"]
+        cache.close()
+        print("✓ 新建和修改用户")
+
+        cache = UserCache(store=SqliteUserStore(os.path.join(tmp_dir, "users.db"), cache_file))
+        assert cache.store.migrate_from_json(cache_file) == 0
+        assert len(cache.get_all_users()) == 4
+        assert cache.get_user_by_ip("10.0.0.4")["username"] == "BB"
+        assert cache.get_user_by_ip("10.0.0.3")["device_info"] == "phone"
+        cache.close()
+        with open(cache_file, "rb") as f:
+            assert f.read() == original
+        print("✓ 重新打开后修改仍在，不重复导入，users.json保持不变")
+
+        try:
+            create_user_store("redis", cache_file)
+            assert False
+        except ValueError:
+            pass
+        print("✓ 未知的存储方式")
+
+        class PartialStore(UserStore):
+            def get_by_id(self, user_id):
+                return None
+
+        try:
+            PartialStore()
+            assert False
+        except TypeError:
+            pass
+        print("✓ 未实现全部方法的存储创建时即报错")
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试用户缓存...")
+    print("=" * 60)
+    test_user_indexes()
+    test_write_behind()
+    test_sqlite_store()
+    print("所有测试通过!")
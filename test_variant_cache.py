@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试下载用的预压缩版本缓存
+"""
+
+import gzip
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from werkzeug.http import parse_accept_header
+from utils.variant_cache import VariantCache
+
+LOG_CONTENT = b"".join(f"2024-01-01 12:00:{i % 60:02d} INFO request {i} served\n".encode() for i in range(20000))
+
+def accept(value):
+    return parse_accept_header(value)
+
+def wait_for_variant(file_utils, filename, accept_encodings, timeout=10):
+    """
+    等待后台生成预压缩版本
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        variant = file_utils.get_variant(filename, accept_encodings)
+        if variant is not None:
+            return variant
+        time.sleep(0.05)
+    return None
+
+def test_build_and_choose(file_utils):
+    """
+    测试后台生成和按Accept-Encoding选择
+    """
+    print("测试1: 生成和选择预压缩版本")
+    print("-" * 50)
+
+    file_utils.variants.max_size = 1024 * 1024 * 1024
+    _, filename = file_utils.save_stream(BytesIO(LOG_CONTENT), "server.log")
+
+    variant = wait_for_variant(file_utils, filename, accept("gzip, deflate"))
+    assert variant is not None and variant[0] == "gzip"
+    with open(variant[1], "rb") as f:
+        assert gzip.decompress(f.read()) == LOG_CONTENT
+    print(f"✓ 后台生成gzip版本: {os.path.getsize(variant[1])} 字节")
+
+    assert file_utils.get_variant(filename, accept("identity")) is None
+    assert file_utils.get_variant(filename, accept("gzip;q=0")) is None
+    print("✓ 客户端不接受时不使用预压缩版本")
+
+    _, image = file_utils.save_stream(BytesIO(os.urandom(10000)), "photo.jpg")
+    assert file_utils.get_variant(image, accept("gzip")) is None
+    print("✓ 已压缩的文件类型不生成预压缩版本")
+
+    file_utils.delete_file(filename)
+    assert not os.path.exists(variant[1])
+    print("✓ 删除文件时删除预压缩版本")
+    file_utils.variants.executor.shutdown(wait=True)
+
+    print()
+
+def test_size_limit():
+    """
+    测试缓存大小上限和按最近使用淘汰
+    """
+    print("测试2: 缓存大小上限")
+    print("-" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = VariantCache(tmp_dir, max_size=1000)
+        cache._add_entry("a" * 64, "gzip", 400)
+        cache._add_entry("b" * 64, "gzip", 400)
+        # 使用a之后，b成为最久未使用的版本
+        for digest in ("a", "b"):
+            open(os.path.join(tmp_dir, f"{digest * 64}.gzip"), "wb").close()
+        assert cache.choose("a" * 64, accept("gzip")) is not None
+        cache._add_entry("c" * 64, "gzip", 400)
+        assert ("b" * 64, "gzip") not in cache.entries
+        assert ("a" * 64, "gzip") in cache.entries
+        assert cache.total_size == 800
+        print("✓ 超出上限时淘汰最久未使用的版本")
+
+    print()
+
+def test_download_variant():
+    """
+    测试下载时发送预压缩版本
+    """
+    print("测试3: 下载时发送预压缩版本")
+    print("-" * 50)
+
+    from web import app
+    from utils.file_utils import file_utils
+
+    client = app.test_client()
+    _, filename = file_utils.save_stream(BytesIO(LOG_CONTENT), "variant_test.log")
+    try:
+        assert wait_for_variant(file_utils, filename, accept("gzip")) is not None
+        response = client.get(f"/download/{filename}", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert gzip.decompress(response.data) == LOG_CONTENT
+        digest = hashlib.sha256(LOG_CONTENT).hexdigest()
+        assert response.headers["ETag"] == f'"{digest}-gzip"'
+        print(f"✓ 发送预压缩版本: {len(LOG_CONTENT)} -> {len(response.data)} 字节")
+
+        response = client.get(f"/download/{filename}")
+        assert "Content-Encoding" not in response.headers and response.data == LOG_CONTENT
+        print("✓ 未声明Accept-Encoding时发送原文件")
+    finally:
+        file_utils.delete_file(filename)
+
+    print()
+
+if __name__ == "__main__":
+    print("开始测试预压缩版本缓存...")
+    print("=" * 50)
+
+    temp_workspace.run_with_file_utils(test_build_and_choose)
+    test_size_limit()
+    test_download_variant()
+
+    print("=" * 50)
+    print("预压缩版本缓存测试完成!")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试多文件ZIP打包下载
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from io import BytesIO
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 在临时目录中创建全局实例，不写入项目的static/uploads、users.json和app.log
+import temp_workspace
+temp_workspace.enter()
+
+from web import app
+from utils.file_utils import file_utils
+from utils.zip_stream import iter_zip
+
+TEXT = b"hello zip\n" * 20000
+MEDIA = os.urandom(200000)
+
+def test_iter_zip():
+    """
+    测试流式生成的归档内容和压缩方式
+    """
+    print("测试1: 流式生成ZIP归档")
+    print("-" * 50)
+
+    entries = [
+        ("a.txt", len(TEXT), time.time(), lambda: BytesIO(TEXT)),
+        ("b.jpg", len(MEDIA), 0, lambda: BytesIO(MEDIA)),
+        ("空文件.log", 0, time.time(), lambda: BytesIO(b"")),
+    ]
+    chunks = list(iter_zip(entries))
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    data = b"".join(chunks)
+
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["a.txt", "b.jpg", "空文件.log"]
+        assert archive.read("a.txt") == TEXT
+        assert archive.read("b.jpg") == MEDIA
+        assert archive.read("空文件.log") == b""
+        print("✓ 归档内容正确")
+
+        text_info = archive.getinfo("a.txt")
+        media_info = archive.getinfo("b.jpg")
+        assert text_info.compress_type == zipfile.ZIP_DEFLATED
+        assert text_info.compress_size < len(TEXT) // 10
+        assert media_info.compress_type == zipfile.ZIP_STORED
+        assert media_info.compress_size == len(MEDIA)
+        print("✓ 文本类文件使用deflate，已压缩的媒体文件直接存储")
+
+        # 修改时间早于1980年的文件使用ZIP格式能表示的最早时间
+        assert media_info.date_time == (1980, 1, 1, 0, 0, 0)
+        print("✓ 修改时间正确")
+
+    if shutil.which("unzip"):
+        with tempfile.NamedTemporaryFile(suffix=".zip") as f:
+            f.write(data)
+            f.flush()
+            result = subprocess.run(["unzip", "-tq", f.name], capture_output=True)
+            assert result.returncode == 0, result.stdout
+        print("✓ unzip校验通过")
+    print()
+
+def test_zip_route():
+    """
+    测试打包下载接口
+    """
+    print("测试2: 打包下载接口")
+    print("-" * 50)
+
+    client = app.test_client()
+    _, text_name = file_utils.save_stream(BytesIO(TEXT), "zip_test.txt")
+    _, media_name = file_utils.save_stream(BytesIO(MEDIA), "zip_test.jpg")
+    try:
+        response = client.post("/download-zip", json={"filenames": [text_name, media_name, text_name, "missing.txt"]})
+        assert response.status_code == 200
+        assert response.mimetype == "application/zip"
+        assert response.headers["Content-Disposition"].startswith("attachment")
+        assert "Content-Length" not in response.headers
+        with zipfile.ZipFile(BytesIO(response.data)) as archive:
+            assert archive.namelist() == [text_name, media_name]
+            assert archive.read(text_name) == TEXT
+            assert archive.read(media_name) == MEDIA
+        print("✓ json请求打包选中的文件，重复和不存在的文件被跳过")
+
+        response = client.post("/download-zip", data={"filenames": [text_name, media_name]})
+        with zipfile.ZipFile(BytesIO(response.data)) as archive:
+            assert archive.namelist() == [text_name, media_name]
+        print("✓ 支持表单提交")
+
+        response = client.get(f"/download-zip?filenames={media_name}")
+        with zipfile.ZipFile(BytesIO(response.data)) as archive:
+            assert archive.read(media_name) == MEDIA
+        print("✓ 支持查询参数")
+
+        response = client.post("/download-zip", json={"filenames": ["missing.txt", "../web", ".blobs"]})
+        assert response.status_code == 400
+        assert response.get_json()["success"] is False
+        print("✓ 没有可下载的文件时返回400")
+    finally:
+        file_utils.delete_file(text_name)
+        file_utils.delete_file(media_name)
+    print()
+
+if __name__ == "__main__":
+    print("开始测试ZIP打包下载...")
+    print("=" * 60)
+    test_iter_zip()
+    test_zip_route()
+    print("所有测试通过!")
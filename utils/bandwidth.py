@@ -0,0 +1,470 @@
+import io
+import math
+import threading
+import time
+import uuid
+from .logger import logger
+
+# 传输方向
+DIRECTIONS = ("upload", "download")
+# 每个方向的限速范围：全部传输合计、每个用户合计、单个传输
+LIMIT_SCOPES = ("global", "per_user", "per_transfer")
+# 限速时每次收发的数据量，越小各传输交替得越均匀
+THROTTLE_CHUNK_SIZE = 64 * 1024
+# 令牌桶最多积累的令牌，按速率计算的秒数
+BURST_SECONDS = 0.1
+# 计算公平分配时二分查找的次数
+BISECT_ITERATIONS = 60
+
+def _cap(rate):
+    return math.inf if rate is None else rate
+
+def _water_level(caps, capacity):
+    """
+    计算注水水位：每个传输分得min(水位, 自身上限)，总和恰好等于capacity
+
+    Args:
+        caps: 各传输的速率上限，无限制为inf
+        capacity: 可分配的总速率
+
+    Returns:
+        float: 水位，各上限之和不超过capacity时返回inf
+    """
+    remaining = capacity
+    count = len(caps)
+    for index, cap in enumerate(sorted(caps)):
+        if cap * (count - index) >= remaining:
+            return remaining / (count - index)
+        remaining -= cap
+    return math.inf
+
+def fair_share(transfers, global_limit=None, user_limits=None):
+    """
+    按最大最小公平原则分配带宽：先满足速率需求小的传输，剩余带宽由其他传输平分，
+    同时保证每个用户的合计速率和全部传输的合计速率不超过各自的限制
+
+    Args:
+        transfers: [(传输ID, 用户ID, 单个传输的限制)]，限制为None表示不限
+        global_limit: 全部传输的合计限制，None表示不限
+        user_limits: 用户ID到该用户合计限制的映射，未列出的用户不限
+
+    Returns:
+        dict: 传输ID到分得速率的映射，None表示不限速
+    """
+    user_limits = user_limits or {}
+    groups = {}
+    for transfer_id, user_id, limit in transfers:
+        groups.setdefault(user_id, []).append((transfer_id, _cap(limit)))
+
+    def user_total(user_id, level):
+        return min(_cap(user_limits.get(user_id)), sum(min(level, cap) for _, cap in groups[user_id]))
+
+    # 全局水位：各用户在该水位下的速率之和等于全局限制
+    capacity = _cap(global_limit)
+    level = math.inf
+    if sum(user_total(user_id, math.inf) for user_id in groups) > capacity:
+        low, high = 0.0, capacity
+        for _ in range(BISECT_ITERATIONS):
+            middle = (low + high) / 2
+            if sum(user_total(user_id, middle) for user_id in groups) > capacity:
+                high = middle
+            else:
+                low = middle
+        level = low
+
+    rates = {}
+    for user_id, members in groups.items():
+        user_level = level
+        user_limit = _cap(user_limits.get(user_id))
+        if user_limit < sum(min(level, cap) for _, cap in members):
+            # 该用户受自身限制，在用户内部再平分
+            user_level = _water_level([cap for _, cap in members], user_limit)
+        for transfer_id, cap in members:
+            rate = min(user_level, cap)
+            rates[transfer_id] = None if rate == math.inf else rate
+    return rates
+
+class TokenBucket:
+    """
+    令牌桶，按设定速率生成令牌，收发数据前消耗相应数量的令牌，
+    令牌不足时欠下的部分由调用方等待补足
+    """
+
+    def __init__(self, rate=None):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 速率（字节/秒），None表示不限速
+        """
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = self._burst()
+        self.updated = time.monotonic()
+
+    def _burst(self):
+        if self.rate is None:
+            return 0
+        return max(self.rate * BURST_SECONDS, THROTTLE_CHUNK_SIZE)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate is not None:
+            self.tokens = min(self._burst(), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate):
+        """
+        修改速率，已积累的令牌按新速率截断
+
+        Args:
+            rate: 速率（字节/秒），None表示不限速
+        """
+        with self.lock:
+            self._refill()
+            self.rate = rate
+            self.tokens = min(self.tokens, self._burst())
+
+    def consume(self, size):
+        """
+        消耗令牌
+
+        Args:
+            size: 字节数
+
+        Returns:
+            float: 需要等待的秒数
+        """
+        with self.lock:
+            if self.rate is None:
+                return 0
+            self._refill()
+            self.tokens -= size
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+class Transfer:
+    """
+    一个正在进行的上传或下载，速率由BandwidthManager分配
+    """
+
+    def __init__(self, direction, user_id, name):
+        self.id = uuid.uuid4().hex
+        self.direction = direction
+        self.user_id = user_id
+        self.name = name
+        # 管理员为该传输单独设置的限制，None表示使用per_transfer配置
+        self.limit = None
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.bucket = TokenBucket()
+
+    def chunk_size(self, size):
+        """
+        获取下一次收发的数据量，限速时拆成小块以便及时让出带宽
+
+        Args:
+            size: 剩余要收发的字节数
+
+        Returns:
+            int: 本次收发的字节数
+        """
+        if self.bucket.rate is None:
+            return size
+        return min(size, THROTTLE_CHUNK_SIZE)
+
+    def throttle(self, size):
+        """
+        记录即将收发的数据量，超出分得的速率时等待
+
+        Args:
+            size: 字节数
+        """
+        self.bytes += size
+        delay = self.bucket.consume(size)
+        if delay > 0:
+            time.sleep(delay)
+
+    def to_dict(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            "id": self.id,
+            "direction": self.direction,
+            "user_id": self.user_id,
+            "name": self.name,
+            "bytes": self.bytes,
+            "elapsed": round(elapsed, 3),
+            "limit": self.limit,
+            "rate": self.bucket.rate
+        }
+
+class BandwidthManager:
+    """
+    带宽管理类，按全局、每用户和单个传输三级限制为每个方向的活动传输公平分配速率，
+    传输开始、结束或限制修改时重新分配
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.limits = {direction: {scope: None for scope in LIMIT_SCOPES} for direction in DIRECTIONS}
+        # 单独设置的用户限制，用户ID到{方向: 速率}的映射，优先于per_user
+        self.user_limits = {}
+        self.transfers = {}
+
+    @staticmethod
+    def _parse_rate(value):
+        """
+        校验速率，0和None表示不限速
+
+        Raises:
+            ValueError: 速率不是非负数
+        """
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0 or value != value:
+            raise ValueError(f"速率无效: {value}")
+        return value or None
+
+    def get_limits(self):
+        """
+        获取当前限制
+
+        Returns:
+            dict: {"upload": {...}, "download": {...}, "users": {...}}，速率单位为字节/秒
+        """
+        with self.lock:
+            limits = {direction: dict(scopes) for direction, scopes in self.limits.items()}
+            limits["users"] = {user_id: dict(rates) for user_id, rates in self.user_limits.items()}
+            return limits
+
+    def update_limits(self, data):
+        """
+        修改限制，只修改data中给出的项，立即对正在进行的传输生效
+
+        Args:
+            data: 与get_limits格式相同的字典，users中速率为None的方向恢复使用per_user
+
+        Raises:
+            ValueError: 格式或速率无效，此时不做任何修改
+        """
+        if not isinstance(data, dict):
+            raise ValueError("限制格式无效")
+        limits = {direction: {} for direction in DIRECTIONS}
+        for direction in DIRECTIONS:
+            scopes = data.get(direction, {})
+            if not isinstance(scopes, dict):
+                raise ValueError(f"限制格式无效: {direction}")
+            for scope, value in scopes.items():
+                if scope not in LIMIT_SCOPES:
+                    raise ValueError(f"未知的限制: {direction}.{scope}")
+                limits[direction][scope] = self._parse_rate(value)
+        users = data.get("users", {})
+        if not isinstance(users, dict) or not all(isinstance(rates, dict) for rates in users.values()):
+            raise ValueError("用户限制格式无效")
+        user_limits = {}
+        for user_id, rates in users.items():
+            if set(rates) - set(DIRECTIONS):
+                raise ValueError(f"用户限制格式无效: {user_id}")
+            user_limits[user_id] = {direction: self._parse_rate(rate) for direction, rate in rates.items()}
+
+        with self.lock:
+            for direction in DIRECTIONS:
+                self.limits[direction].update(limits[direction])
+            for user_id, rates in user_limits.items():
+                merged = dict(self.user_limits.get(user_id, {}), **rates)
+                merged = {direction: rate for direction, rate in merged.items() if rate is not None}
+                if merged:
+                    self.user_limits[user_id] = merged
+                else:
+                    self.user_limits.pop(user_id, None)
+            for direction in DIRECTIONS:
+                self._rebalance(direction)
+        logger.info(f"带宽限制已更新: {self.get_limits()}")
+
+    def start_transfer(self, direction, user_id, name):
+        """
+        登记一个开始的传输
+
+        Args:
+            direction: "upload"或"download"
+            user_id: 发起传输的用户
+            name: 传输的文件或请求路径，用于显示
+
+        Returns:
+            Transfer: 传输对象，收发数据前调用throttle
+        """
+        transfer = Transfer(direction, user_id, name)
+        with self.lock:
+            self.transfers[transfer.id] = transfer
+            self._rebalance(direction)
+        return transfer
+
+    def finish_transfer(self, transfer):
+        """
+        登记传输结束，释放其占用的带宽
+
+        Args:
+            transfer: start_transfer返回的传输对象
+        """
+        with self.lock:
+            if self.transfers.pop(transfer.id, None) is not None:
+                self._rebalance(transfer.direction)
+
+    def set_transfer_limit(self, transfer_id, rate):
+        """
+        为单个传输设置限制
+
+        Args:
+            transfer_id: 传输ID
+            rate: 速率（字节/秒），None表示使用per_transfer配置
+
+        Returns:
+            bool: 传输存在返回True
+
+        Raises:
+            ValueError: 速率无效
+        """
+        rate = self._parse_rate(rate)
+        with self.lock:
+            transfer = self.transfers.get(transfer_id)
+            if transfer is None:
+                return False
+            transfer.limit = rate
+            self._rebalance(transfer.direction)
+            return True
+
+    def get_transfers(self):
+        """
+        获取正在进行的传输
+
+        Returns:
+            list: 传输信息列表
+        """
+        with self.lock:
+            return [transfer.to_dict() for transfer in self.transfers.values()]
+
+    def _user_limit(self, direction, user_id):
+        rate = self.user_limits.get(user_id, {}).get(direction)
+        return self.limits[direction]["per_user"] if rate is None else rate
+
+    def _rebalance(self, direction):
+        """
+        重新为一个方向的传输分配速率，调用方需持有锁
+        """
+        limits = self.limits[direction]
+        transfers = [transfer for transfer in self.transfers.values() if transfer.direction == direction]
+        per_transfer = limits["per_transfer"]
+        rates = fair_share(
+            [(transfer.id, transfer.user_id, per_transfer if transfer.limit is None else transfer.limit)
+             for transfer in transfers],
+            limits["global"],
+            {transfer.user_id: self._user_limit(direction, transfer.user_id) for transfer in transfers}
+        )
+        for transfer in transfers:
+            transfer.bucket.set_rate(rates[transfer.id])
+
+class ThrottledStream(io.RawIOBase):
+    """
+    限速的请求体，读取上传数据时按传输分得的速率等待
+    """
+
+    def __init__(self, stream, transfer):
+        self._stream = stream
+        self._transfer = transfer
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)[:self._transfer.chunk_size(len(buffer))]
+        if hasattr(self._stream, "readinto"):
+            length = self._stream.readinto(view)
+        else:
+            data = self._stream.read(len(view))
+            length = len(data)
+            view[:length] = data
+        if length:
+            self._transfer.throttle(length)
+        return length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(THROTTLE_CHUNK_SIZE), b""))
+        data = self._stream.read(self._transfer.chunk_size(size))
+        if data:
+            self._transfer.throttle(len(data))
+        return data
+
+    def readline(self, size=-1):
+        data = self._stream.readline(size)
+        if data:
+            self._transfer.throttle(len(data))
+        return data
+
+class ThrottledIterable:
+    """
+    限速的响应体，按传输分得的速率逐块发送，结束时释放带宽
+    """
+
+    def __init__(self, iterable, transfer, on_close):
+        self._iterable = iterable
+        self._transfer = transfer
+        self._on_close = on_close
+
+    def __iter__(self):
+        for data in self._iterable:
+            position = 0
+            while position < len(data):
+                size = self._transfer.chunk_size(len(data) - position)
+                self._transfer.throttle(size)
+                yield data[position:position + size]
+                position += size
+            if not data:
+                # 空数据块让服务器先发出响应头，例如FileBody随后直接对连接调用sendfile
+                yield data
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, "close"):
+                self._iterable.close()
+        finally:
+            self._on_close()
+
+class BandwidthMiddleware:
+    """
+    WSGI中间件，对上传和下载请求限速；其他请求（包括Socket.IO）不受影响
+    """
+
+    def __init__(self, app, manager, classify):
+        """
+        初始化中间件
+
+        Args:
+            app: 被包装的WSGI应用
+            manager: BandwidthManager实例
+            classify: 根据environ判断请求是否为传输的函数，返回(方向, 用户ID, 名称)或None
+        """
+        self.app = app
+        self.manager = manager
+        self.classify = classify
+
+    def __call__(self, environ, start_response):
+        transfer_info = self.classify(environ)
+        if transfer_info is None:
+            return self.app(environ, start_response)
+
+        transfer = self.manager.start_transfer(*transfer_info)
+        # 直接对连接调用sendfile的响应体通过environ取得传输对象自行限速
+        environ["bandwidth.transfer"] = transfer
+        if transfer.direction == "upload":
+            environ["wsgi.input"] = ThrottledStream(environ["wsgi.input"], transfer)
+        try:
+            iterable = self.app(environ, start_response)
+        except BaseException:
+            self.manager.finish_transfer(transfer)
+            raise
+        return ThrottledIterable(iterable, transfer, lambda: self.manager.finish_transfer(transfer))
+
+# 创建全局带宽管理实例
+bandwidth_manager = BandwidthManager()
@@ -0,0 +1,336 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+from .logger import logger
+from .write_behind import WriteBehindFile
+
+# 计算哈希时使用的缓冲区大小
+HASH_BUFFER_SIZE = 1024 * 1024
+# SHA-256十六进制哈希格式
+DIGEST_PATTERN = re.compile(r"[0-9a-f]{64}")
+# Linux上创建写时复制克隆（reflink）的ioctl请求号，Btrfs、XFS等文件系统支持
+FICLONE = 0x40049409
+
+def hash_file(file_path):
+    """
+    计算文件的SHA-256哈希
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        str: 十六进制哈希值
+    """
+    hasher = hashlib.sha256()
+    buffer = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, "rb") as f:
+        while True:
+            length = f.readinto(buffer)
+            if not length:
+                break
+            hasher.update(view[:length])
+    return hasher.hexdigest()
+
+class BlobStore:
+    """
+    内容寻址存储类，文件内容按SHA-256哈希保存为blob，相同内容只在磁盘上保存一份。
+    上传目录中的文件名优先是blob的写时复制克隆，修改一个文件不影响其他文件和blob；
+    文件系统不支持克隆时退化为硬链接，此时在外部就地修改文件会同时改变blob，
+    因此复用blob前核对记录的inode、大小和修改时间，不一致时丢弃该blob
+    """
+
+    def __init__(self, blob_dir):
+        """
+        初始化内容寻址存储
+
+        Args:
+            blob_dir: blob存储目录
+        """
+        self.blob_dir = blob_dir
+        os.makedirs(blob_dir, exist_ok=True)
+        self.lock = threading.RLock()
+        self.refs_file = os.path.join(blob_dir, "refs.json")
+        # 文件名到内容哈希的映射
+        self.refs = self._load_json(self.refs_file)
+        self.encodings_file = os.path.join(blob_dir, "encodings.json")
+        # 压缩存储的blob的编码和原始大小，未压缩的blob不记录
+        self.encodings = self._load_json(self.encodings_file)
+        self.stats_file = os.path.join(blob_dir, "stats.json")
+        # blob存入时的[inode, 大小, 修改时间(ns)]，用于发现在外部被修改的blob
+        self.stats = self._load_json(self.stats_file)
+        # 三个元数据文件合并写入，记录整体替换而不修改，快照只需浅复制
+        self.writers = {
+            name: WriteBehindFile(os.path.join(blob_dir, name + ".json"), lambda table=table: dict(table), self.lock)
+            for name, table in (("refs", self.refs), ("encodings", self.encodings), ("stats", self.stats))
+        }
+        # 每个blob被多少个文件名引用
+        self.ref_counts = {}
+        for digest in self.refs.values():
+            self.ref_counts[digest] = self.ref_counts.get(digest, 0) + 1
+
+    def _load_json(self, file_path):
+        """
+        从文件加载blob元数据
+
+        Args:
+            file_path: 元数据文件路径
+
+        Returns:
+            dict: 元数据，文件不存在或损坏时返回空字典
+        """
+        try:
+            if os.path.exists(file_path):
+                with open(file_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            return {}
+        except Exception as e:
+            logger.error(f"加载blob元数据失败: {file_path}, {e}")
+            return {}
+
+    def flush(self):
+        """
+        立即写入尚未保存的元数据，程序退出前调用
+
+        Returns:
+            bool: 写入成功返回True
+        """
+        return all([writer.flush() for writer in self.writers.values()])
+
+    def blob_path(self, digest):
+        """
+        获取blob的存储路径，按哈希前两位分目录，避免单个目录文件过多
+        """
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def has_blob(self, digest):
+        """
+        blob是否存在且内容未在外部被修改
+
+        Args:
+            digest: 内容哈希，可能来自客户端
+
+        Returns:
+            bool: 可以复用时返回True
+        """
+        if not DIGEST_PATTERN.fullmatch(digest):
+            return False
+        with self.lock:
+            return self._check_blob(digest)
+
+    def _check_blob(self, digest):
+        """
+        核对blob当前的inode、大小和修改时间与存入时的记录，
+        不一致说明内容已在外部通过硬链接被修改，丢弃该blob，调用方需持有锁
+
+        Returns:
+            bool: blob存在且未被修改返回True
+        """
+        blob_path = self.blob_path(digest)
+        try:
+            blob_stats = os.stat(blob_path)
+        except OSError:
+            return False
+        current = [blob_stats.st_ino, blob_stats.st_size, blob_stats.st_mtime_ns]
+        recorded = self.stats.get(digest)
+        if recorded is None:
+            # 旧版本存入的blob没有记录，以当前状态为准
+            self._set_stats(digest, blob_stats)
+            return True
+        if recorded == current:
+            return True
+        logger.warning(f"blob已在外部被修改，不再复用: {digest}")
+        self._drop(digest)
+        return False
+
+    def _set_stats(self, digest, blob_stats):
+        """
+        记录blob存入时的状态，调用方需持有锁
+        """
+        self.stats[digest] = [blob_stats.st_ino, blob_stats.st_size, blob_stats.st_mtime_ns]
+        self.writers["stats"].mark_dirty()
+
+    def _drop(self, digest):
+        """
+        丢弃内容已不符合哈希的blob及所有引用它的记录，上传目录中的文件保持不变，调用方需持有锁
+        """
+        for filename in [name for name, value in self.refs.items() if value == digest]:
+            del self.refs[filename]
+        self.writers["refs"].mark_dirty()
+        self.ref_counts.pop(digest, None)
+        self._forget(digest)
+
+    def get_digest(self, filename):
+        """
+        获取文件名引用的内容哈希
+
+        Returns:
+            str or None: 内容哈希或None
+        """
+        return self.refs.get(filename)
+
+    def get_encoding(self, digest):
+        """
+        获取blob的压缩信息
+
+        Returns:
+            dict or None: {"encoding", "size"}，blob未压缩时返回None
+        """
+        return self.encodings.get(digest)
+
+    def add(self, temp_path, digest, filename, dest_path, encoding=None, size=None):
+        """
+        将临时文件存入blob并在上传目录中创建指向它的文件名，
+        内容已存在时直接丢弃临时文件，不再占用额外磁盘空间
+
+        Args:
+            temp_path: 临时文件路径
+            digest: 文件原始内容的哈希
+            filename: 文件名
+            dest_path: 文件名对应的路径
+            encoding: 临时文件的压缩编码，None表示未压缩
+            size: 压缩前的原始大小
+
+        Raises:
+            FileExistsError: 目标路径已存在，此时临时文件保持不变
+        """
+        blob_path = self.blob_path(digest)
+        with self.lock:
+            # 先创建文件名，目标已存在时抛出FileExistsError且不改动临时文件
+            if self._check_blob(digest):
+                self._link(blob_path, dest_path)
+                os.remove(temp_path)
+            else:
+                self._link(temp_path, dest_path)
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(temp_path, blob_path)
+                self._set_stats(digest, os.stat(blob_path))
+                if encoding is not None:
+                    self.encodings[digest] = {"encoding": encoding, "size": size}
+                    self.writers["encodings"].mark_dirty()
+            self._set_ref(filename, digest)
+
+    def link(self, digest, filename, dest_path):
+        """
+        为已存在的blob创建新的文件名
+
+        Args:
+            digest: 内容哈希
+            filename: 文件名
+            dest_path: 文件名对应的路径
+
+        Returns:
+            bool: blob存在并创建成功返回True，blob不存在或已被修改返回False
+
+        Raises:
+            FileExistsError: 目标路径已存在
+        """
+        # 哈希来自客户端，校验格式以免拼出上传目录之外的路径
+        if not DIGEST_PATTERN.fullmatch(digest):
+            return False
+        with self.lock:
+            if not self._check_blob(digest):
+                return False
+            self._link(self.blob_path(digest), dest_path)
+            self._set_ref(filename, digest)
+            return True
+
+    def _set_ref(self, filename, digest):
+        """
+        记录文件名引用的blob，调用方需持有锁
+        """
+        old_digest = self.refs.get(filename)
+        self.refs[filename] = digest
+        self.ref_counts[digest] = self.ref_counts.get(digest, 0) + 1
+        if old_digest is not None:
+            # 文件名曾在外部被删除，引用未及时清理
+            self._release(old_digest)
+        self.writers["refs"].mark_dirty()
+
+    def _release(self, digest):
+        """
+        减少blob的引用计数，没有文件名引用时删除blob，调用方需持有锁
+        """
+        self.ref_counts[digest] -= 1
+        if self.ref_counts[digest] > 0:
+            return
+        del self.ref_counts[digest]
+        self._forget(digest)
+
+    def _forget(self, digest):
+        """
+        删除blob文件和它的编码、状态记录，调用方需持有锁
+        """
+        if self.encodings.pop(digest, None) is not None:
+            self.writers["encodings"].mark_dirty()
+        if self.stats.pop(digest, None) is not None:
+            self.writers["stats"].mark_dirty()
+        blob_path = self.blob_path(digest)
+        if os.path.exists(blob_path):
+            os.remove(blob_path)
+            logger.info(f"删除无引用的blob: {digest}")
+            try:
+                os.rmdir(os.path.dirname(blob_path))
+            except OSError:
+                # 目录中还有其他blob
+                pass
+
+    @staticmethod
+    def _link(src_path, dest_path):
+        """
+        创建写时复制克隆，文件系统不支持时创建硬链接，都不支持时退化为复制
+
+        Raises:
+            FileExistsError: 目标路径已存在
+        """
+        if BlobStore._clone(src_path, dest_path):
+            return
+        try:
+            os.link(src_path, dest_path)
+        except FileExistsError:
+            raise
+        except OSError:
+            # FAT32等文件系统不支持硬链接
+            with open(src_path, "rb") as src, open(dest_path, "xb") as dst:
+                shutil.copyfileobj(src, dst)
+
+    @staticmethod
+    def _clone(src_path, dest_path):
+        """
+        在Linux上用FICLONE创建共享数据块的独立文件，修改其中一个时文件系统才复制被改的块
+
+        Returns:
+            bool: 克隆成功返回True，平台或文件系统不支持时返回False且不留下目标文件
+
+        Raises:
+            FileExistsError: 目标路径已存在
+        """
+        if not sys.platform.startswith("linux"):
+            return False
+        import fcntl
+        with open(src_path, "rb") as src, open(dest_path, "xb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return True
+            except OSError:
+                pass
+        os.remove(dest_path)
+        return False
+
+    def unlink(self, filename):
+        """
+        移除文件名的引用，blob没有其他文件名引用时删除blob
+
+        Args:
+            filename: 已从上传目录删除的文件名
+        """
+        with self.lock:
+            digest = self.refs.pop(filename, None)
+            if digest is None:
+                return
+            self._release(digest)
+            self.writers["refs"].mark_dirty()
@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+from .blob_store import hash_file
+from .logger import logger
+from .write_behind import WriteBehindFile
+
+class ChecksumIndex:
+    """
+    文件校验和索引类，持久化保存每个文件的SHA-256以及计算时的大小和修改时间。
+    文件大小或修改时间变化后旧的校验和即失效，需要时再重新计算。
+    修改后合并写入索引文件，大量文件同时变化时不会每次都重写整个文件
+    """
+
+    def __init__(self, index_file):
+        """
+        初始化校验和索引
+
+        Args:
+            index_file: 索引文件路径
+        """
+        self.index_file = index_file
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        # 文件名到{"sha256", "size", "mtime_ns"}的映射，记录整体替换而不修改，快照只需浅复制
+        self.entries = self._load_entries()
+        self.lock = threading.RLock()
+        self.writer = WriteBehindFile(index_file, lambda: dict(self.entries), self.lock)
+        # 重新计算出校验和后的回调，参数为文件名
+        self.on_rehash = None
+
+    def _load_entries(self):
+        """
+        从文件加载校验和索引
+
+        Returns:
+            dict: 文件名到校验和信息的映射
+        """
+        try:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            return {}
+        except Exception as e:
+            logger.error(f"加载校验和索引失败: {e}")
+            return {}
+
+    def flush(self):
+        """
+        立即写入尚未保存的记录，程序退出前调用
+
+        Returns:
+            bool: 写入成功返回True
+        """
+        return self.writer.flush()
+
+    def record(self, filename, digest, file_stats):
+        """
+        记录文件的校验和
+
+        Args:
+            filename: 文件名
+            digest: SHA-256哈希
+            file_stats: 计算哈希时文件的os.stat结果
+        """
+        with self.lock:
+            self.entries[filename] = {
+                "sha256": digest,
+                "size": file_stats.st_size,
+                "mtime_ns": file_stats.st_mtime_ns
+            }
+            self.writer.mark_dirty()
+
+    def remove(self, filename):
+        """
+        删除文件的校验和记录
+
+        Args:
+            filename: 文件名
+        """
+        with self.lock:
+            if self.entries.pop(filename, None) is not None:
+                self.writer.mark_dirty()
+
+    def lookup(self, filename, file_stats):
+        """
+        获取仍然有效的校验和，不读取文件内容
+
+        Args:
+            filename: 文件名
+            file_stats: 文件当前的os.stat结果
+
+        Returns:
+            str or None: 大小和修改时间都未变化时返回记录的哈希，否则返回None
+        """
+        entry = self.entries.get(filename)
+        if entry and entry["size"] == file_stats.st_size and entry["mtime_ns"] == file_stats.st_mtime_ns:
+            return entry["sha256"]
+        return None
+
+    def get_checksum(self, filename, file_path):
+        """
+        获取文件的校验和，记录失效时同步重新计算
+
+        Args:
+            filename: 文件名
+            file_path: 文件路径
+
+        Returns:
+            str: SHA-256哈希
+        """
+        file_stats = os.stat(file_path)
+        digest = self.lookup(filename, file_stats)
+        if digest is None:
+            digest = hash_file(file_path)
+            self.record(filename, digest, file_stats)
+            if self.on_rehash is not None:
+                self.on_rehash(filename)
+        return digest
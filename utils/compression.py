@@ -0,0 +1,129 @@
+import gzip
+import io
+import os
+from .logger import logger
+
+# zstd为可选依赖，未安装时只能使用gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 各编码的压缩级别，存储时更看重写入速度
+COMPRESSION_LEVELS = {"gzip": 6, "zstd": 3}
+
+# 值得压缩的文件类型：日志、表格、源代码、未压缩的归档等文本为主的内容
+COMPRESSIBLE_EXTENSIONS = {
+    ".txt", ".log", ".csv", ".tsv", ".json", ".jsonl", ".xml", ".yaml", ".yml",
+    ".md", ".html", ".htm", ".css", ".js", ".ts", ".py", ".java", ".c", ".h",
+    ".cpp", ".go", ".rs", ".sh", ".sql", ".ini", ".conf", ".tar", ".svg"
+}
+
+def available_encodings():
+    """
+    获取当前环境可用的压缩编码
+
+    Returns:
+        list: 编码名称列表
+    """
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+def resolve_encoding(encoding):
+    """
+    将配置中的压缩编码转换为当前环境可用的编码
+
+    Args:
+        encoding: 配置的编码，None或空字符串表示不压缩
+
+    Returns:
+        str or None: 可用的编码，不压缩时返回None
+    """
+    if not encoding:
+        return None
+    if encoding == "zstd" and zstandard is None:
+        logger.warning("未安装zstandard，存储压缩改用gzip")
+        return "gzip"
+    if encoding not in COMPRESSION_LEVELS:
+        logger.warning(f"不支持的存储压缩编码: {encoding}，不启用压缩")
+        return None
+    return encoding
+
+def is_compressible(filename):
+    """
+    根据扩展名判断文件是否值得压缩，图片、视频、压缩包等已压缩的格式不再压缩
+
+    Args:
+        filename: 文件名
+
+    Returns:
+        bool: 值得压缩返回True
+    """
+    return os.path.splitext(filename)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+class CompressingFile:
+    """
+    写入时压缩的文件包装类，数据边接收边压缩后写入底层文件
+    """
+
+    def __init__(self, file_obj, encoding):
+        """
+        初始化压缩写入
+
+        Args:
+            file_obj: 以二进制写模式打开的文件对象，关闭时一并关闭
+            encoding: 压缩编码，gzip或zstd
+        """
+        self._file = file_obj
+        self.name = file_obj.name
+        self.encoding = encoding
+        if encoding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVELS["zstd"])
+            self._writer = compressor.stream_writer(file_obj, closefd=False)
+        else:
+            # mtime固定为0，相同内容压缩后的字节也相同
+            self._writer = gzip.GzipFile(fileobj=file_obj, mode="wb",
+                                         compresslevel=COMPRESSION_LEVELS["gzip"], mtime=0)
+
+    def write(self, data):
+        return self._writer.write(data)
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """
+        multipart解析写完文件后会调用seek(0)准备读取。压缩写入的文件不可读，
+        之后只会按路径保存，因此只接受seek(0)且不移动写入位置
+        """
+        if offset != 0 or whence != os.SEEK_SET:
+            raise io.UnsupportedOperation("压缩写入的文件不支持seek")
+        return 0
+
+    def close(self):
+        try:
+            self._writer.close()
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def open_decompressed(file_path, encoding):
+    """
+    以只读方式打开压缩存储的文件，读取到的是解压后的原始内容
+
+    Args:
+        file_path: 文件路径
+        encoding: 压缩编码，gzip或zstd
+
+    Returns:
+        file: 可读的文件对象
+    """
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("读取zstd压缩的文件需要安装zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"), closefd=True)
+    return gzip.open(file_path, "rb")
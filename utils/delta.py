@@ -0,0 +1,306 @@
+import hashlib
+import http.client
+import json
+import math
+import os
+import struct
+import urllib.parse
+import urllib.request
+import zlib
+
+# 分块大小按文件大小的平方根选取，并限制在此范围内
+MIN_BLOCK_SIZE = 4 * 1024
+MAX_BLOCK_SIZE = 1024 * 1024
+# Adler-32的模数
+ADLER_MOD = 65521
+# 客户端读取新文件和发送单个字面数据段的大小
+READ_SIZE = 1024 * 1024
+MAX_LITERAL_SIZE = 1024 * 1024
+# 按块对齐检查时连续多少块未匹配后逐字节滚动一块的距离，每次滚动未找到匹配时间隔加倍，直到上限。
+# 大段修改过的数据中只有约1/MAX_ROLL_INTERVAL需要逐字节计算；修改之后的数据错位时，
+# 最多多发送与修改部分等长（不超过MAX_ROLL_INTERVAL块）的数据才重新找到匹配
+FIRST_ROLL_INTERVAL = 2
+MAX_ROLL_INTERVAL = 256
+
+# 增量数据由以下两种记录依次组成：
+#   C + 起始块号(8字节) + 块数(8字节)：复制服务端已有文件中连续的若干块
+#   L + 长度(8字节) + 数据：新文件中的字面数据
+OP_COPY = b"C"
+OP_LITERAL = b"L"
+COPY_HEADER = struct.Struct(">QQ")
+LITERAL_HEADER = struct.Struct(">Q")
+
+def choose_block_size(size):
+    """
+    根据文件大小选择分块大小，块数和每块的大小都约为文件大小的平方根
+
+    Args:
+        size: 文件大小（字节）
+
+    Returns:
+        int: 分块大小，1KB的整数倍
+    """
+    block_size = int(math.sqrt(size)) // 1024 * 1024
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, block_size))
+
+def strong_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def compute_signature(file_obj, block_size):
+    """
+    计算文件每个完整分块的签名，末尾不足一块的数据不参与匹配
+
+    Args:
+        file_obj: 以二进制模式打开的文件对象
+        block_size: 分块大小
+
+    Returns:
+        list: 每块的[弱校验和(Adler-32), 强校验和]
+    """
+    signatures = []
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    while True:
+        length = _read_full(file_obj, view)
+        if length < block_size:
+            break
+        signatures.append([zlib.adler32(view), strong_hash(view)])
+    return signatures
+
+def _read_full(file_obj, view):
+    """
+    读满缓冲区，数据流的一次read可能只返回部分数据
+
+    Returns:
+        int: 读取的字节数，小于缓冲区大小表示已到末尾
+    """
+    total = 0
+    while total < len(view):
+        if hasattr(file_obj, "readinto"):
+            length = file_obj.readinto(view[total:])
+        else:
+            data = file_obj.read(len(view) - total)
+            length = len(data)
+            view[total:total + length] = data
+        if not length:
+            break
+        total += length
+    return total
+
+def _read_exact(stream, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise ValueError("增量数据不完整")
+        data += chunk
+    return bytes(data)
+
+def iter_delta(signatures, block_size, file_obj):
+    """
+    按rsync算法对比新文件和服务端文件的签名，生成增量数据。
+    候选位置先用弱校验和查找，命中后再用强校验和确认。
+
+    逐字节滚动弱校验和由Python完成，大段修改过的数据上非常慢，因此默认只检查
+    与上一个匹配块对齐的位置（每块一次C实现的Adler-32），原位修改后未变化的块都在这些位置上。
+    连续若干块未匹配时才逐字节滚动一块的距离，找到插入或删除数据后错位的块，
+    滚动一块即覆盖所有可能的错位
+
+    Args:
+        signatures: 服务端文件的分块签名
+        block_size: 分块大小
+        file_obj: 以二进制模式打开的新文件
+
+    Yields:
+        bytes: 增量数据片段
+    """
+    table = {}
+    for index, (weak, strong) in enumerate(signatures):
+        table.setdefault(weak, {}).setdefault(strong, index)
+
+    buffer = bytearray()
+    pos = 0
+    literal_start = 0
+    eof = False
+    a = b = None
+    copy_start = copy_count = 0
+    # 连续未匹配的对齐位置数，达到roll_interval时逐字节滚动到roll_end
+    misses = 0
+    roll_interval = FIRST_ROLL_INTERVAL
+    roll_end = 0
+
+    def copy_op():
+        return OP_COPY + COPY_HEADER.pack(copy_start, copy_count)
+
+    while True:
+        if len(buffer) - pos < block_size and not eof:
+            # 丢弃已处理的数据，缓冲区大小与文件大小无关
+            del buffer[:literal_start]
+            pos -= literal_start
+            roll_end -= literal_start
+            literal_start = 0
+            data = file_obj.read(READ_SIZE)
+            if data:
+                buffer += data
+            else:
+                eof = True
+            continue
+        if len(buffer) - pos < block_size:
+            break
+
+        rolling = pos < roll_end
+        if a is None or not rolling:
+            checksum = zlib.adler32(buffer[pos:pos + block_size])
+            a, b = checksum & 0xffff, checksum >> 16
+        candidates = table.get((b << 16) | a)
+        if candidates:
+            index = candidates.get(strong_hash(buffer[pos:pos + block_size]))
+            if index is not None:
+                if pos > literal_start:
+                    if copy_count:
+                        yield copy_op()
+                        copy_count = 0
+                    yield OP_LITERAL + LITERAL_HEADER.pack(pos - literal_start) + bytes(buffer[literal_start:pos])
+                # 连续的块合并为一条复制记录
+                if copy_count and index == copy_start + copy_count:
+                    copy_count += 1
+                else:
+                    if copy_count:
+                        yield copy_op()
+                    copy_start, copy_count = index, 1
+                pos += block_size
+                literal_start = pos
+                a = None
+                misses = 0
+                roll_interval = FIRST_ROLL_INTERVAL
+                roll_end = 0
+                continue
+
+        if not rolling:
+            misses += 1
+            if misses < roll_interval:
+                # 跳过一整块，下一个检查的位置仍与上一个匹配块对齐
+                pos += block_size
+                a = None
+            else:
+                misses = 0
+                roll_interval = min(roll_interval * 2, MAX_ROLL_INTERVAL)
+                roll_end = pos + block_size
+                rolling = True
+        if rolling:
+            # 未匹配，窗口向后滚动一个字节
+            if pos + block_size < len(buffer):
+                out_byte, in_byte = buffer[pos], buffer[pos + block_size]
+                a = (a - out_byte + in_byte) % ADLER_MOD
+                b = (b - block_size * out_byte + a - 1) % ADLER_MOD
+            else:
+                a = None
+            pos += 1
+        if pos - literal_start >= MAX_LITERAL_SIZE:
+            if copy_count:
+                yield copy_op()
+                copy_count = 0
+            yield OP_LITERAL + LITERAL_HEADER.pack(pos - literal_start) + bytes(buffer[literal_start:pos])
+            literal_start = pos
+
+    if copy_count:
+        yield copy_op()
+    if len(buffer) > literal_start:
+        yield OP_LITERAL + LITERAL_HEADER.pack(len(buffer) - literal_start) + bytes(buffer[literal_start:])
+
+def apply_delta(base, delta_stream, dst, block_size, max_bytes=None, buffer_size=READ_SIZE):
+    """
+    根据服务端已有的文件和增量数据重建新文件
+
+    Args:
+        base: 服务端已有文件，需支持seek
+        delta_stream: 增量数据流
+        dst: 新文件的写入目标
+        block_size: 计算签名时使用的分块大小
+        max_bytes: 新文件的最大字节数，None表示不限制
+        buffer_size: 复制数据时的缓冲区大小
+
+    Returns:
+        int: 新文件的字节数
+
+    Raises:
+        ValueError: 增量数据格式错误或引用了不存在的块
+        UploadTooLargeError: 新文件超出max_bytes
+    """
+    from .file_utils import UploadTooLargeError
+
+    base_size = base.seek(0, os.SEEK_END)
+    written = 0
+    while True:
+        op = delta_stream.read(1)
+        if not op:
+            break
+        if op == OP_COPY:
+            start, count = COPY_HEADER.unpack(_read_exact(delta_stream, COPY_HEADER.size))
+            if (start + count) * block_size > base_size:
+                raise ValueError("增量数据引用了不存在的块")
+            length = count * block_size
+            base.seek(start * block_size)
+            source = base
+        elif op == OP_LITERAL:
+            (length,) = LITERAL_HEADER.unpack(_read_exact(delta_stream, LITERAL_HEADER.size))
+            source = delta_stream
+        else:
+            raise ValueError("增量数据格式错误")
+
+        if max_bytes is not None and written + length > max_bytes:
+            raise UploadTooLargeError(f"数据超出允许的大小: {max_bytes} 字节")
+        remaining = length
+        while remaining:
+            data = source.read(min(buffer_size, remaining))
+            if not data:
+                raise ValueError("增量数据不完整")
+            dst.write(data)
+            remaining -= len(data)
+        written += length
+    return written
+
+def upload_delta(server_url, file_path, base_filename, filename=None):
+    """
+    客户端辅助函数：获取服务端已有文件的签名，只上传新文件中变化的部分
+
+    Args:
+        server_url: 服务地址，如http://192.168.1.10:5000
+        file_path: 本地新文件路径
+        base_filename: 服务端已有的旧版本文件名
+        filename: 保存的文件名，默认与本地文件同名
+
+    Returns:
+        tuple: (服务端返回的结果, 发送的增量数据字节数)
+    """
+    filename = filename or os.path.basename(file_path)
+    quoted_base = urllib.parse.quote(base_filename)
+    with urllib.request.urlopen(f"{server_url}/api/signature/{quoted_base}") as response:
+        signature = json.loads(response.read())
+    if not signature.get("success"):
+        raise RuntimeError(signature.get("message", "获取签名失败"))
+
+    sent = 0
+
+    def body(f):
+        nonlocal sent
+        for data in iter_delta(signature["signatures"], signature["block_size"], f):
+            sent += len(data)
+            yield data
+
+    url = urllib.parse.urlsplit(server_url)
+    query = urllib.parse.urlencode({
+        "base": base_filename,
+        "filename": filename,
+        "block_size": signature["block_size"],
+        "size": os.path.getsize(file_path)
+    })
+    conn = http.client.HTTPConnection(url.hostname, url.port)
+    try:
+        with open(file_path, "rb") as f:
+            # 增量数据边计算边发送，长度事先未知，使用分块传输编码
+            conn.request("POST", f"/upload/delta?{query}", body=body(f), encode_chunked=True,
+                         headers={"Content-Type": "application/octet-stream"})
+        return json.loads(conn.getresponse().read()), sent
+    finally:
+        conn.close()
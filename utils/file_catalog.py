@@ -0,0 +1,243 @@
+import os
+import sqlite3
+import threading
+import time
+from .logger import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT,
+    uploader TEXT,
+    original_name TEXT,
+    uploaded_at REAL,
+    download_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_folder_mtime ON files (folder, mtime_ns);
+CREATE INDEX IF NOT EXISTS files_size ON files (size);
+CREATE INDEX IF NOT EXISTS files_uploader ON files (uploader, mtime_ns);
+CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+CREATE TABLE IF NOT EXISTS tags (
+    path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (path, tag)
+);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+"""
+
+# 排序字段对应的列，与FileIndex的排序键一致：修改时间的排序键取负值，名称不区分大小写
+SORT_COLUMNS = {"mtime": "mtime_ns", "name": "name_key", "size": "size"}
+# 一条语句中最多绑定的参数个数，旧版SQLite的上限为999
+MAX_VARIABLES = 500
+# 单个标签的最大长度和每个文件的最多标签数
+MAX_TAG_LENGTH = 64
+MAX_TAGS = 32
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+class FileCatalog:
+    """
+    文件元数据目录，保存在上传目录内的SQLite数据库（WAL模式）中。
+    除文件列表索引已有的大小、修改时间和校验和外，还记录上传者、原始文件名、下载次数和标签，
+    按上传者、标签、校验和查询时由数据库的索引完成，耗时与结果数有关而与文件总数无关。
+    文件的增删改由FileUtils根据文件列表索引的变更记录同步过来
+    """
+
+    def __init__(self, db_path):
+        """
+        打开或创建元数据目录
+
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.lock = threading.Lock()
+        # 请求处理线程共用一个连接，由锁保证同一时间只有一个线程使用
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # WAL模式下NORMAL只在检查点时同步，断电最多丢失最近的事务，数据库不会损坏
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _upsert_locked(self, rows):
+        """
+        加入或更新文件，保留上传者、下载次数等只在目录中记录的信息，调用方需持有锁
+
+        Args:
+            rows: (路径, 文件夹, 名称, 大小, 修改时间纳秒, 校验和)列表
+        """
+        self.connection.executemany(
+            "INSERT INTO files (path, folder, name, name_key, size, mtime_ns, sha256) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+            "sha256 = excluded.sha256",
+            [(path, folder, name, name.lower(), size, mtime_ns, sha256)
+             for path, folder, name, size, mtime_ns, sha256 in rows])
+
+    def apply(self, rows, removed):
+        """
+        在一个事务中应用一批变化
+
+        Args:
+            rows: 新增或修改的文件，见_upsert_locked
+            removed: 删除的文件路径列表
+        """
+        with self.lock, self.connection:
+            self._upsert_locked(rows)
+            self.connection.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+
+    def reconcile(self, rows):
+        """
+        与上传目录中的实际文件核对：加入目录中没有记录的文件，更新有变化的，删除已不存在的。
+        启动时以及文件列表索引重置后调用
+
+        Args:
+            rows: 上传目录中所有文件，见_upsert_locked
+
+        Returns:
+            tuple: (加入或更新的文件数, 删除的文件数)
+        """
+        with self.lock, self.connection:
+            existing = {path: (size, mtime_ns, sha256) for path, size, mtime_ns, sha256
+                        in self.connection.execute("SELECT path, size, mtime_ns, sha256 FROM files")}
+            changed = [row for row in rows if existing.pop(row[0], None) != tuple(row[3:])]
+            self._upsert_locked(changed)
+            self.connection.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in existing])
+        if changed or existing:
+            logger.info(f"文件元数据目录已与上传目录核对: 更新 {len(changed)} 个，删除 {len(existing)} 个")
+        return len(changed), len(existing)
+
+    def record_upload(self, path, uploader, original_name):
+        """
+        记录文件的上传者和原始文件名，文件重新上传时下载次数清零
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE files SET uploader = ?, original_name = ?, uploaded_at = ?, download_count = 0 "
+                "WHERE path = ?", (uploader, original_name, time.time(), path))
+
+    def record_download(self, path):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE files SET download_count = download_count + 1 WHERE path = ?", (path,))
+
+    def set_tags(self, path, tags):
+        """
+        替换文件的标签
+
+        Args:
+            path: 文件路径
+            tags: 标签列表，去掉首尾空白后重复和空的标签被忽略
+
+        Returns:
+            bool: 目录中有该文件返回True
+
+        Raises:
+            ValueError: 标签过长或过多
+        """
+        tags = list(dict.fromkeys(tag.strip() for tag in tags if tag.strip()))
+        if len(tags) > MAX_TAGS:
+            raise ValueError(f"每个文件最多{MAX_TAGS}个标签")
+        if any(len(tag) > MAX_TAG_LENGTH for tag in tags):
+            raise ValueError(f"标签最长{MAX_TAG_LENGTH}个字符")
+        with self.lock, self.connection:
+            if self.connection.execute("SELECT 1 FROM files WHERE path = ?", (path,)).fetchone() is None:
+                return False
+            self.connection.execute("DELETE FROM tags WHERE path = ?", (path,))
+            self.connection.executemany("INSERT INTO tags (path, tag) VALUES (?, ?)", [(path, tag) for tag in tags])
+            return True
+
+    def get_metadata(self, paths):
+        """
+        批量获取文件在目录中记录的信息
+
+        Args:
+            paths: 文件路径列表
+
+        Returns:
+            dict: 文件路径到{uploader, original_name, uploaded_at, download_count, tags}的映射，
+                  目录中没有的文件不在其中
+        """
+        metadata = {}
+        with self.lock:
+            for start in range(0, len(paths), MAX_VARIABLES):
+                chunk = paths[start:start + MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                for path, uploader, original_name, uploaded_at, download_count in self.connection.execute(
+                        "SELECT path, uploader, original_name, uploaded_at, download_count FROM files "
+                        f"WHERE path IN ({placeholders})", chunk):
+                    metadata[path] = {"uploader": uploader, "original_name": original_name,
+                                      "uploaded_at": uploaded_at, "download_count": download_count, "tags": []}
+                for path, tag in self.connection.execute(
+                        f"SELECT path, tag FROM tags WHERE path IN ({placeholders}) ORDER BY tag", chunk):
+                    metadata[path]["tags"].append(tag)
+        return metadata
+
+    def query(self, folder="", sort="mtime", descending=True, limit=100, cursor_key=None, extensions=None,
+              min_size=None, max_size=None, since=None, until=None, prefix=None, uploader=None, tag=None,
+              sha256=None):
+        """
+        分页查询文件夹中直接包含的文件，条件与排序方式同FileIndex.query，另外可按上传者、标签、校验和筛选
+
+        Args:
+            cursor_key: 上一页最后一个文件的排序键，None表示第一页
+            uploader: 上传者的用户ID
+            tag: 标签
+            sha256: 文件内容的SHA-256
+            其余参数见FileIndex.query，folder为None时不限文件夹
+
+        Returns:
+            tuple: (文件路径列表, 最后一个文件的排序键（没有下一页时为None）, 符合条件的文件总数)
+        """
+        conditions, params = [], []
+        if folder is not None:
+            conditions.append("folder = ?")
+            params.append(folder)
+        if extensions:
+            conditions.append("(" + " OR ".join("name_key LIKE ? ESCAPE '\\'" for _ in extensions) + ")")
+            params += [f"%.{_escape_like(ext)}" for ext in extensions]
+        for condition, value in (("size >= ?", min_size), ("size <= ?", max_size), ("mtime_ns >= ?", since),
+                                 ("mtime_ns <= ?", until), ("uploader = ?", uploader), ("sha256 = ?", sha256),
+                                 ("path IN (SELECT path FROM tags WHERE tag = ?)", tag)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        if prefix:
+            # 与名称排序键相同，按Unicode码位比较前缀范围
+            conditions.append("name_key >= ? AND name_key < ?")
+            params += [prefix.lower(), prefix.lower() + "\U0010ffff"]
+        where = " AND ".join(conditions) or "1"
+
+        column = SORT_COLUMNS[sort]
+        # 排序键升序即为按修改时间倒序，或按名称、大小正序
+        key_ascending = descending if sort == "mtime" else not descending
+        column_descending = key_ascending if sort == "mtime" else not key_ascending
+        page_conditions, page_params = [where], list(params)
+        if cursor_key is not None:
+            value = -cursor_key[0] if sort == "mtime" else cursor_key[0]
+            page_conditions.append(f"({column} {'<' if column_descending else '>'} ? OR "
+                                   f"({column} = ? AND path {'>' if key_ascending else '<'} ?))")
+            page_params += [value, value, cursor_key[1]]
+        order = f"{column} {'DESC' if column_descending else 'ASC'}, path {'ASC' if key_ascending else 'DESC'}"
+
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT path, {column} FROM files WHERE {' AND '.join(page_conditions)} ORDER BY {order} LIMIT ?",
+                page_params + [limit + 1]).fetchall()
+            total = self.connection.execute(f"SELECT COUNT(*) FROM files WHERE {where}", params).fetchone()[0]
+        next_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            path, value = rows[-1]
+            next_key = (-value if sort == "mtime" else value, path)
+        return [path for path, _ in rows], next_key, total
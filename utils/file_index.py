@@ -0,0 +1,790 @@
+import base64
+import bisect
+import json
+import os
+import stat
+import threading
+from collections import deque
+from .logger import logger
+from .search_index import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, TrigramIndex
+
+# 支持的排序字段，每个字段在索引中维护一个有序的排序键列表
+SORT_FIELDS = ("mtime", "name", "size")
+# 分页查询默认每页的文件数和上限
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# 比任何文件名字符都大，用于确定前缀范围的上界
+MAX_CHAR = "\U0010ffff"
+# 保留的变更记录条数，落后更多的客户端需要重新获取完整列表
+CHANGE_LOG_SIZE = 10000
+
+def split_path(path):
+    """
+    拆分上传目录内以/分隔的相对路径
+
+    Returns:
+        tuple: (所在文件夹路径, 名称)，根目录下的文件所在文件夹为""
+    """
+    folder, _, name = path.rpartition("/")
+    return folder, name
+
+def _ancestors(folder):
+    """
+    依次返回文件夹本身及其各级上级文件夹，直到根目录""
+    """
+    while True:
+        yield folder
+        if not folder:
+            return
+        folder = split_path(folder)[0]
+
+def _make_sort_keys(path, info, file_stats):
+    """
+    生成文件在各排序字段下的排序键，键的最后一项都是文件路径，保证唯一
+
+    Returns:
+        dict: 排序字段到排序键的映射
+    """
+    return {
+        # 取负值使最新的文件排在前面
+        "mtime": (-file_stats.st_mtime_ns, path),
+        "name": (split_path(path)[1].lower(), path),
+        "size": (info["size"], path)
+    }
+
+def encode_cursor(sort, descending, key):
+    """
+    把上一页最后一个文件的排序键编码为游标
+
+    Returns:
+        str: 游标
+    """
+    data = json.dumps([sort, descending, list(key)], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, sort, descending):
+    """
+    解析游标
+
+    Args:
+        cursor: encode_cursor生成的游标
+        sort: 本次查询的排序字段
+        descending: 本次查询是否倒序
+
+    Returns:
+        tuple: 排序键
+
+    Raises:
+        ValueError: 游标无效，或与本次查询的排序方式不一致
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, cursor_descending, key = json.loads(data.decode("utf-8"))
+    except (ValueError, TypeError):
+        raise ValueError("无效的游标")
+    if cursor_sort != sort or cursor_descending != descending:
+        raise ValueError("游标与排序方式不一致")
+    first_type = str if sort == "name" else int
+    if (not isinstance(key, list) or len(key) != 2 or type(key[0]) is not first_type
+            or not isinstance(key[1], str)):
+        raise ValueError("无效的游标")
+    return tuple(key)
+
+def parse_page_options(sort, descending, limit, cursor):
+    """
+    检查分页查询的排序方式、页大小和游标
+
+    Args:
+        sort: 排序字段，见SORT_FIELDS
+        descending: 是否倒序，None时按修改时间和大小倒序、按名称正序
+        limit: 每页的文件数
+        cursor: 上一页返回的游标，None表示第一页
+
+    Returns:
+        tuple: (是否倒序, 游标中的排序键，第一页为None)
+
+    Raises:
+        ValueError: 参数或游标无效
+    """
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"不支持的排序字段: {sort}")
+    if descending is None:
+        descending = sort != "name"
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"每页文件数应在1到{MAX_PAGE_SIZE}之间")
+    return descending, decode_cursor(cursor, sort, descending) if cursor else None
+
+class _SortedFiles:
+    """
+    一组按各排序字段分别有序排列的文件
+    """
+
+    def __init__(self):
+        # 各字段的有序排序键列表
+        self.orders = {field: [] for field in SORT_FIELDS}
+        # 与按修改时间倒序排列的排序键一一对应的文件信息
+        self.files = []
+        # 上次生成的文件列表，变化后重新生成
+        self.snapshot = None
+
+    def __len__(self):
+        return len(self.files)
+
+    def load(self, keys_list, entries):
+        """
+        一次性载入多个文件，比逐个插入快
+        """
+        self.orders = {field: sorted(keys[field] for keys in keys_list) for field in SORT_FIELDS}
+        self.files = [entries[key[-1]] for key in self.orders["mtime"]]
+        self.snapshot = None
+
+    def insert(self, keys, info):
+        for field, key in keys.items():
+            order = self.orders[field]
+            index = bisect.bisect_left(order, key)
+            order.insert(index, key)
+            if field == "mtime":
+                self.files.insert(index, info)
+        self.snapshot = None
+
+    def remove(self, keys):
+        for field, key in keys.items():
+            order = self.orders[field]
+            index = bisect.bisect_left(order, key)
+            del order[index]
+            if field == "mtime":
+                del self.files[index]
+        self.snapshot = None
+
+    def list(self):
+        if self.snapshot is None:
+            # 返回副本，之后的增量更新不影响正在使用旧列表的调用方
+            self.snapshot = self.files.copy()
+        return self.snapshot
+
+class _Folder:
+    """
+    索引中的一个文件夹，保存直接包含的文件、子文件夹，
+    以及包括各级子文件夹在内的文件数和总大小
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = _SortedFiles()
+        self.subfolders = set()
+        self.file_count = 0
+        self.total_size = 0
+
+    def describe(self):
+        """
+        Returns:
+            dict: 文件夹信息
+        """
+        return {
+            "name": split_path(self.path)[1],
+            "path": self.path,
+            "file_count": self.file_count,
+            "folder_count": len(self.subfolders),
+            "size": self.total_size
+        }
+
+class FileIndex:
+    """
+    文件列表索引类，在内存中保存上传目录树的文件列表。
+    首次使用时扫描一次目录树，之后由保存、删除文件时增量更新，
+    获取列表时无需再读取目录和逐个stat。
+    每个文件夹的文件按各排序字段各维护一个有序列表，分页查询按游标二分定位，耗时只与页大小有关；
+    每个文件夹记录包括子文件夹在内的文件数和总大小，文件变化时只更新其各级上级文件夹，
+    浏览文件夹的耗时与目录树的大小无关。
+    每次变化递增版本号并记录变化的文件，用于向客户端推送增量变化。
+    文件名和文件夹名另有三元组索引，随文件变化增量更新，用于搜索。
+    文件以上传目录内以/分隔的相对路径标识，以.开头的内部目录不在索引中
+    """
+
+    def __init__(self, upload_dir, describe):
+        """
+        初始化文件列表索引
+
+        Args:
+            upload_dir: 上传目录
+            describe: 生成文件信息的函数，参数为(文件路径, os.stat结果)，返回文件信息字典
+        """
+        self.upload_dir = upload_dir
+        self.describe = describe
+        self.lock = threading.Lock()
+        # 文件路径到文件信息的映射
+        self.entries = {}
+        # 文件路径到各字段排序键的映射
+        self.sort_keys = {}
+        # 整个目录树中的文件
+        self.all_files = _SortedFiles()
+        # 文件夹路径到文件夹的映射，根目录为""
+        self.folders = {"": _Folder("")}
+        # 文件和文件夹名称的搜索索引
+        self.search_index = TrigramIndex()
+        self.loaded = False
+        # 文件列表的版本号，每次变化加一
+        self.version = 0
+        # 变更记录，每项为(版本号, 路径, 变化前文件是否存在)，文件夹的变化记为None
+        self.changes = deque()
+        # 能计算增量变化的最早版本号，更早的变更记录已丢弃
+        self.log_start = 0
+
+    def _ensure_loaded(self):
+        """
+        首次使用时扫描上传目录，调用方需持有锁
+        """
+        if self.loaded:
+            return
+        self.entries.clear()
+        self.sort_keys.clear()
+        self.folders = {"": _Folder("")}
+        self.search_index.clear()
+        self._scan_locked("")
+        self.all_files.load(list(self.sort_keys.values()), self.entries)
+        self.loaded = True
+
+    def _scan_locked(self, folder):
+        """
+        扫描文件夹及其各级子文件夹，把其中的文件加入索引（all_files除外），调用方需持有锁
+
+        Returns:
+            list: 加入的文件路径
+        """
+        added = []
+        pending = [folder]
+        while pending:
+            current = pending.pop()
+            node = self._add_folder_locked(current)
+            keys_list = []
+            try:
+                # scandir返回的目录项自带文件类型，无需额外stat
+                with os.scandir(os.path.join(self.upload_dir, current)) as entries:
+                    for entry in entries:
+                        path = f"{current}/{entry.name}" if current else entry.name
+                        if entry.is_dir(follow_symlinks=False):
+                            # 跳过临时目录、blob目录等以.开头的内部目录
+                            if not entry.name.startswith("."):
+                                pending.append(path)
+                        elif entry.is_file():
+                            file_stats = entry.stat()
+                            info = self.describe(path, file_stats)
+                            keys = _make_sort_keys(path, info, file_stats)
+                            self.entries[path] = info
+                            self.sort_keys[path] = keys
+                            self.search_index.add(path, entry.name)
+                            keys_list.append(keys)
+                            self._adjust_totals(current, 1, info["size"])
+                            added.append(path)
+            except OSError as e:
+                logger.error(f"扫描文件夹失败: {current}, {e}")
+            node.files.load(keys_list, self.entries)
+        return added
+
+    def _add_folder_locked(self, path):
+        """
+        确保文件夹及其各级上级文件夹在索引中，调用方需持有锁
+
+        Returns:
+            _Folder: 文件夹
+        """
+        node = self.folders.get(path)
+        if node is None:
+            parent, name = split_path(path)
+            self._add_folder_locked(parent).subfolders.add(path)
+            node = self.folders[path] = _Folder(path)
+            self.search_index.add(path, name)
+        return node
+
+    def _adjust_totals(self, folder, count, size):
+        for path in _ancestors(folder):
+            node = self.folders[path]
+            node.file_count += count
+            node.total_size += size
+
+    def _record_change(self, path, existed):
+        """
+        记录一次变化，调用方需持有锁
+
+        Args:
+            path: 文件或文件夹路径
+            existed: 变化前文件是否存在，文件夹的变化为None
+        """
+        self.version += 1
+        self.changes.append((self.version, path, existed))
+        if len(self.changes) > CHANGE_LOG_SIZE:
+            self.log_start = self.changes.popleft()[0]
+
+    def _insert_locked(self, path, info, keys):
+        folder = split_path(path)[0]
+        self.folders[folder].files.insert(keys, info)
+        self.all_files.insert(keys, info)
+        self.entries[path] = info
+        self.sort_keys[path] = keys
+        self.search_index.add(path, split_path(path)[1])
+        self._adjust_totals(folder, 1, info["size"])
+
+    def _remove_locked(self, path):
+        keys = self.sort_keys.pop(path, None)
+        if keys is None:
+            return False
+        info = self.entries.pop(path)
+        folder = split_path(path)[0]
+        self.folders[folder].files.remove(keys)
+        self.all_files.remove(keys)
+        self.search_index.remove(path)
+        self._adjust_totals(folder, -1, -info["size"])
+        return True
+
+    def _subtree(self, path):
+        """
+        Returns:
+            list: 文件夹及其各级子文件夹
+        """
+        nodes = [self.folders[path]]
+        for node in nodes:
+            nodes.extend(self.folders[subfolder] for subfolder in node.subfolders)
+        return nodes
+
+    def _remove_folder_locked(self, path):
+        """
+        从索引中移除文件夹及其中的所有文件，调用方需持有锁
+        """
+        for node in self._subtree(path):
+            for key in list(node.files.orders["mtime"]):
+                self._remove_locked(key[-1])
+                self._record_change(key[-1], True)
+        for node in self._subtree(path):
+            del self.folders[node.path]
+            self.search_index.remove(node.path)
+        self.folders[split_path(path)[0]].subfolders.discard(path)
+        self._record_change(path, None)
+
+    def update(self, path):
+        """
+        文件新建或修改后更新索引，文件已不存在时从索引中移除。
+        路径是文件夹时：新出现的文件夹扫描后加入索引，已不存在的文件夹连同其中的文件一起移除
+
+        Args:
+            path: 文件路径
+
+        Returns:
+            dict or None: 更新后的文件信息，文件不存在时返回None
+        """
+        if any(part.startswith(".") for part in path.split("/")):
+            # 临时目录、blob目录等内部目录
+            return None
+        file_path = os.path.join(self.upload_dir, path)
+        with self.lock:
+            if not self.loaded:
+                # 尚未扫描过目录，首次获取列表时会一并读取
+                return None
+            try:
+                file_stats = os.stat(file_path)
+            except FileNotFoundError:
+                file_stats = None
+            if file_stats is not None and stat.S_ISDIR(file_stats.st_mode):
+                if path not in self.folders:
+                    # 外部复制或移入的文件夹
+                    for added in self._scan_locked(path):
+                        self.all_files.insert(self.sort_keys[added], self.entries[added])
+                        self._record_change(added, False)
+                    self._record_change(path, None)
+                return None
+            if file_stats is None and path in self.folders:
+                self._remove_folder_locked(path)
+                return None
+            old_info = self.entries.get(path)
+            old_keys = self.sort_keys.get(path)
+            if file_stats is None or not stat.S_ISREG(file_stats.st_mode):
+                if self._remove_locked(path):
+                    self._record_change(path, True)
+                return None
+            info = self.describe(path, file_stats)
+            keys = _make_sort_keys(path, info, file_stats)
+            if info == old_info and keys == old_keys:
+                return old_info
+            self._remove_locked(path)
+            folder = split_path(path)[0]
+            if folder not in self.folders:
+                # 上级文件夹是刚在外部创建的
+                self._add_folder_locked(folder)
+                self._record_change(folder, None)
+            self._insert_locked(path, info, keys)
+            self._record_change(path, old_info is not None)
+            return info
+
+    def sync(self, filenames):
+        """
+        按外部发生的变化更新索引
+
+        Args:
+            filenames: 变化的文件或文件夹路径集合
+
+        Returns:
+            bool: 文件列表是否有变化
+        """
+        with self.lock:
+            version = self.version
+        for filename in filenames:
+            self.update(filename)
+        with self.lock:
+            return self.version != version
+
+    def remove(self, path):
+        """
+        文件删除后从索引中移除
+
+        Args:
+            path: 文件路径
+
+        Returns:
+            bool: 索引中有该文件返回True
+        """
+        with self.lock:
+            if not self._remove_locked(path):
+                return False
+            self._record_change(path, True)
+            return True
+
+    def add_folder(self, path):
+        """
+        文件夹创建后加入索引
+
+        Args:
+            path: 文件夹路径
+
+        Returns:
+            bool: 索引中原来没有该文件夹返回True
+        """
+        with self.lock:
+            if not self.loaded or path in self.folders:
+                return False
+            self._add_folder_locked(path)
+            self._record_change(path, None)
+            return True
+
+    def remove_folder(self, path):
+        """
+        文件夹删除后连同其中的文件一起从索引中移除
+
+        Args:
+            path: 文件夹路径，不能是根目录
+
+        Returns:
+            bool: 索引中有该文件夹返回True
+        """
+        with self.lock:
+            if not path or path not in self.folders:
+                return False
+            self._remove_folder_locked(path)
+            return True
+
+    def get(self, path):
+        """
+        获取单个文件的信息
+
+        Returns:
+            dict or None: 文件信息，不存在时返回None
+        """
+        with self.lock:
+            self._ensure_loaded()
+            return self.entries.get(path)
+
+    def mtime_ns(self, path):
+        """
+        Returns:
+            int or None: 文件的纳秒级修改时间，不存在时返回None
+        """
+        with self.lock:
+            keys = self.sort_keys.get(path)
+            return -keys["mtime"][0] if keys is not None else None
+
+    def get_folder(self, path):
+        """
+        获取文件夹的信息
+
+        Returns:
+            dict or None: 文件夹信息，不存在时返回None
+        """
+        with self.lock:
+            self._ensure_loaded()
+            node = self.folders.get(path)
+            return node.describe() if node is not None else None
+
+    def list_folders(self, path):
+        """
+        获取文件夹的子文件夹，按名称排序
+
+        Returns:
+            list: 子文件夹信息列表
+
+        Raises:
+            FileNotFoundError: 文件夹不存在
+        """
+        with self.lock:
+            self._ensure_loaded()
+            node = self.folders.get(path)
+            if node is None:
+                raise FileNotFoundError(path)
+            subfolders = sorted(node.subfolders, key=lambda subfolder: (subfolder.lower(), subfolder))
+            return [self.folders[subfolder].describe() for subfolder in subfolders]
+
+    def folder_files(self, path):
+        """
+        获取文件夹及其各级子文件夹中的所有文件路径
+
+        Returns:
+            list: 文件路径列表
+
+        Raises:
+            FileNotFoundError: 文件夹不存在
+        """
+        with self.lock:
+            self._ensure_loaded()
+            if path not in self.folders:
+                raise FileNotFoundError(path)
+            return [key[-1] for node in self._subtree(path) for key in node.files.orders["name"]]
+
+    def list(self):
+        """
+        获取整个目录树中按修改时间倒序排列的文件列表，索引未变化时直接返回上次生成的列表，
+        调用方不应修改返回的列表
+
+        Returns:
+            list: 文件信息列表
+        """
+        return self.versioned_list()[0]
+
+    def versioned_list(self):
+        """
+        获取文件列表及其版本号，两者一致，客户端之后可从该版本开始应用增量变化
+
+        Returns:
+            tuple: (文件信息列表, 版本号)
+        """
+        with self.lock:
+            self._ensure_loaded()
+            return self.all_files.list(), self.version
+
+    def changes_since(self, base):
+        """
+        计算从某个版本到当前版本的增量变化，同一文件的多次变化合并为最终状态
+
+        Args:
+            base: 起始版本号
+
+        Returns:
+            dict or None: 包含base、version、added（新增的文件信息）、changed（修改后的文件信息）、
+                removed（删除的文件路径）、folders（新建或删除的文件夹路径）；
+                变更记录已不完整时返回None，需要重新获取完整列表
+        """
+        with self.lock:
+            if base < self.log_start or base > self.version:
+                return None
+            # 从后往前遍历，最终保留每个文件在base之后的第一次变化前是否存在
+            existed_before = {}
+            folders = set()
+            for version, path, existed in reversed(self.changes):
+                if version <= base:
+                    break
+                if existed is None:
+                    folders.add(path)
+                else:
+                    existed_before[path] = existed
+            added, changed, removed = [], [], []
+            for path, existed in existed_before.items():
+                info = self.entries.get(path)
+                if info is None:
+                    if existed:
+                        removed.append(path)
+                elif existed:
+                    changed.append(info)
+                else:
+                    added.append(info)
+            return {"base": base, "version": self.version, "added": added, "changed": changed,
+                    "removed": removed, "folders": sorted(folders)}
+
+    def count(self, folder=""):
+        """
+        Args:
+            folder: 文件夹路径
+
+        Returns:
+            int: 文件夹中直接包含的文件数
+
+        Raises:
+            FileNotFoundError: 文件夹不存在
+        """
+        with self.lock:
+            self._ensure_loaded()
+            node = self.folders.get(folder)
+            if node is None:
+                raise FileNotFoundError(folder)
+            return len(node.files)
+
+    def names_with_prefix(self, folder, prefix):
+        """
+        获取文件夹中直接包含的、以指定前缀开头的文件名，在按名称排序的列表上二分确定范围
+
+        Args:
+            folder: 文件夹路径，根目录为""
+            prefix: 文件名前缀，不区分大小写
+
+        Returns:
+            list: 文件名列表，文件夹不存在时为空列表
+        """
+        prefix = prefix.lower()
+        with self.lock:
+            self._ensure_loaded()
+            node = self.folders.get(folder)
+            if node is None:
+                return []
+            order = node.files.orders["name"]
+            low = bisect.bisect_left(order, (prefix,))
+            high = bisect.bisect_left(order, (prefix + MAX_CHAR,))
+            return [split_path(key[-1])[1] for key in order[low:high]]
+
+    def query(self, folder="", sort="mtime", descending=None, limit=DEFAULT_PAGE_SIZE, cursor=None,
+              extensions=None, min_size=None, max_size=None, since=None, until=None, prefix=None):
+        """
+        分页查询文件夹中直接包含的文件
+
+        排序字段上的筛选条件（按修改时间排序时的时间范围、按大小排序时的大小范围、
+        按名称排序时的前缀）先在有序列表上二分确定范围，其余条件逐个检查，
+        找满一页即停止，不遍历整个文件夹
+
+        Args:
+            folder: 文件夹路径，根目录为""
+            sort: 排序字段，见SORT_FIELDS
+            descending: 是否倒序，None时按修改时间和大小倒序、按名称正序
+            limit: 每页的文件数
+            cursor: 上一页返回的游标，None表示第一页
+            extensions: 扩展名集合（小写，不含点）
+            min_size: 最小文件大小（字节，含）
+            max_size: 最大文件大小（字节，含）
+            since: 最早修改时间（纳秒时间戳，含）
+            until: 最晚修改时间（纳秒时间戳，含）
+            prefix: 文件名前缀，不区分大小写
+
+        Returns:
+            tuple: (文件信息列表, 下一页的游标)，没有下一页时游标为None
+
+        Raises:
+            ValueError: 参数或游标无效
+            FileNotFoundError: 文件夹不存在
+        """
+        descending, cursor_key = parse_page_options(sort, descending, limit, cursor)
+        prefix = prefix.lower() if prefix else None
+
+        def matches(path):
+            info = self.entries[path]
+            name = split_path(path)[1]
+            if extensions and os.path.splitext(name)[1][1:].lower() not in extensions:
+                return False
+            if min_size is not None and info["size"] < min_size:
+                return False
+            if max_size is not None and info["size"] > max_size:
+                return False
+            mtime_ns = -self.sort_keys[path]["mtime"][0]
+            if since is not None and mtime_ns < since:
+                return False
+            if until is not None and mtime_ns > until:
+                return False
+            return not prefix or name.lower().startswith(prefix)
+
+        with self.lock:
+            self._ensure_loaded()
+            node = self.folders.get(folder)
+            if node is None:
+                raise FileNotFoundError(folder)
+            order = node.files.orders[sort]
+            # 按排序字段上的条件确定范围[low, high)
+            low, high = 0, len(order)
+            if sort == "mtime":
+                if until is not None:
+                    low = bisect.bisect_left(order, (-until,))
+                if since is not None:
+                    high = bisect.bisect_left(order, (-since + 1,))
+            elif sort == "size":
+                if min_size is not None:
+                    low = bisect.bisect_left(order, (min_size,))
+                if max_size is not None:
+                    high = bisect.bisect_left(order, (max_size + 1,))
+            elif prefix:
+                low = bisect.bisect_left(order, (prefix,))
+                high = bisect.bisect_left(order, (prefix + MAX_CHAR,))
+            # 修改时间的排序键取了负值，有序列表本身即为倒序
+            forward = descending if sort == "mtime" else not descending
+            if forward:
+                if cursor_key is not None:
+                    low = max(low, bisect.bisect_right(order, cursor_key))
+                indexes = range(low, high)
+            else:
+                if cursor_key is not None:
+                    high = min(high, bisect.bisect_left(order, cursor_key))
+                indexes = range(high - 1, low - 1, -1)
+
+            files = []
+            next_cursor = None
+            for position, index in enumerate(indexes):
+                key = order[index]
+                if not matches(key[-1]):
+                    continue
+                files.append(self.entries[key[-1]])
+                if len(files) == limit:
+                    # 范围内还有文件时给出游标，不再检查它们是否满足条件，最后一页可能为空
+                    if position + 1 < len(indexes):
+                        next_cursor = encode_cursor(sort, descending, key)
+                    break
+        return files, next_cursor
+
+    def search(self, query, folder="", limit=DEFAULT_SEARCH_LIMIT):
+        """
+        按名称搜索文件夹及其各级子文件夹中的文件和文件夹，不读取目录
+
+        Args:
+            query: 查询，匹配名称的子串，不区分大小写；没有子串匹配时也返回相近的名称
+            folder: 搜索范围的文件夹路径，根目录为""
+            limit: 最多返回的结果数
+
+        Returns:
+            list: 结果列表，匹配程度高的在前，文件为文件信息，文件夹为文件夹信息，type分别为file和folder
+
+        Raises:
+            ValueError: 参数无效
+            FileNotFoundError: 文件夹不存在
+        """
+        if not 1 <= limit <= MAX_SEARCH_LIMIT:
+            raise ValueError(f"结果数应在1到{MAX_SEARCH_LIMIT}之间")
+        prefix = folder + "/"
+        with self.lock:
+            self._ensure_loaded()
+            if folder not in self.folders:
+                raise FileNotFoundError(folder)
+            accept = (lambda path: path.startswith(prefix)) if folder else None
+            results = []
+            for path in self.search_index.search(query, limit, accept):
+                info = self.entries.get(path)
+                if info is not None:
+                    results.append({**info, "type": "file"})
+                else:
+                    results.append({**self.folders[path].describe(), "type": "folder"})
+            return results
+
+    def reset(self):
+        """
+        丢弃索引，下次使用时重新扫描目录
+        """
+        with self.lock:
+            self.loaded = False
+            self.entries.clear()
+            self.sort_keys.clear()
+            self.all_files = _SortedFiles()
+            self.folders = {"": _Folder("")}
+            self.search_index.clear()
+            # 重置前的版本无法再计算增量变化
+            self.version += 1
+            self.changes.clear()
+            self.log_start = self.version
+            logger.info("文件列表索引已重置")
@@ -1,8 +1,137 @@
+import atexit
+import hashlib
 import os
 import shutil
+import sqlite3
+import threading
+import uuid
 from datetime import datetime
+from .blob_store import BlobStore, hash_file
+from .checksum_index import ChecksumIndex
+from .file_catalog import FileCatalog
+from .file_index import DEFAULT_PAGE_SIZE, FileIndex, encode_cursor, parse_page_options, split_path
+from .search_index import DEFAULT_SEARCH_LIMIT
+from .compression import CompressingFile, is_compressible, open_decompressed
+from .delta import apply_delta, choose_block_size, compute_signature
+from .variant_cache import VariantCache
+from .thumbnail import ThumbnailCache, thumbnail_kind, render_image, render_video
 from .logger import logger
 
+# 流式读写时使用的缓冲区大小
+COPY_BUFFER_SIZE = 1024 * 1024
+
+class UploadTooLargeError(Exception):
+    """
+    上传数据超出允许的大小
+    """
+    pass
+
+class InsufficientSpaceError(Exception):
+    """
+    磁盘剩余空间不足以接收上传
+    """
+    pass
+
+def normalize_path(path):
+    """
+    规范化上传目录内的相对路径，文件夹之间以/分隔
+    
+    Args:
+        path: 相对路径，可以使用/或\\分隔，根目录为""
+    
+    Returns:
+        str: 规范化后的路径
+    
+    Raises:
+        ValueError: 路径包含..或以.开头的名称（上传目录中的内部目录）
+    """
+    parts = [part for part in path.replace("\\", "/").split("/") if part]
+    for part in parts:
+        if part.startswith("."):
+            raise ValueError(f"无效的路径: {path}")
+    return "/".join(parts)
+
+def join_path(folder, name):
+    """
+    拼接文件夹路径和名称
+    
+    Returns:
+        str: 相对路径
+    """
+    return f"{folder}/{name}" if folder else name
+
+def copy_stream(src, dst, max_bytes=None, buffer_size=COPY_BUFFER_SIZE):
+    """
+    使用固定大小、可重复使用的缓冲区将数据从src复制到dst，内存占用与数据大小无关
+    
+    Args:
+        src: 源数据流，优先使用readinto读取以避免每次分配新的bytes对象
+        dst: 目标文件对象
+        max_bytes: 允许复制的最大字节数，None表示不限制
+        buffer_size: 缓冲区大小
+    
+    Returns:
+        int: 复制的字节数
+    
+    Raises:
+        UploadTooLargeError: 数据超过max_bytes时抛出，此前的数据已写入dst
+    """
+    readinto = getattr(src, "readinto", None)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    copied = 0
+    while True:
+        if readinto is not None:
+            length = readinto(buffer)
+            data = view[:length] if length else None
+        else:
+            data = src.read(buffer_size)
+            length = len(data)
+        if not length:
+            break
+        if max_bytes is not None and copied + length > max_bytes:
+            raise UploadTooLargeError(f"数据超出允许的大小: {max_bytes} 字节")
+        dst.write(data)
+        copied += length
+    return copied
+
+class HashingFile:
+    """
+    写入时同步计算SHA-256的文件包装类，上传数据落盘的同时得到校验和，无需再读一遍
+    """
+    
+    def __init__(self, file_obj):
+        """
+        初始化文件包装
+        
+        Args:
+            file_obj: 以写模式打开的文件对象
+        """
+        self._file = file_obj
+        self.hasher = hashlib.sha256()
+        # 已写入的原始字节数，底层文件压缩存储时与文件大小不同
+        self.size = 0
+    
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+    
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+    
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+    
+    def __iter__(self):
+        return iter(self._file)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+
 class FileUtils:
     """
     文件处理工具类，用于处理文件的上传、下载和管理
@@ -17,6 +146,37 @@ class FileUtils:
         """
         # 使用绝对路径，确保在不同环境下都能正确找到目录
         self.upload_dir = os.path.abspath(upload_dir)
+        # 上传过程中使用的临时文件目录，位于上传目录内，保存时只需重命名
+        self.temp_dir = os.path.join(self.upload_dir, ".tmp")
+        # 按内容哈希存储文件，相同内容只保存一份
+        self.blob_store = BlobStore(os.path.join(self.upload_dir, ".blobs"))
+        # 单个文件的最大大小（字节），None表示不限制
+        self.max_file_size = None
+        # 存储时压缩文本类文件使用的编码（gzip或zstd），None表示不压缩
+        self.compression = None
+        # 接收上传后磁盘至少保留的剩余空间（字节）
+        self.min_free_space = 0
+        # 正在进行的上传预留的磁盘空间，key为上传标识，value为字节数
+        self.reservations = {}
+        self.reserved_bytes = 0
+        self.reservation_lock = threading.Lock()
+        # 每个原始文件名下一个可用的重名序号
+        self.name_counters = {}
+        self.name_lock = threading.Lock()
+        # 文件校验和索引
+        self.checksums = ChecksumIndex(os.path.join(self.upload_dir, ".meta", "checksums.json"))
+        # 内存中的文件列表，保存、删除文件时增量更新，后台算出校验和后同步到列表
+        self.file_index = FileIndex(self.upload_dir, self._describe_file)
+        self.checksums.on_rehash = self.file_index.update
+        # 记录上传者、下载次数、标签等元数据的目录，按文件列表索引的变更记录同步
+        self.catalog = FileCatalog(os.path.join(self.upload_dir, ".meta", "catalog.db"))
+        # 元数据目录已同步到的文件列表版本，None表示需要与整个目录核对
+        self.catalog_version = None
+        self.catalog_lock = threading.Lock()
+        # 下载用的预压缩版本缓存，默认不启用，由配置设置大小上限
+        self.variants = VariantCache(os.path.join(self.upload_dir, ".variants"), max_size=0)
+        # 图片和视频的缩略图缓存，默认不启用，由配置设置大小上限
+        self.thumbnails = ThumbnailCache(os.path.join(self.upload_dir, ".thumbnails"), max_size=0)
         # 确保上传目录存在
         os.makedirs(self.upload_dir, exist_ok=True)
     
@@ -27,59 +187,851 @@ class FileUtils:
         Returns:
             list: 文件信息列表，包含文件名、大小、修改时间等
         """
-        file_list = []
         try:
-            for filename in os.listdir(self.upload_dir):
-                file_path = os.path.join(self.upload_dir, filename)
-                if os.path.isfile(file_path):
-                    file_stats = os.stat(file_path)
-                    file_list.append({
-                        "filename": filename,
-                        "size": file_stats.st_size,
-                        "mtime": datetime.fromtimestamp(file_stats.st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
-                        "url": f"/download/{filename}"
-                    })
-            # 按修改时间倒序排序
-            file_list.sort(key=lambda x: x["mtime"], reverse=True)
+            # 直接返回内存中的列表，已按修改时间倒序排列
+            return self.file_index.list()
         except Exception as e:
             logger.error(f"获取文件列表失败: {e}")
-        return file_list
+            return []
+    
+    def query_files(self, folder="", uploader=None, tag=None, sha256=None, **query):
+        """
+        分页查询文件夹中的文件，支持排序和筛选。
+        一般的查询由内存中的文件列表索引完成；按上传者、标签或校验和筛选时由元数据目录的索引完成。
+        返回的文件信息附带元数据目录中记录的上传者、原始文件名、下载次数和标签
+        
+        Args:
+            folder: 文件夹路径，根目录为""
+            uploader: 上传者的用户ID
+            tag: 标签
+            sha256: 文件内容的SHA-256
+            **query: 查询条件，见FileIndex.query
+        
+        Returns:
+            tuple: (当前页的文件信息列表, 下一页的游标, 文件总数)，
+                   文件总数在按元数据筛选时为符合条件的文件数，否则为文件夹中的文件数
+        
+        Raises:
+            ValueError: 查询条件或游标无效
+            FileNotFoundError: 文件夹不存在
+        """
+        self._sync_catalog()
+        if uploader is None and tag is None and sha256 is None:
+            files, next_cursor = self.file_index.query(folder, **query)
+            total = self.file_index.count(folder)
+        else:
+            files, next_cursor, total = self._query_catalog(folder, uploader, tag, sha256, **query)
+        return self._with_metadata(files), next_cursor, total
+    
+    def _query_catalog(self, folder, uploader, tag, sha256, sort="mtime", descending=None,
+                       limit=DEFAULT_PAGE_SIZE, cursor=None, **query):
+        """
+        由元数据目录按上传者、标签或校验和分页查询，排序方式和游标与文件列表索引一致
+        
+        Returns:
+            tuple: (文件信息列表, 下一页的游标, 符合条件的文件数)
+        """
+        descending, cursor_key = parse_page_options(sort, descending, limit, cursor)
+        if self.file_index.get_folder(folder) is None:
+            raise FileNotFoundError(folder)
+        paths, next_key, total = self.catalog.query(folder, sort, descending, limit, cursor_key, uploader=uploader,
+                                                    tag=tag, sha256=sha256, **query)
+        files = [info for info in map(self.file_index.get, paths) if info is not None]
+        return files, encode_cursor(sort, descending, next_key) if next_key else None, total
+    
+    def _with_metadata(self, files):
+        """
+        在文件信息中加入元数据目录中记录的信息，返回新的字典，不修改索引中的文件信息
+        """
+        metadata = self.catalog.get_metadata([info["filename"] for info in files])
+        empty = {"uploader": None, "original_name": None, "uploaded_at": None, "download_count": 0, "tags": []}
+        return [{**info, **metadata.get(info["filename"], empty)} for info in files]
+    
+    def _sync_catalog(self):
+        """
+        把文件列表索引的变化同步到元数据目录，首次同步或变更记录已不完整时与整个上传目录核对。
+        同步失败时记录日志，下次再从同一版本重试
+        """
+        with self.catalog_lock:
+            try:
+                delta = None
+                if self.catalog_version is not None:
+                    delta = self.file_index.changes_since(self.catalog_version)
+                if delta is None:
+                    files, version = self.file_index.versioned_list()
+                    self.catalog.reconcile(self._catalog_rows(files))
+                elif delta["version"] != self.catalog_version:
+                    version = delta["version"]
+                    self.catalog.apply(self._catalog_rows(delta["added"] + delta["changed"]), delta["removed"])
+                else:
+                    return
+                self.catalog_version = version
+            except sqlite3.Error as e:
+                logger.error(f"同步文件元数据目录失败: {e}")
+    
+    def _catalog_rows(self, files):
+        """
+        Returns:
+            list: 元数据目录的文件记录，见FileCatalog.apply，期间已被删除的文件不在其中
+        """
+        rows = []
+        for info in files:
+            mtime_ns = self.file_index.mtime_ns(info["filename"])
+            if mtime_ns is not None:
+                rows.append((info["filename"], info["folder"], info["name"], info["size"], mtime_ns, info["sha256"]))
+        return rows
+    
+    def record_download(self, filename):
+        """
+        文件下载次数加一
+        
+        Args:
+            filename: 文件名
+        """
+        self._sync_catalog()
+        try:
+            self.catalog.record_download(filename)
+        except sqlite3.Error as e:
+            logger.error(f"记录下载次数失败: {filename}, {e}")
+    
+    def set_file_tags(self, filename, tags):
+        """
+        设置文件的标签
+        
+        Args:
+            filename: 文件名
+            tags: 标签列表
+        
+        Returns:
+            dict or None: 更新后的文件信息（含元数据），文件不存在时返回None
+        
+        Raises:
+            ValueError: 标签过长或过多
+        """
+        self._sync_catalog()
+        info = self.file_index.get(filename)
+        if info is None or not self.catalog.set_tags(filename, tags):
+            return None
+        return self._with_metadata([info])[0]
+    
+    def search_files(self, query, folder="", limit=DEFAULT_SEARCH_LIMIT):
+        """
+        按名称搜索文件和文件夹，使用内存中的三元组索引，不扫描目录
+        
+        Args:
+            query: 查询，不区分大小写
+            folder: 搜索范围的文件夹路径，根目录为""
+            limit: 最多返回的结果数
+        
+        Returns:
+            list: 按匹配程度排序的结果列表，见FileIndex.search
+        
+        Raises:
+            ValueError: 参数无效
+            FileNotFoundError: 文件夹不存在
+        """
+        return self.file_index.search(query, folder, limit)
+    
+    def get_folder(self, folder):
+        """
+        获取文件夹的信息及其子文件夹，文件数和总大小包括各级子文件夹，直接从索引读取
+        
+        Args:
+            folder: 文件夹路径，根目录为""
+        
+        Returns:
+            tuple: (文件夹信息, 子文件夹信息列表)
+        
+        Raises:
+            FileNotFoundError: 文件夹不存在
+        """
+        info = self.file_index.get_folder(folder)
+        if info is None:
+            raise FileNotFoundError(folder)
+        return info, self.file_index.list_folders(folder)
+    
+    def create_folder(self, folder):
+        """
+        创建文件夹，上级文件夹不存在时一并创建
+        
+        Args:
+            folder: 规范化后的文件夹路径
+        
+        Returns:
+            bool: 创建成功或已存在返回True，否则返回False
+        """
+        try:
+            folder_path = os.path.join(self.upload_dir, folder)
+            if os.path.exists(folder_path) and not os.path.isdir(folder_path):
+                logger.error(f"创建文件夹失败: 已存在同名文件 {folder}")
+                return False
+            os.makedirs(folder_path, exist_ok=True)
+            if self.file_index.add_folder(folder):
+                logger.info(f"文件夹创建成功: {folder}")
+            return True
+        except Exception as e:
+            logger.error(f"创建文件夹失败: {e}")
+            return False
+    
+    def list_folder_files(self, folder):
+        """
+        获取文件夹及其各级子文件夹中的所有文件路径
+        
+        Args:
+            folder: 文件夹路径，根目录为""
+        
+        Returns:
+            list: 文件路径列表
+        
+        Raises:
+            FileNotFoundError: 文件夹不存在
+        """
+        return self.file_index.folder_files(folder)
+    
+    def delete_folder(self, folder):
+        """
+        删除文件夹及其中的所有文件，文件逐个删除以释放blob引用、预压缩版本和缩略图
+        
+        Args:
+            folder: 规范化后的文件夹路径，不能是根目录
+        
+        Returns:
+            bool: 删除成功返回True，否则返回False
+        """
+        try:
+            folder_path = os.path.join(self.upload_dir, folder)
+            if not folder or not os.path.isdir(folder_path):
+                return False
+            for filename in self.file_index.folder_files(folder):
+                self.delete_file(filename)
+            shutil.rmtree(folder_path)
+            self.file_index.remove_folder(folder)
+            logger.info(f"文件夹删除成功: {folder}")
+            return True
+        except Exception as e:
+            logger.error(f"文件夹删除失败: {e}")
+            return False
+    
+    def sync_files(self, filenames):
+        """
+        将上传目录在外部发生的变化（例如管理员直接复制进来的文件）同步到文件列表
+        
+        Args:
+            filenames: 变化的文件名集合，None表示可能丢失了变化，需要重新扫描目录
+        
+        Returns:
+            bool: 文件列表是否有变化
+        """
+        if filenames is None:
+            self.file_index.reset()
+            self._sync_catalog()
+            return True
+        changed = self.file_index.sync(filenames)
+        if changed:
+            self._sync_catalog()
+        return changed
+    
+    def _describe_file(self, filename, file_stats):
+        """
+        生成文件列表中的文件信息
+        
+        Args:
+            filename: 文件名
+            file_stats: 文件的os.stat结果
+        
+        Returns:
+            dict: 文件信息
+        """
+        # 校验和失效或尚未计算时列表中返回None，通过/api/checksum请求时才读取文件计算
+        sha256 = self.checksums.lookup(filename, file_stats)
+        folder, name = split_path(filename)
+        return {
+            "filename": filename,
+            "name": name,
+            "folder": folder,
+            "size": self._logical_size(sha256, file_stats),
+            "mtime": datetime.fromtimestamp(file_stats.st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
+            "sha256": sha256,
+            "url": f"/download/{filename}",
+            # 当前环境能生成缩略图时给出地址
+            "thumbnail": f"/thumb/{filename}" if self.thumbnails.max_size and thumbnail_kind(filename) else None
+        }
+    
+    def _allocate_filename(self, filename, create):
+        """
+        分配上传目录中不重名的文件名并以独占方式创建，重名时追加_1、_2等后缀
+        
+        每个原始文件名在内存中维护下一个可用的序号，无需逐个检查_1、_2…是否存在；
+        首次遇到某个文件名时按文件列表索引中该文件夹已有的最大序号确定起始序号，服务重启后也不必逐个尝试；
+        文件的创建由create以独占方式完成（已存在时抛出FileExistsError），
+        因此并发上传同名文件也不会得到同一个文件名
+        
+        Args:
+            filename: 原始文件名
+            create: 创建函数，参数为(文件名, 文件路径)，目标已存在时抛出FileExistsError
+        
+        Returns:
+            str: 最终文件名
+        """
+        # 先尝试原始文件名
+        try:
+            create(filename, os.path.join(self.upload_dir, filename))
+            return filename
+        except FileExistsError:
+            pass
+        
+        base_name, ext = os.path.splitext(filename)
+        while True:
+            with self.name_lock:
+                counter = self.name_counters.get(filename)
+                if counter is None:
+                    counter = self._highest_suffix(base_name, ext) + 1
+                self.name_counters[filename] = counter + 1
+            candidate = f"{base_name}_{counter}{ext}"
+            try:
+                create(candidate, os.path.join(self.upload_dir, candidate))
+                return candidate
+            except FileExistsError:
+                # 该序号已被尚未加入索引的文件占用，继续下一个
+                continue
+    
+    def _highest_suffix(self, base_name, ext):
+        """
+        在文件列表索引中查找重名文件已使用的最大序号
+        
+        Args:
+            base_name: 原始文件名去掉扩展名的部分，可包含文件夹
+            ext: 扩展名
+        
+        Returns:
+            int: 最大序号，没有重名文件时返回0
+        """
+        folder, name = split_path(base_name)
+        prefix = f"{name}_"
+        highest = 0
+        for existing in self.file_index.names_with_prefix(folder, prefix):
+            if existing.startswith(prefix) and existing.endswith(ext):
+                suffix = existing[len(prefix):len(existing) - len(ext)]
+                if suffix.isdigit():
+                    highest = max(highest, int(suffix))
+        return highest
+    
+    def check_file_size(self, size):
+        """
+        检查文件大小是否超出限制
+        
+        Args:
+            size: 文件大小（字节）
+        
+        Raises:
+            UploadTooLargeError: 超出max_file_size时抛出
+        """
+        if self.max_file_size is not None and size > self.max_file_size:
+            raise UploadTooLargeError(f"文件大小超出限制: 最大 {self.max_file_size} 字节")
+    
+    def reserve_space(self, key, size):
+        """
+        上传准入检查：扣除其他进行中的上传已预留的空间后，磁盘剩余空间仍足够时为本次上传预留空间
+        
+        Args:
+            key: 上传标识，释放时使用
+            size: 需要预留的字节数
+        
+        Raises:
+            ValueError: size为负数时抛出
+            UploadTooLargeError: 超出max_file_size时抛出
+            InsufficientSpaceError: 磁盘剩余空间不足时抛出
+        """
+        # 负数会减少其他上传看到的已预留空间，使它们绕过剩余空间检查
+        if size < 0:
+            raise ValueError("预留的大小不能为负数")
+        self.check_file_size(size)
+        with self.reservation_lock:
+            # 同一上传重新预留时替换原有的预留
+            reserved = self.reserved_bytes - self.reservations.get(key, 0)
+            free = shutil.disk_usage(self.upload_dir).free
+            if free - reserved - size < self.min_free_space:
+                raise InsufficientSpaceError("磁盘剩余空间不足")
+            self.reservations[key] = size
+            self.reserved_bytes = reserved + size
+    
+    def release_space(self, key):
+        """
+        释放上传预留的磁盘空间
+        
+        Args:
+            key: 上传标识
+        """
+        with self.reservation_lock:
+            self.reserved_bytes -= self.reservations.pop(key, 0)
+    
+    def shrink_reservation(self, key, size):
+        """
+        将上传预留的空间减少到size字节，已写入磁盘的数据已体现在剩余空间中，不再重复扣除
+        
+        Args:
+            key: 上传标识
+            size: 仍需预留的字节数
+        """
+        with self.reservation_lock:
+            current = self.reservations.get(key)
+            if current is not None and current > size:
+                self.reservations[key] = size
+                self.reserved_bytes -= current - size
     
-    def save_file(self, file_obj, filename):
+    def save_file(self, file_obj, filename, uploader=None):
         """
         保存上传的文件
         
         Args:
             file_obj: 文件对象，可以是Flask的FileStorage对象或BytesIO对象
             filename: 文件名
+            uploader: 上传者的用户ID
         
         Returns:
             bool: 保存成功返回True，否则返回False
+        
+        Raises:
+            UploadTooLargeError: 文件超出max_file_size时抛出
         """
+        temp_path = None
         try:
-            file_path = os.path.join(self.upload_dir, filename)
-            # 确保文件名唯一
-            base_name, ext = os.path.splitext(filename)
-            counter = 1
-            while os.path.exists(file_path):
-                filename = f"{base_name}_{counter}{ext}"
-                file_path = os.path.join(self.upload_dir, filename)
-                counter += 1
+            # multipart上传时文件已由请求解析直接写入临时目录，同时计算了哈希并按需压缩，无需再复制一次
+            stream = getattr(file_obj, 'stream', None)
+            if isinstance(stream, HashingFile) and os.path.dirname(stream.name) == self.temp_dir:
+                temp_path = stream.name
+                stream.close()
+                self.check_file_size(stream.size)
+            else:
+                stream = self.create_temp_file(filename)
+                with stream as f:
+                    temp_path = f.name
+                    # Flask FileStorage对象取其数据流，BytesIO或其他文件对象直接复制，
+                    # 分块复制避免getvalue()产生整份内存拷贝
+                    source = file_obj.stream if hasattr(file_obj, 'save') else file_obj
+                    copy_stream(source, f, max_bytes=self.max_file_size)
+            return True, self._store_file(temp_path, filename, stream.hexdigest(),
+                                          getattr(stream, 'encoding', None), stream.size, uploader)
+        except UploadTooLargeError:
+            self._remove_temp_file(temp_path)
+            raise
+        except Exception as e:
+            logger.error(f"文件保存失败: {e}")
+            self._remove_temp_file(temp_path)
+            return False, filename
+    
+    def save_stream(self, stream, filename, uploader=None):
+        """
+        从数据流（如请求体）中读取数据并直接写入上传目录内的临时文件，
+        每个上传只写一次磁盘，内存占用恒定
+        
+        Args:
+            stream: 数据流，需支持read或readinto方法
+            filename: 文件名
+            uploader: 上传者的用户ID
+        
+        Returns:
+            tuple: (是否成功, 最终文件名)
+        
+        Raises:
+            UploadTooLargeError: 数据超出max_file_size时抛出，已写入的临时文件会被删除
+        """
+        temp_path = None
+        try:
+            with self.create_temp_file(filename) as f:
+                temp_path = f.name
+                # 边接收边检查大小，超出限制立即停止，不会先写满磁盘
+                copy_stream(stream, f, max_bytes=self.max_file_size)
+            return True, self._store_file(temp_path, filename, f.hexdigest(),
+                                          getattr(f, 'encoding', None), f.size, uploader)
+        except UploadTooLargeError:
+            self._remove_temp_file(temp_path)
+            raise
+        except Exception as e:
+            logger.error(f"文件保存失败: {e}")
+            # 删除写了一半的文件
+            self._remove_temp_file(temp_path)
+            return False, filename
+    
+    def get_signature(self, filename, block_size=None):
+        """
+        计算文件的分块签名，供客户端计算增量数据
+        
+        Args:
+            filename: 文件名
+            block_size: 分块大小，为None时按文件大小选择
+        
+        Returns:
+            dict: 包含block_size、size和signatures
+        
+        Raises:
+            FileNotFoundError: 文件不存在时抛出
+        """
+        _, size = self.get_file_encoding(filename)
+        block_size = block_size or choose_block_size(size)
+        with self.open_file(filename) as f:
+            signatures = compute_signature(f, block_size)
+        return {"block_size": block_size, "size": size, "signatures": signatures}
+    
+    def save_delta(self, base_filename, delta_stream, filename, block_size, uploader=None):
+        """
+        根据已有文件和客户端发来的增量数据重建新版本的文件，
+        未变化的块直接从已有文件复制，只有变化的部分经过网络
+        
+        Args:
+            base_filename: 已有的旧版本文件名
+            delta_stream: 增量数据流
+            filename: 新文件的文件名
+            block_size: 计算签名时使用的分块大小
+            uploader: 上传者的用户ID
+        
+        Returns:
+            tuple: (是否成功, 最终文件名)
+        
+        Raises:
+            FileNotFoundError: 旧版本文件不存在时抛出
+            ValueError: 增量数据格式错误时抛出
+            UploadTooLargeError: 新文件超出max_file_size时抛出
+        """
+        temp_path = None
+        base_copy = None
+        try:
+            encoding, _ = self.get_file_encoding(base_filename)
+            if encoding is None:
+                base = open(os.path.join(self.upload_dir, base_filename), "rb")
+            else:
+                # 压缩存储的文件无法高效地随机读取，先解压到临时文件
+                with self.open_file(base_filename) as src, self.create_temp_file() as dst:
+                    base_copy = dst.name
+                    copy_stream(src, dst)
+                base = open(base_copy, "rb")
+            with base, self.create_temp_file(filename) as f:
+                temp_path = f.name
+                apply_delta(base, delta_stream, f, block_size, max_bytes=self.max_file_size)
+            return True, self._store_file(temp_path, filename, f.hexdigest(),
+                                          getattr(f, 'encoding', None), f.size, uploader)
+        except (FileNotFoundError, ValueError, UploadTooLargeError):
+            self._remove_temp_file(temp_path)
+            raise
+        except Exception as e:
+            logger.error(f"增量上传保存失败: {e}")
+            self._remove_temp_file(temp_path)
+            return False, filename
+        finally:
+            self._remove_temp_file(base_copy)
+    
+    def create_temp_file(self, filename=None):
+        """
+        在上传目录的临时目录中创建一个临时文件，供multipart解析时直接写入
+        
+        Args:
+            filename: 上传的文件名，启用存储压缩且文件类型值得压缩时边写边压缩，
+                      此时临时文件只能写入；为None时创建可读写的未压缩文件
+        
+        Returns:
+            HashingFile: 写入时同步计算原始内容哈希的临时文件对象
+        """
+        os.makedirs(self.temp_dir, exist_ok=True)
+        temp_path = os.path.join(self.temp_dir, f"{uuid.uuid4().hex}.tmp")
+        if filename is not None and self.compression and is_compressible(filename):
+            return HashingFile(CompressingFile(open(temp_path, "wb"), self.compression))
+        return HashingFile(open(temp_path, "w+b"))
+    
+    def discard_temp_file(self, file_obj):
+        """
+        删除未被保存的临时文件
+        
+        Args:
+            file_obj: FileStorage对象
+        """
+        temp_path = getattr(getattr(file_obj, 'stream', None), 'name', None)
+        if isinstance(temp_path, str) and os.path.dirname(temp_path) == self.temp_dir:
+            file_obj.stream.close()
+            self._remove_temp_file(temp_path)
+    
+    def _remove_temp_file(self, temp_path):
+        if isinstance(temp_path, str) and os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    def commit_file(self, temp_path, filename, digest=None, uploader=None, encoding=None, size=None):
+        """
+        将已写好的临时文件提交到上传目录，用于分块上传完成后提交文件
+        
+        Args:
+            temp_path: 临时文件路径
+            filename: 目标文件名
+            digest: 已计算好的原始内容SHA-256哈希，为None时读取文件计算
+            uploader: 上传者的用户ID
+            encoding: 临时文件的压缩编码，None表示未压缩
+            size: 压缩前的原始大小
+        
+        Returns:
+            tuple: (是否成功, 最终文件名)
+        """
+        try:
+            return True, self._store_file(temp_path, filename, digest, encoding, size, uploader)
+        except Exception as e:
+            logger.error(f"文件保存失败: {e}")
+            return False, filename
+    
+    def _store_file(self, temp_path, filename, digest=None, encoding=None, size=None, uploader=None):
+        """
+        按内容哈希将临时文件存入blob存储，并在上传目录中创建指向它的文件名。
+        同名且内容相同的文件已存在时不再生成_1副本
+        
+        Args:
+            temp_path: 临时文件路径
+            filename: 目标文件名
+            digest: 已计算好的原始内容SHA-256哈希，为None时读取文件计算
+            encoding: 临时文件的压缩编码，None表示未压缩
+            size: 压缩前的原始大小
+            uploader: 上传者的用户ID
+        
+        Returns:
+            str: 最终文件名
+        """
+        if digest is None:
+            digest = hash_file(temp_path)
+        if self._has_content(filename, digest):
+            os.remove(temp_path)
+            logger.info(f"文件内容未变化，无需重复保存: {filename}")
+            return filename
+        
+        if (encoding is None and self.compression and is_compressible(filename)
+                and not self.blob_store.has_blob(digest)):
+            # 无法边接收边压缩的数据（如服务重启后续传完成的分块上传）保存时再压缩
+            size = os.path.getsize(temp_path)
+            temp_path = self._compress_temp_file(temp_path)
+            encoding = self.compression
+        
+        original_name = split_path(filename)[1]
+        filename = self._allocate_filename(
+            filename, lambda name, path: self.blob_store.add(temp_path, digest, name, path, encoding, size))
+        self.checksums.record(filename, digest, os.stat(os.path.join(self.upload_dir, filename)))
+        self.file_index.update(filename)
+        self._record_upload(filename, uploader, original_name)
+        logger.info(f"文件保存成功: {filename}")
+        self._schedule_variants(filename, digest)
+        return filename
+    
+    def _has_content(self, filename, digest):
+        """
+        文件名是否已存在且内容的哈希为digest，文件在外部被修改过时按记录的大小和修改时间判断为不同
+        """
+        try:
+            file_stats = os.stat(os.path.join(self.upload_dir, filename))
+        except (OSError, ValueError):
+            return False
+        return self.checksums.lookup(filename, file_stats) == digest
+    
+    def _compress_temp_file(self, temp_path):
+        """
+        压缩未压缩的临时文件，压缩完成后删除原文件
+        
+        Args:
+            temp_path: 临时文件路径
+        
+        Returns:
+            str: 压缩后的临时文件路径
+        """
+        os.makedirs(self.temp_dir, exist_ok=True)
+        compressed_path = os.path.join(self.temp_dir, f"{uuid.uuid4().hex}.tmp")
+        try:
+            with open(temp_path, "rb") as src, CompressingFile(open(compressed_path, "wb"), self.compression) as dst:
+                copy_stream(src, dst)
+        except Exception:
+            self._remove_temp_file(compressed_path)
+            raise
+        os.remove(temp_path)
+        return compressed_path
+    
+    def _logical_size(self, digest, file_stats):
+        """
+        获取文件压缩前的大小
+        
+        Args:
+            digest: 文件的有效校验和，未知时为None
+            file_stats: 文件的os.stat结果
+        
+        Returns:
+            int: 原始大小，文件未压缩时即文件大小
+        """
+        info = self.blob_store.get_encoding(digest) if digest else None
+        return info["size"] if info else file_stats.st_size
+    
+    def get_file_encoding(self, filename):
+        """
+        获取文件的存储编码
+        
+        Args:
+            filename: 文件名
+        
+        Returns:
+            tuple: (压缩编码，未压缩时为None, 原始大小)
+        
+        Raises:
+            FileNotFoundError: 文件不存在时抛出
+        """
+        file_stats = os.stat(os.path.join(self.upload_dir, filename))
+        # 只信任文件未被改动过的记录，外部替换过的文件按未压缩处理
+        digest = self.checksums.lookup(filename, file_stats)
+        info = self.blob_store.get_encoding(digest) if digest else None
+        if info:
+            return info["encoding"], info["size"]
+        return None, file_stats.st_size
+    
+    def get_etag(self, filename):
+        """
+        获取文件的强校验器，用于下载时的ETag和If-Range
+        
+        Args:
+            filename: 文件名
+        
+        Returns:
+            str: 有效的校验和；尚未计算时返回由大小和修改时间组成的校验器
+        
+        Raises:
+            FileNotFoundError: 文件不存在时抛出
+        """
+        file_path = os.path.join(self.upload_dir, filename)
+        file_stats = os.stat(file_path)
+        digest = self.checksums.lookup(filename, file_stats)
+        if digest is not None:
+            return digest
+        return f"{file_stats.st_size:x}-{file_stats.st_mtime_ns:x}"
+    
+    def _schedule_variants(self, filename, digest):
+        """
+        为文本类文件在后台生成下载用的预压缩版本
+        
+        Args:
+            filename: 文件名
+            digest: 文件内容哈希
+        """
+        if not is_compressible(filename):
+            return
+        info = self.blob_store.get_encoding(digest)
+        self.variants.schedule(digest, lambda: self.open_file(filename),
+                               skip=info["encoding"] if info else None)
+    
+    def get_variant(self, filename, accept_encodings):
+        """
+        获取客户端接受的预压缩版本，没有时在后台生成
+        
+        Args:
+            filename: 文件名
+            accept_encodings: 请求的Accept-Encoding
+        
+        Returns:
+            tuple or None: (编码, 预压缩文件路径)，没有可用的版本时返回None
+        """
+        if not is_compressible(filename):
+            return None
+        file_stats = os.stat(os.path.join(self.upload_dir, filename))
+        # 只使用与当前内容对应的版本，文件被修改后旧哈希的版本不会被选中
+        digest = self.checksums.lookup(filename, file_stats)
+        if digest is None:
+            return None
+        variant = self.variants.choose(digest, accept_encodings)
+        if variant is None:
+            self._schedule_variants(filename, digest)
+        return variant
+    
+    def get_thumbnail(self, filename, size_name):
+        """
+        获取文件的缩略图，尚未生成时交给线程池生成，不等待结果
+        
+        Args:
+            filename: 文件名
+            size_name: 尺寸名称
+        
+        Returns:
+            tuple: (状态, 缩略图路径)，状态为"ready"、"pending"或"unsupported"，
+                   只有"ready"时路径不为None
+        
+        Raises:
+            FileNotFoundError: 文件不存在时抛出
+        """
+        file_path = os.path.join(self.upload_dir, filename)
+        # 按内容哈希缓存，文件被覆盖后键随之变化，不会取到旧内容的缩略图
+        key = self.get_etag(filename)
+        thumbnail_path = self.thumbnails.get(key, size_name)
+        if thumbnail_path is not None:
+            return "ready", thumbnail_path
+        
+        kind = thumbnail_kind(filename)
+        if kind == "image":
+            render = lambda size: render_image(lambda: self.open_file(filename), size)
+        elif kind == "video":
+            render = lambda size: render_video(file_path, size)
+        else:
+            return "unsupported", None
+        if self.thumbnails.schedule(key, size_name, render):
+            return "pending", None
+        return "unsupported", None
+    
+    def open_file(self, filename):
+        """
+        以只读方式打开文件，压缩存储的文件读取时自动解压
+        
+        Args:
+            filename: 文件名
+        
+        Returns:
+            file: 读取原始内容的文件对象
+        
+        Raises:
+            FileNotFoundError: 文件不存在时抛出
+        """
+        encoding, _ = self.get_file_encoding(filename)
+        file_path = os.path.join(self.upload_dir, filename)
+        if encoding is None:
+            return open(file_path, "rb")
+        return open_decompressed(file_path, encoding)
+    
+    def save_blob_reference(self, digest, filename, uploader=None):
+        """
+        服务端已有相同内容时，直接创建指向该内容的文件名，无需再传输数据
+        
+        Args:
+            digest: 文件内容的SHA-256哈希
+            filename: 文件名
+            uploader: 上传者的用户ID
+        
+        Returns:
+            tuple: (服务端是否已有该内容, 最终文件名)
+        """
+        try:
+            if self._has_content(filename, digest):
+                return True, filename
+            if not self.blob_store.has_blob(digest):
+                return False, filename
             
-            # 保存文件
-            with open(file_path, "wb") as f:
-                if hasattr(file_obj, 'save'):
-                    # Flask FileStorage对象
-                    file_obj.save(f)
-                else:
-                    # BytesIO或其他文件对象
-                    f.write(file_obj.getvalue())
-            logger.info(f"文件保存成功: {filename}")
+            def create(name, path):
+                if not self.blob_store.link(digest, name, path):
+                    raise FileNotFoundError(digest)
+            
+            original_name = split_path(filename)[1]
+            filename = self._allocate_filename(filename, create)
+            self.checksums.record(filename, digest, os.stat(os.path.join(self.upload_dir, filename)))
+            self.file_index.update(filename)
+            self._record_upload(filename, uploader, original_name)
+            logger.info(f"秒传成功: {filename}")
             return True, filename
         except Exception as e:
-            logger.error(f"文件保存失败: {e}")
+            logger.error(f"秒传失败: {e}")
             return False, filename
     
+    def _record_upload(self, filename, uploader, original_name):
+        """
+        新保存的文件同步到元数据目录，并记录上传者和原始文件名
+        """
+        self._sync_catalog()
+        try:
+            self.catalog.record_upload(filename, uploader, original_name)
+        except sqlite3.Error as e:
+            logger.error(f"记录上传信息失败: {filename}, {e}")
+    
     def delete_file(self, filename):
         """
         删除文件
@@ -93,7 +1045,20 @@ class FileUtils:
         try:
             file_path = os.path.join(self.upload_dir, filename)
             if os.path.exists(file_path):
+                file_stats = os.stat(file_path)
+                thumbnail_key = (self.checksums.lookup(filename, file_stats)
+                                 or f"{file_stats.st_size:x}-{file_stats.st_mtime_ns:x}")
                 os.remove(file_path)
+                digest = self.blob_store.get_digest(filename)
+                # 没有其他文件名引用同一内容时一并删除blob、预压缩版本和缩略图
+                self.blob_store.unlink(filename)
+                if digest is not None and digest not in self.blob_store.ref_counts:
+                    self.variants.remove(digest)
+                if digest is None or digest not in self.blob_store.ref_counts:
+                    self.thumbnails.remove(thumbnail_key)
+                self.checksums.remove(filename)
+                self.file_index.remove(filename)
+                self._sync_catalog()
                 logger.info(f"文件删除成功: {filename}")
                 return True
             return False
@@ -101,6 +1066,68 @@ class FileUtils:
             logger.error(f"文件删除失败: {e}")
             return False
     
+    def close(self):
+        """
+        写入尚未保存的索引，程序退出前调用
+        
+        Returns:
+            bool: 写入成功返回True
+        """
+        return all([self.checksums.flush(), self.blob_store.flush()])
+    
+    def cleanup_staging(self):
+        """
+        清理上次运行遗留的临时文件，例如服务异常退出时未完成的上传。
+        上传中的文件只存在于临时目录，完成后才以原子方式出现在上传目录中，
+        因此这里删除的文件从未出现在文件列表中
+        
+        Returns:
+            int: 删除的文件数
+        """
+        removed = 0
+        # 临时目录中的文件都属于未完成的上传
+        if os.path.isdir(self.temp_dir):
+            for filename in os.listdir(self.temp_dir):
+                try:
+                    os.remove(os.path.join(self.temp_dir, filename))
+                    removed += 1
+                except OSError as e:
+                    logger.error(f"删除临时文件失败: {filename}, {e}")
+        # 写了一半的索引文件
+        for directory in (self.blob_store.blob_dir, os.path.dirname(self.checksums.index_file),
+                          self.variants.cache_dir, self.thumbnails.cache_dir):
+            if not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                if filename.endswith(".tmp"):
+                    os.remove(os.path.join(directory, filename))
+                    removed += 1
+        if removed:
+            logger.info(f"清理遗留的临时文件: {removed} 个")
+        return removed
+    
+    def get_checksum(self, filename):
+        """
+        获取文件的SHA-256校验和，文件大小和修改时间未变化时直接返回记录的值。
+        只回答文件列表中的文件，上传目录之外的路径和内部目录中的文件视为不存在
+        
+        Args:
+            filename: 文件名
+        
+        Returns:
+            str or None: 校验和，文件不存在时返回None
+        """
+        try:
+            filename = normalize_path(filename)
+        except ValueError:
+            return None
+        if not filename or self.file_index.get(filename) is None:
+            return None
+        file_path = self.get_file_path(filename)
+        if file_path is None or not os.path.isfile(file_path):
+            return None
+        return self.checksums.get_checksum(filename, file_path)
+    
     def get_file_path(self, filename):
         """
         获取文件路径
@@ -124,12 +1151,26 @@ class FileUtils:
             bool: 清空成功返回True，否则返回False
         """
         try:
+            # 元数据目录随.meta目录一起删除，先关闭数据库并等待尚未写入的索引写完
+            self.catalog.close()
+            self.checksums.flush()
+            self.blob_store.flush()
             for filename in os.listdir(self.upload_dir):
                 file_path = os.path.join(self.upload_dir, filename)
                 if os.path.isfile(file_path):
                     os.remove(file_path)
                 elif os.path.isdir(file_path):
                     shutil.rmtree(file_path)
+            # blob和索引目录已被删除，重新加载空的引用表和索引
+            self.blob_store = BlobStore(os.path.join(self.upload_dir, ".blobs"))
+            self.checksums = ChecksumIndex(os.path.join(self.upload_dir, ".meta", "checksums.json"))
+            self.checksums.on_rehash = self.file_index.update
+            self.file_index.reset()
+            with self.catalog_lock:
+                self.catalog = FileCatalog(self.catalog.db_path)
+                self.catalog_version = None
+            self.variants = VariantCache(self.variants.cache_dir, self.variants.max_size)
+            self.thumbnails = ThumbnailCache(self.thumbnails.cache_dir, self.thumbnails.max_size)
             logger.info("上传目录清空成功")
             return True
         except Exception as e:
@@ -137,4 +1178,5 @@ class FileUtils:
             return False
 
 # 创建全局文件工具实例
-file_utils = FileUtils()
\ No newline at end of file
+file_utils = FileUtils()
+atexit.register(file_utils.close)
\ No newline at end of file
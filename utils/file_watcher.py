@@ -0,0 +1,359 @@
+import abc
+import ctypes
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from .logger import logger
+
+# inotify事件，见inotify(7)。不监听IN_MODIFY：复制大文件时每次写入都会触发，
+# 写完关闭时的IN_CLOSE_WRITE已足以反映修改
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+# struct inotify_event的固定部分：wd、mask、cookie、len
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+# 最后一个事件之后等待的时间，期间的事件合并为一次通知
+DEBOUNCE_SECONDS = 0.2
+# 持续有事件时最多等待的时间，避免长时间复制期间一直不通知
+MAX_DELAY_SECONDS = 1.0
+# 检查是否需要停止的间隔
+STOP_CHECK_SECONDS = 0.5
+# 轮询方式扫描目录的间隔
+POLL_INTERVAL = 2.0
+# 轮询时每隔多少次完整扫描一次，发现就地修改的旧文件
+FULL_SCAN_POLLS = 30
+# 修改时间在该时间（秒）内的文件和目录每次轮询都重新检查：文件可能仍在复制中，
+# 目录的修改时间精度可能较粗（FAT为2秒），同一时间单位内的第二次变化不会改变修改时间
+RECENT_SECONDS = 60
+
+class FileWatcher(abc.ABC):
+    """
+    目录监视器基类，在后台线程中监视目录及其各级子目录下文件的新建、修改、移动和删除，
+    把一段时间内的变化合并后回调。以.开头的内部目录不监视
+    """
+
+    def __init__(self, directory, on_change):
+        """
+        初始化监视器
+
+        Args:
+            directory: 监视的目录
+            on_change: 回调函数，参数为变化的文件或子目录的相对路径（以/分隔）集合；
+                       为None时表示可能丢失了事件，需要重新扫描
+        """
+        self.directory = directory
+        self.on_change = on_change
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True, name=type(self).__name__)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _notify(self, filenames):
+        try:
+            self.on_change(filenames)
+        except Exception as e:
+            logger.error(f"处理文件变化失败: {e}")
+
+    @abc.abstractmethod
+    def _run(self):
+        """
+        在后台线程中监视目录直到stopped被设置
+        """
+
+class InotifyWatcher(FileWatcher):
+    """
+    基于Linux inotify的监视器，通过ctypes调用libc，只在有事件时处理，无需扫描目录。
+    inotify不能递归监视，每个子目录单独添加监视，新建或移入的子目录随即加入
+    """
+
+    def __init__(self, directory, on_change):
+        super().__init__(directory, on_change)
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        # 监视描述符到子目录相对路径的映射，根目录为""
+        self.watches = {}
+        try:
+            self.root_wd = self._add_watch("")
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _add_watch(self, relative_path):
+        """
+        监视子目录及其下的各级子目录
+
+        Returns:
+            int: 子目录的监视描述符
+
+        Raises:
+            OSError: 无法监视，例如达到了max_user_watches上限
+        """
+        directory = os.path.join(self.directory, relative_path)
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch失败: {directory}")
+        self.watches[wd] = relative_path
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False) and not entry.name.startswith("."):
+                    self._add_watch(f"{relative_path}/{entry.name}" if relative_path else entry.name)
+        return wd
+
+    def _remove_watches(self, relative_path):
+        """
+        移出的子目录不再监视，避免之后以旧路径报告事件
+        """
+        prefix = relative_path + "/"
+        for wd, path in list(self.watches.items()):
+            if path == relative_path or path.startswith(prefix):
+                del self.watches[wd]
+                self.libc.inotify_rm_watch(self.fd, wd)
+
+    def _read_events(self):
+        """
+        读取已到达的事件
+
+        Returns:
+            tuple: (变化的文件名集合, 是否需要重新扫描)
+        """
+        filenames = set()
+        rescan = False
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_Q_OVERFLOW or (wd == self.root_wd and mask & (IN_DELETE_SELF | IN_MOVE_SELF)):
+                    rescan = True
+                    continue
+                if mask & IN_IGNORED:
+                    # 子目录已删除，内核自动移除了监视
+                    self.watches.pop(wd, None)
+                    continue
+                parent = self.watches.get(wd)
+                if parent is None or not name or name.startswith("."):
+                    continue
+                path = f"{parent}/{name}" if parent else name
+                filenames.add(path)
+                if mask & IN_ISDIR:
+                    if mask & IN_MOVED_FROM:
+                        self._remove_watches(path)
+                    elif mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            self._add_watch(path)
+                        except OSError as e:
+                            logger.warning(f"无法监视子目录: {path}, {e}")
+                            rescan = True
+        return filenames, rescan
+
+    def _run(self):
+        pending = set()
+        rescan = False
+        first = last = None
+        try:
+            while not self.stopped.is_set():
+                timeout = STOP_CHECK_SECONDS
+                if first is not None:
+                    deadline = min(last + DEBOUNCE_SECONDS, first + MAX_DELAY_SECONDS)
+                    timeout = max(0, min(timeout, deadline - time.monotonic()))
+                readable, _, _ = select.select([self.fd], [], [], timeout)
+                now = time.monotonic()
+                if readable:
+                    filenames, overflow = self._read_events()
+                    pending |= filenames
+                    rescan = rescan or overflow
+                    if filenames or overflow:
+                        first = now if first is None else first
+                        last = now
+                if first is not None and now >= min(last + DEBOUNCE_SECONDS, first + MAX_DELAY_SECONDS):
+                    self._notify(None if rescan else pending)
+                    pending = set()
+                    rescan = False
+                    first = last = None
+        finally:
+            os.close(self.fd)
+
+class PollingWatcher(FileWatcher):
+    """
+    轮询监视器，用于不支持inotify的系统。每次轮询只读取各目录的修改时间，
+    只重新列出修改时间变化了的目录，并重新检查最近修改过的文件，不必读取整棵目录树中每个文件的状态。
+    就地修改已有文件不改变目录的修改时间，较旧的文件被就地修改时要到下次完整扫描才能发现
+    """
+
+    def __init__(self, directory, on_change, interval=POLL_INTERVAL):
+        super().__init__(directory, on_change)
+        self.interval = interval
+        # 子目录相对路径到上次列出时的修改时间的映射，根目录为""；修改时间为None表示下次轮询时重新列出
+        self.dirs = {}
+        # 子目录相对路径到其中各项的映射：文件映射为(大小, 修改时间纳秒)，子目录映射为None
+        self.entries = {}
+        # 最近修改过、每次轮询都重新检查的文件
+        self.recent = set()
+        self._scan_dir("")
+
+    def _scan_dir(self, directory):
+        """
+        重新列出一个目录，新出现的子目录随即列出，消失的子目录连同其中各项一起移除
+
+        Returns:
+            set: 变化的文件或子目录的相对路径
+        """
+        full_path = os.path.join(self.directory, directory)
+        recent_since = time.time_ns() - RECENT_SECONDS * 10 ** 9
+        entries = {}
+        try:
+            # 先读取目录的修改时间，列出期间发生的变化会在下次轮询时发现
+            mtime = os.stat(full_path).st_mtime_ns
+            with os.scandir(full_path) as scanned:
+                for entry in scanned:
+                    path = f"{directory}/{entry.name}" if directory else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            entries[path] = None
+                    elif entry.is_file():
+                        file_stats = entry.stat()
+                        entries[path] = (file_stats.st_size, file_stats.st_mtime_ns)
+                        if file_stats.st_mtime_ns > recent_since:
+                            self.recent.add(path)
+        except OSError as e:
+            if directory and not os.path.isdir(full_path):
+                # 目录已被删除，由上级目录的变化报告
+                return self._forget_dir(directory)
+            logger.error(f"扫描目录失败: {directory or self.directory}, {e}")
+            return set()
+        self.dirs[directory] = None if mtime > recent_since else mtime
+        old_entries = self.entries.get(directory, {})
+        self.entries[directory] = entries
+        changed = entries.keys() ^ old_entries.keys()
+        changed |= {path for path in entries.keys() & old_entries.keys() if entries[path] != old_entries[path]}
+        for path in old_entries.keys() - entries.keys():
+            if old_entries[path] is None:
+                changed |= self._forget_dir(path)
+        for path in entries.keys() - old_entries.keys():
+            if entries[path] is None:
+                changed |= self._scan_dir(path)
+        return changed
+
+    def _forget_dir(self, directory):
+        """
+        移除已消失的子目录及其中各项
+
+        Returns:
+            set: 移除的文件和子目录的相对路径
+        """
+        removed = set()
+        prefix = directory + "/"
+        for path in [path for path in self.dirs if path == directory or path.startswith(prefix)]:
+            del self.dirs[path]
+            removed |= self.entries.pop(path, {}).keys()
+        self.recent = {path for path in self.recent if not path.startswith(prefix)}
+        return removed
+
+    def _poll(self, full=False):
+        """
+        检查一次目录的变化
+
+        Args:
+            full: 是否重新列出所有目录
+
+        Returns:
+            set: 变化的文件或子目录的相对路径
+        """
+        changed = set()
+        for directory in list(self.dirs):
+            # 上级目录重新列出时可能已移除
+            if directory not in self.dirs:
+                continue
+            mtime = self.dirs[directory]
+            if not full and mtime is not None:
+                try:
+                    if os.stat(os.path.join(self.directory, directory)).st_mtime_ns == mtime:
+                        continue
+                except OSError:
+                    pass
+            changed |= self._scan_dir(directory)
+        recent_since = time.time_ns() - RECENT_SECONDS * 10 ** 9
+        for path in list(self.recent):
+            parent = path.rpartition("/")[0]
+            entries = self.entries.get(parent)
+            try:
+                file_stats = os.stat(os.path.join(self.directory, path))
+            except OSError:
+                # 已删除的文件由所在目录的变化报告
+                self.recent.discard(path)
+                continue
+            if entries is None or path not in entries:
+                self.recent.discard(path)
+                continue
+            current = (file_stats.st_size, file_stats.st_mtime_ns)
+            if entries[path] != current:
+                entries[path] = current
+                changed.add(path)
+            if file_stats.st_mtime_ns <= recent_since:
+                self.recent.discard(path)
+        return changed
+
+    def _run(self):
+        polls = 0
+        while not self.stopped.wait(self.interval):
+            polls += 1
+            try:
+                changed = self._poll(full=polls % FULL_SCAN_POLLS == 0)
+            except Exception as e:
+                logger.error(f"轮询目录失败: {e}")
+                continue
+            if changed:
+                self._notify(changed)
+
+def create_watcher(directory, on_change, poll_interval=POLL_INTERVAL):
+    """
+    创建目录监视器，Linux上使用inotify，不可用时退回到轮询
+
+    Args:
+        directory: 监视的目录
+        on_change: 回调函数，见FileWatcher
+        poll_interval: 轮询间隔（秒）
+
+    Returns:
+        FileWatcher: 尚未启动的监视器
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory, on_change)
+        except (OSError, AttributeError) as e:
+            # 例如达到了max_user_watches或max_user_instances上限
+            logger.warning(f"无法使用inotify，改为轮询: {e}")
+    return PollingWatcher(directory, on_change, poll_interval)
@@ -0,0 +1,176 @@
+import heapq
+import math
+import re
+from collections import Counter
+
+# 搜索默认返回的结果数和上限
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 500
+# 模糊匹配时名称中至少要出现的查询三元组比例
+FUZZY_THRESHOLD = 0.5
+
+def _trigrams(text):
+    """
+    Returns:
+        set: 文本中所有连续3个字符的子串
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _padded_trigrams(text):
+    """
+    前后补空格再取三元组，开头和结尾的字符也能组成三元组，模糊匹配时名称开头相同的得分更高
+
+    Returns:
+        set: 三元组集合
+    """
+    return _trigrams(f" {text} ")
+
+class TrigramIndex:
+    """
+    名称的三元组倒排索引，用于按子串或模糊搜索文件和文件夹。
+    每个名称按连续3个字符拆分，记录每个三元组出现在哪些名称中；
+    子串搜索取查询中各三元组对应集合的交集，只需检查交集中的名称，不遍历所有名称。
+    倒排表中保存整数编号而不是路径，求交集和计数时比字符串快。
+    不加锁，由调用方保证线程安全
+    """
+
+    def __init__(self):
+        # 路径到编号的映射
+        self.ids = {}
+        # 编号到路径和小写名称的映射，已删除的为None
+        self.paths = []
+        self.names = []
+        # 可重新使用的编号
+        self.free_ids = []
+        # 三元组到名称包含它的编号集合的映射
+        self.postings = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, path, name):
+        """
+        加入或更新路径的名称
+
+        Args:
+            path: 文件或文件夹路径
+            name: 用于搜索的名称
+        """
+        name = name.lower()
+        doc_id = self.ids.get(path)
+        if doc_id is not None:
+            if self.names[doc_id] == name:
+                return
+            self.remove(path)
+        if self.free_ids:
+            doc_id = self.free_ids.pop()
+            self.paths[doc_id] = path
+            self.names[doc_id] = name
+        else:
+            doc_id = len(self.paths)
+            self.paths.append(path)
+            self.names.append(name)
+        self.ids[path] = doc_id
+        for gram in _padded_trigrams(name):
+            self.postings.setdefault(gram, set()).add(doc_id)
+
+    def remove(self, path):
+        """
+        Returns:
+            bool: 索引中有该路径返回True
+        """
+        doc_id = self.ids.pop(path, None)
+        if doc_id is None:
+            return False
+        for gram in _padded_trigrams(self.names[doc_id]):
+            doc_ids = self.postings[gram]
+            doc_ids.discard(doc_id)
+            if not doc_ids:
+                del self.postings[gram]
+        self.paths[doc_id] = self.names[doc_id] = None
+        self.free_ids.append(doc_id)
+        return True
+
+    def clear(self):
+        self.ids.clear()
+        self.paths.clear()
+        self.names.clear()
+        self.free_ids.clear()
+        self.postings.clear()
+
+    def _rank(self, matched, query, limit):
+        """
+        子串匹配的结果按等级排序：名称开头、单词开头、名称中间，同一等级内名称短的在前。
+        逐级筛选，前面的等级已够limit个时不再检查后面的，常见的查询匹配很多名称时也只需排序一小部分
+
+        Args:
+            matched: (名称, 路径)列表
+
+        Returns:
+            list: 排在前面的最多limit个路径
+        """
+        # 前面不是字母或数字的位置为单词开头，下划线也视为分隔符
+        word_start = re.compile(r"(?<![^\W_])" + re.escape(query)).search
+        prefixed = [item for item in matched if item[0].startswith(query)]
+        tiers = [prefixed]
+        if len(prefixed) < limit:
+            rest = [item for item in matched if not item[0].startswith(query)]
+            words = [item for item in rest if word_start(item[0])]
+            tiers.append(words)
+            if len(prefixed) + len(words) < limit:
+                tiers.append([item for item in rest if not word_start(item[0])])
+        results = []
+        for tier in tiers:
+            results += heapq.nsmallest(limit - len(results), tier, key=lambda item: (len(item[0]), item))
+        return [path for _, path in results]
+
+    def _fuzzy(self, query, limit, accept):
+        """
+        模糊匹配：名称中出现的查询三元组足够多即可，按出现的比例排序
+
+        Returns:
+            list: 最多limit个路径
+        """
+        query_grams = _padded_trigrams(query)
+        counts = Counter()
+        for gram in query_grams:
+            counts.update(self.postings.get(gram, ()))
+        needed = math.ceil(len(query_grams) * FUZZY_THRESHOLD)
+        candidates = [(-count, self.names[doc_id], self.paths[doc_id])
+                      for doc_id, count in counts.items() if count >= needed]
+        if accept is not None:
+            candidates = [item for item in candidates if accept(item[2])]
+        ranked = heapq.nsmallest(limit, candidates, key=lambda item: (item[0], len(item[1]), item[1:]))
+        return [path for _, _, path in ranked]
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT, accept=None):
+        """
+        搜索名称包含查询的路径，按匹配程度排序；没有名称包含查询时，
+        返回名称中出现了足够多查询三元组的模糊匹配（例如拼错了一个字符）
+
+        Args:
+            query: 查询，不区分大小写
+            limit: 最多返回的结果数
+            accept: 筛选路径的函数，返回False的路径不出现在结果中
+
+        Returns:
+            list: 路径列表，匹配程度高的在前
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        names, paths = self.names, self.paths
+        if len(query) < 3:
+            # 不足3个字符无法使用三元组，直接检查所有名称
+            candidates = self.ids.values()
+        else:
+            postings = sorted((self.postings.get(gram, set()) for gram in _trigrams(query)), key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        matched = [(names[doc_id], paths[doc_id]) for doc_id in candidates if query in names[doc_id]]
+        if accept is not None:
+            matched = [item for item in matched if accept(item[1])]
+        if matched:
+            return self._rank(matched, query, limit)
+        if len(query) < 3:
+            return []
+        return self._fuzzy(query, limit, accept)
@@ -0,0 +1,252 @@
+import functools
+import io
+import os
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .logger import logger
+
+# Pillow为可选依赖，未安装时不生成图片缩略图；视频缩略图需要系统中有ffmpeg
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# 缩略图尺寸名称到最长边像素数的映射
+THUMBNAIL_SIZES = {"small": 128, "medium": 256, "large": 512}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".mkv", ".avi", ".webm", ".m4v"}
+# 生成缩略图的线程数，Pillow解码和缩放时会释放GIL
+THUMBNAIL_WORKERS = min(4, os.cpu_count() or 1)
+THUMBNAIL_QUALITY = 85
+# 截取视频画面的时间点（秒）和超时时间
+VIDEO_SEEK_SECONDS = 1
+FFMPEG_TIMEOUT = 30
+
+@functools.lru_cache(maxsize=None)
+def _ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+def thumbnail_kind(filename):
+    """
+    判断文件能否在当前环境下生成缩略图
+
+    Args:
+        filename: 文件名
+
+    Returns:
+        str or None: "image"、"video"，不支持时返回None
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in IMAGE_EXTENSIONS and Image is not None:
+        return "image"
+    if ext in VIDEO_EXTENSIONS and _ffmpeg_available():
+        return "video"
+    return None
+
+def render_image(opener, size):
+    """
+    生成图片缩略图，按EXIF方向旋转，有透明通道时保存为PNG，否则保存为JPEG
+
+    Args:
+        opener: 打开原图的函数，返回可读的文件对象
+        size: 最长边像素数
+
+    Returns:
+        tuple: (缩略图数据, 扩展名)
+    """
+    with opener() as src, Image.open(src) as image:
+        # JPEG解码时直接缩小，大照片无需完整解码
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image.save(output, "PNG", optimize=True)
+            return output.getvalue(), "png"
+        image.convert("RGB").save(output, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        return output.getvalue(), "jpg"
+
+def render_video(file_path, size):
+    """
+    用ffmpeg截取视频开头的一帧作为缩略图
+
+    Args:
+        file_path: 视频文件路径
+        size: 最长边像素数
+
+    Returns:
+        tuple: (缩略图数据, 扩展名)
+
+    Raises:
+        RuntimeError: ffmpeg未能截取画面
+    """
+    command = [
+        "ffmpeg", "-v", "error", "-ss", str(VIDEO_SEEK_SECONDS), "-i", file_path,
+        "-frames:v", "1", "-vf", f"scale={size}:{size}:force_original_aspect_ratio=decrease",
+        "-f", "image2", "-c:v", "mjpeg", "pipe:1"
+    ]
+    result = subprocess.run(command, capture_output=True, timeout=FFMPEG_TIMEOUT)
+    if not result.stdout:
+        # 视频短于截取时间点时从第一帧截取
+        command[command.index("-ss") + 1] = "0"
+        result = subprocess.run(command, capture_output=True, timeout=FFMPEG_TIMEOUT)
+    if not result.stdout:
+        raise RuntimeError(result.stderr.decode("utf-8", "replace").strip() or "ffmpeg没有输出")
+    return result.stdout, "jpg"
+
+class ThumbnailCache:
+    """
+    缩略图缓存类，按文件内容和尺寸保存生成的缩略图，在线程池中生成，
+    不阻塞请求线程。内容变化后键不同，旧缩略图不会再被使用；
+    缓存总大小超出上限时按最近使用时间淘汰
+    """
+
+    def __init__(self, cache_dir, max_size=256 * 1024 * 1024):
+        """
+        初始化缩略图缓存
+
+        Args:
+            cache_dir: 缓存目录
+            max_size: 缓存总大小上限（字节），0表示不启用
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # (内容键, 尺寸)到(扩展名, 文件大小)的映射，按最近使用时间排序
+        self.entries = OrderedDict()
+        self.total_size = 0
+        # 生成失败的缩略图，不再重复尝试
+        self.failed = set()
+        # 正在等待生成的缩略图
+        self.pending = set()
+        self.executor = None
+        self._load_entries()
+
+    def _load_entries(self):
+        """
+        扫描缓存目录，按修改时间恢复使用顺序
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                parts = entry.name.split(".")
+                if entry.is_file() and len(parts) == 3 and parts[1] in THUMBNAIL_SIZES:
+                    file_stats = entry.stat()
+                    found.append((file_stats.st_mtime, parts[0], parts[1], parts[2], file_stats.st_size))
+        for _, key, size_name, ext, size in sorted(found):
+            self.entries[(key, size_name)] = (ext, size)
+            self.total_size += size
+
+    def _thumbnail_path(self, key, size_name, ext):
+        return os.path.join(self.cache_dir, f"{key}.{size_name}.{ext}")
+
+    def get(self, key, size_name):
+        """
+        获取已生成的缩略图
+
+        Args:
+            key: 文件内容键
+            size_name: 尺寸名称
+
+        Returns:
+            str or None: 缩略图路径，尚未生成时返回None
+        """
+        with self.lock:
+            entry = self.entries.get((key, size_name))
+            if entry is None:
+                return None
+            self.entries.move_to_end((key, size_name))
+        return self._thumbnail_path(key, size_name, entry[0])
+
+    def schedule(self, key, size_name, render):
+        """
+        在线程池中生成缩略图，同一缩略图不会重复排队
+
+        Args:
+            key: 文件内容键
+            size_name: 尺寸名称
+            render: 生成缩略图的函数，接收最长边像素数，返回(缩略图数据, 扩展名)
+
+        Returns:
+            bool: 已排队或正在生成返回True，未启用缓存或之前生成失败返回False
+        """
+        if not self.max_size:
+            return False
+        with self.lock:
+            if (key, size_name) in self.failed:
+                return False
+            if (key, size_name) in self.pending or (key, size_name) in self.entries:
+                return True
+            self.pending.add((key, size_name))
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnails")
+        self.executor.submit(self._build, key, size_name, render)
+        return True
+
+    def _build(self, key, size_name, render):
+        """
+        生成缩略图并写入缓存目录
+        """
+        temp_path = None
+        try:
+            data, ext = render(THUMBNAIL_SIZES[size_name])
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = self._thumbnail_path(key, size_name, ext) + ".tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self._thumbnail_path(key, size_name, ext))
+            temp_path = None
+            self._add_entry(key, size_name, ext, len(data))
+        except Exception as e:
+            logger.error(f"生成缩略图失败: {key}.{size_name}, {e}")
+            with self.lock:
+                self.failed.add((key, size_name))
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            with self.lock:
+                self.pending.discard((key, size_name))
+
+    def _add_entry(self, key, size_name, ext, size):
+        """
+        记录新生成的缩略图，超出缓存上限时淘汰最久未使用的缩略图
+        """
+        with self.lock:
+            self.entries[(key, size_name)] = (ext, size)
+            self.total_size += size
+            evicted = []
+            while self.total_size > self.max_size and self.entries:
+                (evicted_key, evicted_size_name), (evicted_ext, evicted_bytes) = self.entries.popitem(last=False)
+                self.total_size -= evicted_bytes
+                evicted.append(self._thumbnail_path(evicted_key, evicted_size_name, evicted_ext))
+        for path in evicted:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def remove(self, key):
+        """
+        删除内容的所有缩略图
+
+        Args:
+            key: 文件内容键
+        """
+        with self.lock:
+            keys = [entry_key for entry_key in self.entries if entry_key[0] == key]
+            paths = []
+            for entry_key in keys:
+                ext, size = self.entries.pop(entry_key)
+                self.total_size -= size
+                paths.append(self._thumbnail_path(*entry_key, ext))
+            self.failed = {entry_key for entry_key in self.failed if entry_key[0] != key}
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
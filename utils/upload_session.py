@@ -0,0 +1,628 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from .blob_store import HASH_BUFFER_SIZE
+from .compression import is_compressible
+from .file_utils import file_utils, copy_stream, join_path, HashingFile, UploadTooLargeError
+from .logger import logger
+
+# 默认分块大小：4MB
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+# 会话闲置超过该时间（秒）后被清理，释放数据文件和预留的磁盘空间
+DEFAULT_SESSION_TTL = 3600
+# 每个客户端同时进行的会话数上限
+DEFAULT_MAX_SESSIONS_PER_CLIENT = 16
+
+class TooManySessionsError(Exception):
+    """
+    客户端同时进行的上传会话过多
+    """
+    pass
+
+class ChunkBitmap:
+    """
+    分块位图，每一位表示对应的分块是否已完整接收
+    """
+
+    def __init__(self, chunk_count, data=None):
+        """
+        初始化分块位图
+
+        Args:
+            chunk_count: 分块总数
+            data: 已有的位图数据（bytes），为None时创建全0位图
+        """
+        self.chunk_count = chunk_count
+        self.bits = bytearray(data) if data is not None else bytearray((chunk_count + 7) // 8)
+        self.done_count = sum(1 for i in range(chunk_count) if self.is_set(i))
+
+    def is_set(self, index):
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def set(self, index):
+        """
+        标记分块已接收
+
+        Returns:
+            bool: 该分块此前未被标记时返回True
+        """
+        if self.is_set(index):
+            return False
+        self.bits[index >> 3] |= 1 << (index & 7)
+        self.done_count += 1
+        return True
+
+    def is_full(self):
+        return self.done_count == self.chunk_count
+
+    def to_hex(self):
+        return self.bits.hex()
+
+class UploadSessionManager:
+    """
+    分块上传会话管理类，用于实现分块上传和断点续传
+
+    每个上传会话在会话目录中对应两个文件：
+    <upload_id>.json 保存会话元数据（文件名、大小、分块位图等），
+    <upload_id>.part 保存已接收的文件数据，创建会话时即预分配为声明的大小，
+    分块可以按任意顺序、多个并发地写入各自的偏移处，位图填满后自动提交文件。
+    闲置超过session_ttl秒的会话由expire_sessions清理，包括服务重启前遗留的会话。
+    """
+
+    def __init__(self, file_utils, session_dir=None, session_ttl=DEFAULT_SESSION_TTL,
+                 max_sessions_per_client=DEFAULT_MAX_SESSIONS_PER_CLIENT):
+        """
+        初始化上传会话管理器
+
+        Args:
+            file_utils: 文件处理工具实例，会话完成后通过它提交文件
+            session_dir: 会话目录，默认为上传目录下的.sessions目录
+            session_ttl: 会话闲置多少秒后被清理
+            max_sessions_per_client: 每个客户端同时进行的会话数上限，None表示不限制
+        """
+        self.file_utils = file_utils
+        self.session_dir = session_dir or os.path.join(file_utils.upload_dir, ".sessions")
+        self.session_ttl = session_ttl
+        self.max_sessions_per_client = max_sessions_per_client
+        # 定期清理闲置会话的线程
+        self.reaper = None
+        self.reaper_stop = threading.Event()
+        # 会话字典，key为upload_id，value为会话信息
+        self.sessions = {}
+        # 分块位图字典，key为upload_id
+        self.bitmaps = {}
+        # 每个会话一个条件变量，只保护位图和元数据的更新，分块数据的写入互不阻塞
+        self.session_locks = {}
+        # 每个会话正在写入的分块数，提交或删除会话前等待它们写完
+        self.writing = {}
+        # 正在提交或删除、不再接受分块的会话
+        self.closing = set()
+        # 增量哈希状态，key为upload_id，value为[哈希对象, 下一个待计算的分块序号]，
+        # 启用存储压缩时哈希对象为边写边压缩的临时文件
+        self.hashers = {}
+        # 每个客户端正在创建、尚未加入sessions的会话数，计入同时进行的会话数
+        self.creating = {}
+        self.lock = threading.Lock()
+        self._load_sessions()
+
+    def _load_sessions(self):
+        """
+        从会话目录加载未完成的会话，使服务重启后仍可续传
+        """
+        if not os.path.isdir(self.session_dir):
+            return
+        names = set(os.listdir(self.session_dir))
+        for name in names:
+            # 清理没有元数据的数据文件和写了一半的元数据
+            orphan = name.endswith(".part") and name[:-len(".part")] + ".json" not in names
+            if orphan or name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(self.session_dir, name))
+                except OSError as e:
+                    logger.error(f"删除遗留的会话文件失败: {name}, {e}")
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.session_dir, name), "r", encoding="utf-8") as f:
+                    session = json.load(f)
+                upload_id = session["upload_id"]
+                # 旧版本的会话没有记录最后活动时间，按元数据文件的修改时间计算
+                session.setdefault("last_active", os.path.getmtime(os.path.join(self.session_dir, name)))
+                if self._is_idle(session, time.time()):
+                    # 服务停止期间已过期的会话直接删除，不再预留磁盘空间
+                    self._delete_files(upload_id)
+                    logger.info(f"删除过期的上传会话: {upload_id}")
+                    continue
+                self.sessions[upload_id] = session
+                self.bitmaps[upload_id] = self._load_bitmap(session)
+                self.session_locks[upload_id] = threading.Condition()
+                # 哈希对象无法持久化，只有尚未收到任何分块的会话才能继续增量计算
+                if self.bitmaps[upload_id].done_count == 0:
+                    self.hashers[upload_id] = [hashlib.sha256(), 0]
+                try:
+                    # 已接收的分块已占用磁盘空间，只预留尚未接收的部分
+                    self.file_utils.reserve_space(upload_id, self._pending_bytes(upload_id))
+                except Exception as e:
+                    logger.warning(f"恢复上传会话时预留磁盘空间失败: {upload_id}, {e}")
+            except Exception as e:
+                logger.error(f"加载上传会话失败: {name}, {e}")
+
+    def _load_bitmap(self, session):
+        """
+        从会话元数据恢复分块位图，兼容只记录了已接收区间的旧会话
+
+        Args:
+            session: 会话信息
+
+        Returns:
+            ChunkBitmap: 分块位图
+        """
+        chunk_count = self._chunk_count(session)
+        if "bitmap" in session:
+            return ChunkBitmap(chunk_count, bytes.fromhex(session["bitmap"]))
+        bitmap = ChunkBitmap(chunk_count)
+        for start, end in session.pop("received", []):
+            for index in range(chunk_count):
+                chunk_start, chunk_end = self._chunk_range(session, index)
+                if start <= chunk_start and chunk_end <= end:
+                    bitmap.set(index)
+        session["bitmap"] = bitmap.to_hex()
+        return bitmap
+
+    @staticmethod
+    def _chunk_count(session):
+        return (session["size"] + session["chunk_size"] - 1) // session["chunk_size"]
+
+    @staticmethod
+    def _chunk_range(session, index):
+        """
+        计算分块在文件中的区间[start, end)
+        """
+        start = index * session["chunk_size"]
+        return start, min(start + session["chunk_size"], session["size"])
+
+    def _pending_bytes(self, upload_id):
+        """
+        计算尚未接收的字节数，即会话还需要预留的磁盘空间
+        """
+        session = self.sessions[upload_id]
+        bitmap = self.bitmaps[upload_id]
+        received = bitmap.done_count * session["chunk_size"]
+        if bitmap.chunk_count and bitmap.is_set(bitmap.chunk_count - 1):
+            # 最后一个分块可能不足一个分块大小
+            start, end = self._chunk_range(session, bitmap.chunk_count - 1)
+            received -= session["chunk_size"] - (end - start)
+        return session["size"] - received
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.session_dir, f"{upload_id}.json")
+
+    def _data_path(self, upload_id):
+        return os.path.join(self.session_dir, f"{upload_id}.part")
+
+    def _is_idle(self, session, now):
+        return self.session_ttl is not None and now - session["last_active"] > self.session_ttl
+
+    def _save_session(self, session):
+        """
+        保存会话元数据，先写临时文件再替换，避免中途断电留下损坏的元数据
+
+        Args:
+            session: 会话信息
+        """
+        meta_path = self._meta_path(session["upload_id"])
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(session, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+
+    def _received_ranges(self, upload_id):
+        """
+        根据分块位图生成已接收区间列表，相邻的分块合并为一个区间
+
+        Returns:
+            list: 区间列表，每项为[start, end)
+        """
+        session = self.sessions[upload_id]
+        bitmap = self.bitmaps[upload_id]
+        ranges = []
+        for index in range(bitmap.chunk_count):
+            if not bitmap.is_set(index):
+                continue
+            start, end = self._chunk_range(session, index)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        return ranges
+
+    def _session_info(self, upload_id):
+        """
+        生成返回给客户端的会话状态，next_offset为从0开始连续已接收数据的末尾
+        """
+        session = self.sessions[upload_id]
+        received = self._received_ranges(upload_id)
+        return {
+            "upload_id": upload_id,
+            "filename": session["filename"],
+            "size": session["size"],
+            "chunk_size": session["chunk_size"],
+            "received": received,
+            "next_offset": received[0][1] if received and received[0][0] == 0 else 0,
+            "completed": False
+        }
+
+    def create_session(self, filename, size, chunk_size=DEFAULT_CHUNK_SIZE, folder="", uploader=None, client=None):
+        """
+        创建上传会话
+
+        Args:
+            filename: 文件名
+            size: 文件总大小（字节）
+            chunk_size: 建议的分块大小
+            folder: 保存到的文件夹，根目录为""
+            uploader: 上传者的用户ID
+            client: 客户端标识，用于限制同时进行的会话数，默认为uploader
+
+        Returns:
+            dict: 会话状态
+
+        Raises:
+            UploadTooLargeError: 文件超出大小限制
+            InsufficientSpaceError: 磁盘剩余空间不足
+            TooManySessionsError: 客户端同时进行的会话数已达上限
+        """
+        client = client if client is not None else uploader
+        self.expire_sessions()
+        with self.lock:
+            # 检查的同时占用名额，同一客户端并发创建的会话不会超出上限
+            if (self.max_sessions_per_client is not None
+                    and sum(1 for s in self.sessions.values() if s.get("client") == client)
+                    + self.creating.get(client, 0) >= self.max_sessions_per_client):
+                raise TooManySessionsError("同时进行的上传过多")
+            self.creating[client] = self.creating.get(client, 0) + 1
+        upload_id = uuid.uuid4().hex
+        session = {
+            "upload_id": upload_id,
+            "filename": join_path(folder, os.path.basename(filename)),
+            "size": size,
+            "chunk_size": chunk_size,
+            "uploader": uploader,
+            "client": client,
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "last_active": time.time()
+        }
+        bitmap = ChunkBitmap(self._chunk_count(session))
+        session["bitmap"] = bitmap.to_hex()
+        created = False
+        try:
+            # 创建会话前检查大小限制和磁盘空间，超出时客户端不必传输任何数据
+            self.file_utils.reserve_space(upload_id, size)
+            os.makedirs(self.session_dir, exist_ok=True)
+            # 预分配为声明的大小（稀疏文件），后续分块直接写入各自的偏移处
+            with open(self._data_path(upload_id), "wb") as f:
+                f.truncate(size)
+            self._save_session(session)
+            created = True
+        finally:
+            if not created:
+                self.file_utils.release_space(upload_id)
+                self._delete_files(upload_id)
+            with self.lock:
+                self.creating[client] -= 1
+                if not self.creating[client]:
+                    del self.creating[client]
+                if created:
+                    self.sessions[upload_id] = session
+                    self.bitmaps[upload_id] = bitmap
+                    self.session_locks[upload_id] = threading.Condition()
+                    self.hashers[upload_id] = [hashlib.sha256(), 0]
+        logger.info(f"创建上传会话: {session['filename']} ({size} 字节), upload_id: {upload_id}")
+        return self._session_info(upload_id)
+
+    def get_session(self, upload_id):
+        """
+        获取会话状态，客户端据此决定从哪里续传
+
+        Args:
+            upload_id: 会话ID
+
+        Returns:
+            dict or None: 会话状态或None
+        """
+        lock = self.session_locks.get(upload_id)
+        if lock is None:
+            return None
+        with lock:
+            if upload_id not in self.sessions:
+                return None
+            return self._session_info(upload_id)
+
+    def _is_open(self, upload_id):
+        """
+        会话是否存在且仍接受分块，调用方需持有会话锁
+        """
+        return upload_id in self.sessions and upload_id not in self.closing
+
+    def _close(self, upload_id):
+        """
+        会话不再接受新的分块，并等待已开始写入的分块写完，
+        之后数据文件才能被移入上传目录或删除。调用方需持有会话锁
+        """
+        self.closing.add(upload_id)
+        self.session_locks[upload_id].wait_for(lambda: not self.writing.get(upload_id))
+
+    def write_chunk(self, upload_id, offset, stream):
+        """
+        将一个分块写入会话数据文件的对应偏移处
+
+        分块必须与分块大小对齐且完整，多个分块可以并发、乱序写入，
+        所有分块接收完毕后自动提交文件。
+
+        Args:
+            upload_id: 会话ID
+            offset: 分块在文件中的起始偏移
+            stream: 分块数据流，需支持read方法
+
+        Returns:
+            tuple: (是否成功, 会话状态或错误信息)，文件已提交时会话状态中completed为True
+        """
+        session = self.sessions.get(upload_id)
+        lock = self.session_locks.get(upload_id)
+        if session is None or lock is None:
+            return False, "上传会话不存在"
+        index, remainder = divmod(offset, session["chunk_size"])
+        if offset < 0 or remainder or index >= self._chunk_count(session):
+            return False, "分块偏移无效"
+        start, end = self._chunk_range(session, index)
+
+        with lock:
+            if not self._is_open(upload_id):
+                return False, "上传会话不存在"
+            # 重试的分块已经收到过，不再写入，以免覆盖已计算过哈希的数据
+            if self.bitmaps[upload_id].is_set(index):
+                return True, self._session_info(upload_id)
+            self.writing[upload_id] = self.writing.get(upload_id, 0) + 1
+            # 分块开始和结束时都更新活动时间，传输较慢的分块不会被当作闲置
+            session["last_active"] = time.time()
+
+        error = None
+        try:
+            # 每个请求使用独立的文件句柄，并发写入不同偏移互不影响
+            with open(self._data_path(upload_id), "r+b") as f:
+                f.seek(start)
+                written = copy_stream(stream, f, max_bytes=end - start)
+            if written != end - start:
+                error = "分块数据不完整"
+        except UploadTooLargeError:
+            error = "分块超出文件大小"
+        except Exception as e:
+            logger.error(f"写入分块失败: {upload_id}, {e}")
+            error = f"写入分块失败: {str(e)}"
+
+        with lock:
+            self.writing[upload_id] -= 1
+            lock.notify_all()
+            if error is not None:
+                return False, error
+            if not self._is_open(upload_id):
+                # 写入期间会话已被提交、取消或清理
+                return False, "上传会话不存在"
+            bitmap = self.bitmaps[upload_id]
+            session["last_active"] = time.time()
+            if bitmap.set(index):
+                session["bitmap"] = bitmap.to_hex()
+                self._save_session(session)
+                self.file_utils.shrink_reservation(upload_id, self._pending_bytes(upload_id))
+                self._advance_hash(upload_id)
+            if bitmap.is_full():
+                return self._commit(upload_id)
+            return True, self._session_info(upload_id)
+
+    def _advance_hash(self, upload_id):
+        """
+        按顺序对已连续接收的分块计算哈希，刚写入的分块仍在页缓存中，
+        文件收齐时哈希也已算完，提交时无需再完整读一遍。调用方需持有会话锁
+        """
+        state = self.hashers.get(upload_id)
+        if state is None:
+            return
+        hasher, index = state
+        session = self.sessions[upload_id]
+        bitmap = self.bitmaps[upload_id]
+        if index >= bitmap.chunk_count or not bitmap.is_set(index):
+            return
+        if index == 0 and self.file_utils.compression and is_compressible(session["filename"]):
+            # 按顺序读到的数据同时压缩写入临时文件，提交时直接保存，不必再读写一遍。
+            # 收到第一个分块时才创建，启动时清理临时目录不会删除它
+            hasher = self.file_utils.create_temp_file(session["filename"])
+            state[0] = hasher
+        update = hasher.write if isinstance(hasher, HashingFile) else hasher.update
+        buffer = bytearray(HASH_BUFFER_SIZE)
+        view = memoryview(buffer)
+        with open(self._data_path(upload_id), "rb") as f:
+            while index < bitmap.chunk_count and bitmap.is_set(index):
+                start, end = self._chunk_range(session, index)
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    length = f.readinto(view[:min(remaining, HASH_BUFFER_SIZE)])
+                    if not length:
+                        break
+                    update(view[:length])
+                    remaining -= length
+                index += 1
+        state[1] = index
+
+    def complete_session(self, upload_id):
+        """
+        完成上传会话，校验所有分块都已接收后将文件移动到上传目录
+
+        Args:
+            upload_id: 会话ID
+
+        Returns:
+            tuple: (是否成功, 最终文件名或错误信息)
+        """
+        lock = self.session_locks.get(upload_id)
+        if lock is None:
+            return False, "上传会话不存在"
+
+        with lock:
+            # 等待锁期间会话可能已随最后一个分块提交
+            if not self._is_open(upload_id):
+                return False, "上传会话不存在"
+            if not self.bitmaps[upload_id].is_full():
+                return False, "文件数据不完整"
+            success, result = self._commit(upload_id)
+        if not success:
+            return False, result
+        return True, result["filename"]
+
+    def _commit(self, upload_id):
+        """
+        提交已接收完整的文件，调用方需持有会话锁
+
+        Returns:
+            tuple: (是否成功, 会话状态或错误信息)
+        """
+        # 数据文件会被移入上传目录，先等待重复发送的分块写完，之后到达的分块被拒绝
+        self._close(upload_id)
+        session = self.sessions[upload_id]
+        state = self.hashers.pop(upload_id, None)
+        data_path = self._data_path(upload_id)
+        temp_path, digest, encoding, size = data_path, None, None, None
+        if state and state[1] == self.bitmaps[upload_id].chunk_count:
+            hasher = state[0]
+            digest = hasher.hexdigest()
+            if isinstance(hasher, HashingFile):
+                # 提交边接收边压缩的临时文件，数据文件随会话删除
+                hasher.close()
+                temp_path, encoding, size = hasher.name, hasher.encoding, hasher.size
+        else:
+            self._discard_hasher(state)
+        success, filename = self.file_utils.commit_file(temp_path, session["filename"], digest,
+                                                        session.get("uploader"), encoding, size)
+        if not success:
+            # 删除压缩的临时文件，重试时从数据文件提交
+            if temp_path != data_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            self.closing.discard(upload_id)
+            return False, "文件保存失败"
+        info = self._session_info(upload_id)
+        info["completed"] = True
+        info["filename"] = filename
+        self._remove_session(upload_id)
+        logger.info(f"分块上传完成: {filename}")
+        return True, info
+
+    def cancel_session(self, upload_id):
+        """
+        取消上传会话并删除已接收的数据
+
+        Args:
+            upload_id: 会话ID
+
+        Returns:
+            bool: 取消成功返回True，否则返回False
+        """
+        lock = self.session_locks.get(upload_id)
+        if lock is None:
+            return False
+        with lock:
+            if not self._is_open(upload_id):
+                return False
+            self._close(upload_id)
+            self._remove_session(upload_id)
+        logger.info(f"取消上传会话: {upload_id}")
+        return True
+
+    def expire_sessions(self):
+        """
+        清理闲置超过session_ttl秒的会话，删除已接收的数据并释放预留的磁盘空间
+
+        Returns:
+            int: 清理的会话数
+        """
+        now = time.time()
+        with self.lock:
+            idle = [upload_id for upload_id, session in self.sessions.items() if self._is_idle(session, now)]
+        expired = 0
+        for upload_id in idle:
+            lock = self.session_locks.get(upload_id)
+            if lock is None:
+                continue
+            with lock:
+                # 等待锁期间会话可能已完成或收到新的分块
+                session = self.sessions.get(upload_id)
+                if (session is None or upload_id in self.closing or self.writing.get(upload_id)
+                        or not self._is_idle(session, time.time())):
+                    continue
+                self._remove_session(upload_id)
+            expired += 1
+            logger.info(f"清理闲置的上传会话: {upload_id}")
+        return expired
+
+    def start_reaper(self, interval=60):
+        """
+        启动后台线程，每隔interval秒清理一次闲置的会话
+        """
+        if self.reaper is not None:
+            return
+        self.reaper_stop.clear()
+        self.reaper = threading.Thread(target=self._reap, args=(interval,), daemon=True, name="UploadSessionReaper")
+        self.reaper.start()
+
+    def stop_reaper(self):
+        if self.reaper is None:
+            return
+        self.reaper_stop.set()
+        self.reaper.join()
+        self.reaper = None
+
+    def _reap(self, interval):
+        while not self.reaper_stop.wait(interval):
+            try:
+                self.expire_sessions()
+            except Exception as e:
+                logger.error(f"清理闲置的上传会话失败: {e}")
+
+    def _delete_files(self, upload_id):
+        """
+        删除会话的元数据和数据文件
+        """
+        for path in (self._meta_path(upload_id), self._data_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _remove_session(self, upload_id):
+        """
+        删除会话的元数据和数据文件，释放预留的磁盘空间
+        """
+        self._delete_files(upload_id)
+        self.file_utils.release_space(upload_id)
+        with self.lock:
+            self.sessions.pop(upload_id, None)
+            self.bitmaps.pop(upload_id, None)
+            self.session_locks.pop(upload_id, None)
+            state = self.hashers.pop(upload_id, None)
+            self.writing.pop(upload_id, None)
+        self._discard_hasher(state)
+        self.closing.discard(upload_id)
+
+    def _discard_hasher(self, state):
+        """
+        关闭并删除未提交的压缩临时文件
+        """
+        if state and isinstance(state[0], HashingFile):
+            state[0].close()
+            if os.path.exists(state[0].name):
+                os.remove(state[0].name)
+
+# 创建全局上传会话管理实例
+upload_session_manager = UploadSessionManager(file_utils)
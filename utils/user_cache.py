@@ -1,54 +1,64 @@
-import json
-import os
+import atexit
+import threading
 import uuid
 from datetime import datetime
 from .logger import logger
+from .user_store import DEFAULT_SAVE_INTERVAL, JsonUserStore
 
 class UserCache:
     """
-    用户缓存管理类，用于处理用户信息的存储和读取
+    用户缓存管理类，用于处理用户信息的存储和读取。
+    用户信息保存在可替换的存储中（见user_store），按用户ID和IP地址的查找由存储的索引完成；
+    在线用户和socket_id的映射只保存在内存中，每次修改时同步更新，
+    登录、发消息和断开连接时的查找不随历史用户数增长
     """
     
-    def __init__(self, cache_file="users.json"):
+    def __init__(self, cache_file="users.json", save_interval=DEFAULT_SAVE_INTERVAL, store=None):
         """
         初始化用户缓存
         
         Args:
-            cache_file: 用户缓存文件路径
+            cache_file: 用户缓存文件路径，store为None时使用
+            save_interval: 两次写入文件的最短间隔（秒），0表示每次修改立即写入，store为None时使用
+            store: 用户信息存储，None表示使用JSON文件
         """
-        self.cache_file = cache_file
-        self.users = self._load_users()
+        self.store = store if store is not None else JsonUserStore(cache_file, save_interval)
+        self.lock = threading.RLock()
         # 在线用户字典，key为user_id，value为连接计数
         self.online_users = {}
         # 用户ID到socket_id列表的映射，用于跟踪每个用户的所有连接
         self.user_connections = {}
+        # socket_id到用户ID的映射
+        self.socket_users = {}
     
-    def _load_users(self):
+    def set_store(self, store):
         """
-        从文件加载用户数据
+        更换用户信息存储，启动时根据配置调用，原来的存储写入未保存的修改后关闭
+        
+        Args:
+            store: 新的用户信息存储
+        """
+        with self.lock:
+            old_store, self.store = self.store, store
+        old_store.close()
+    
+    def flush(self):
+        """
+        把尚未保存的修改写入磁盘
         
         Returns:
-            list: 用户列表
+            bool: 写入成功返回True
         """
-        try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    return data.get("users", [])
-            return []
-        except Exception as e:
-            logger.error(f"加载用户缓存失败: {e}")
-            return []
+        return self.store.flush()
     
-    def _save_users(self):
+    def close(self):
         """
-        保存用户数据到文件
+        写入未保存的修改并关闭存储，程序退出前调用
+        
+        Returns:
+            bool: 写入成功返回True
         """
-        try:
-            with open(self.cache_file, "w", encoding="utf-8") as f:
-                json.dump({"users": self.users}, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"保存用户缓存失败: {e}")
+        return self.store.close()
     
     def get_user_by_ip(self, ip_address):
         """
@@ -60,10 +70,19 @@ class UserCache:
         Returns:
             dict or None: 用户信息或None
         """
-        for user in self.users:
-            if user.get("ip_address") == ip_address:
-                return user
-        return None
+        return self.store.get_by_ip(ip_address)
+    
+    def get_user_by_id(self, user_id):
+        """
+        根据用户ID获取用户信息
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            dict or None: 用户信息或None
+        """
+        return self.store.get_by_id(user_id)
     
     def create_user(self, ip_address, device_info=""):
         """
@@ -76,25 +95,25 @@ class UserCache:
         Returns:
             dict: 新用户信息
         """
-        # 检查是否已有该IP的用户
-        existing_user = self.get_user_by_ip(ip_address)
-        if existing_user:
-            return existing_user
-        
-        # 创建新用户
-        user_id = str(uuid.uuid4())
-        username = f"用户_{len(self.users) + 1}"
-        user = {
-            "user_id": user_id,
-            "username": username,
-            "ip_address": ip_address,
-            "device_info": device_info,
-            "last_seen": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        # 添加到用户列表并保存
-        self.users.append(user)
-        self._save_users()
+        with self.lock:
+            # 检查是否已有该IP的用户
+            existing_user = self.get_user_by_ip(ip_address)
+            if existing_user:
+                return existing_user
+            
+            # 创建新用户
+            user_id = str(uuid.uuid4())
+            username = f"用户_{self.store.count() + 1}"
+            user = {
+                "user_id": user_id,
+                "username": username,
+                "ip_address": ip_address,
+                "device_info": device_info,
+                "last_seen": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            
+            # 添加到存储
+            user = self.store.save(user)
         logger.info(f"创建新用户: {username} ({ip_address})")
         return user
     
@@ -109,14 +128,16 @@ class UserCache:
         Returns:
             dict or None: 更新后的用户信息或None
         """
-        for i, user in enumerate(self.users):
-            if user.get("user_id") == user_id:
-                self.users[i].update(update_data)
-                self.users[i]["last_seen"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                self._save_users()
-                logger.info(f"更新用户信息: {user.get('username')} -> {update_data}")
-                return self.users[i]
-        return None
+        with self.lock:
+            user = self.store.get_by_id(user_id)
+            if user is None:
+                return None
+            # 用户ID不可修改，否则索引会失效
+            update_data = {key: value for key, value in update_data.items() if key != "user_id"}
+            user = self.store.save({**user, **update_data,
+                                    "last_seen": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+        logger.info(f"更新用户信息: {user.get('username')} -> {update_data}")
+        return user
     
     def get_all_users(self):
         """
@@ -125,7 +146,7 @@ class UserCache:
         Returns:
             list: 用户列表
         """
-        return self.users
+        return self.store.get_all()
     
     def update_user_last_seen(self, user_id):
         """
@@ -144,17 +165,19 @@ class UserCache:
             user_id: 用户ID
             socket_id: 可选，socket连接ID，用于跟踪用户的连接
         """
-        # 更新在线用户计数
-        if user_id in self.online_users:
-            self.online_users[user_id] += 1
-        else:
-            self.online_users[user_id] = 1
-        
-        # 记录socket_id到user_id的映射
-        if socket_id:
-            if user_id not in self.user_connections:
-                self.user_connections[user_id] = set()
-            self.user_connections[user_id].add(socket_id)
+        with self.lock:
+            # 更新在线用户计数
+            if user_id in self.online_users:
+                self.online_users[user_id] += 1
+            else:
+                self.online_users[user_id] = 1
+            
+            # 记录socket_id到user_id的映射
+            if socket_id:
+                if user_id not in self.user_connections:
+                    self.user_connections[user_id] = set()
+                self.user_connections[user_id].add(socket_id)
+                self.socket_users[socket_id] = user_id
     
     def remove_online_user(self, user_id, socket_id=None):
         """
@@ -164,19 +187,22 @@ class UserCache:
             user_id: 用户ID
             socket_id: 可选，socket连接ID，用于移除特定连接
         """
-        # 更新连接计数
-        if user_id in self.online_users:
-            self.online_users[user_id] -= 1
-            # 如果计数为0，从在线用户字典中移除
-            if self.online_users[user_id] <= 0:
-                del self.online_users[user_id]
-        
-        # 更新socket连接映射
-        if socket_id and user_id in self.user_connections:
-            self.user_connections[user_id].discard(socket_id)
-            # 如果用户没有连接了，移除该用户的连接映射
-            if not self.user_connections[user_id]:
-                del self.user_connections[user_id]
+        with self.lock:
+            # 更新连接计数
+            if user_id in self.online_users:
+                self.online_users[user_id] -= 1
+                # 如果计数为0，从在线用户字典中移除
+                if self.online_users[user_id] <= 0:
+                    del self.online_users[user_id]
+            
+            # 更新socket连接映射
+            if socket_id and user_id in self.user_connections:
+                self.user_connections[user_id].discard(socket_id)
+                if self.socket_users.get(socket_id) == user_id:
+                    del self.socket_users[socket_id]
+                # 如果用户没有连接了，移除该用户的连接映射
+                if not self.user_connections[user_id]:
+                    del self.user_connections[user_id]
     
     def get_user_by_socket_id(self, socket_id):
         """
@@ -188,23 +214,21 @@ class UserCache:
         Returns:
             str or None: 用户ID或None
         """
-        for user_id, sockets in self.user_connections.items():
-            if socket_id in sockets:
-                return user_id
-        return None
+        return self.socket_users.get(socket_id)
     
     def get_online_users(self):
         """
-        获取在线用户列表
+        获取在线用户列表，按上线顺序排列
         
         Returns:
             list: 在线用户列表
         """
-        online_user_list = []
-        for user in self.users:
-            if user.get('user_id') in self.online_users:
-                online_user_list.append(user)
-        return online_user_list
+        with self.lock:
+            user_ids = list(self.online_users)
+        users = [self.store.get_by_id(user_id) for user_id in user_ids]
+        return [user for user in users if user is not None]
 
 # 创建全局用户缓存实例
-user_cache = UserCache()
\ No newline at end of file
+user_cache = UserCache()
+# 正常退出时写入尚未保存的修改
+atexit.register(user_cache.close)
\ No newline at end of file
@@ -0,0 +1,310 @@
+import abc
+import json
+import os
+import sqlite3
+import threading
+from .logger import logger
+from .write_behind import DEFAULT_SAVE_INTERVAL, WriteBehindFile
+
+# SQLite存储保存的用户字段
+USER_FIELDS = ("user_id", "username", "ip_address", "device_info", "last_seen")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    username TEXT,
+    ip_address TEXT,
+    device_info TEXT,
+    last_seen TEXT
+);
+CREATE INDEX IF NOT EXISTS users_ip_address ON users (ip_address);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class UserStore(abc.ABC):
+    """
+    用户信息存储基类，UserCache通过它查找和保存用户。
+    用户信息为包含USER_FIELDS等字段的字典，用户不会被删除
+    """
+
+    @abc.abstractmethod
+    def get_by_id(self, user_id):
+        """
+        Returns:
+            dict or None: 用户信息
+        """
+
+    @abc.abstractmethod
+    def get_by_ip(self, ip_address):
+        """
+        Returns:
+            dict or None: 该IP最早创建的用户信息
+        """
+
+    @abc.abstractmethod
+    def get_all(self):
+        """
+        Returns:
+            list: 按创建顺序排列的所有用户
+        """
+
+    @abc.abstractmethod
+    def count(self):
+        """
+        Returns:
+            int: 用户数
+        """
+
+    @abc.abstractmethod
+    def save(self, user):
+        """
+        加入新用户或更新已有用户
+
+        Args:
+            user: 用户信息
+
+        Returns:
+            dict: 保存后的用户信息
+        """
+
+    def flush(self):
+        """
+        把尚未保存的修改写入磁盘
+
+        Returns:
+            bool: 写入成功或没有需要写入的修改返回True
+        """
+        return True
+
+    def close(self):
+        return self.flush()
+
+class JsonUserStore(UserStore):
+    """
+    把所有用户保存在一个JSON文件中，首次使用时整个读入内存，按用户ID和IP地址建立字典索引。
+    修改后不立即写文件，而是标记为有未保存的修改，由定时器合并写入
+    """
+
+    def __init__(self, cache_file="users.json", save_interval=DEFAULT_SAVE_INTERVAL):
+        """
+        Args:
+            cache_file: 用户缓存文件路径
+            save_interval: 两次写入文件的最短间隔（秒），0表示每次修改立即写入
+        """
+        # 首次使用时才读取文件，按创建时的当前目录确定路径
+        self.cache_file = os.path.abspath(cache_file)
+        self.lock = threading.RLock()
+        self.users = None
+        # 用户ID和IP地址到用户信息的索引，同一IP有多个用户时取列表中靠前的
+        self.users_by_id = {}
+        self.users_by_ip = {}
+        # 用户信息会被就地修改，快照需复制每个用户
+        self.writer = WriteBehindFile(self.cache_file, lambda: {"users": [dict(user) for user in self.users]},
+                                      self.lock, save_interval, indent=2)
+
+    def _ensure_loaded(self):
+        """
+        首次使用时读取文件，导入模块时不读取
+        """
+        if self.users is not None:
+            return
+        with self.lock:
+            if self.users is None:
+                users = self._load_users()
+                for user in users:
+                    self.users_by_id.setdefault(user.get("user_id"), user)
+                    self.users_by_ip.setdefault(user.get("ip_address"), user)
+                self.users = users
+
+    def _load_users(self):
+        """
+        从文件加载用户数据
+
+        Returns:
+            list: 用户列表
+        """
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                    return data.get("users", [])
+            return []
+        except Exception as e:
+            logger.error(f"加载用户缓存失败: {e}")
+            return []
+
+    def get_by_id(self, user_id):
+        self._ensure_loaded()
+        return self.users_by_id.get(user_id)
+
+    def get_by_ip(self, ip_address):
+        self._ensure_loaded()
+        return self.users_by_ip.get(ip_address)
+
+    def get_all(self):
+        self._ensure_loaded()
+        return self.users
+
+    def count(self):
+        self._ensure_loaded()
+        return len(self.users)
+
+    def save(self, user):
+        """
+        加入或更新用户，已有的用户就地更新，之前返回的用户信息随之变化
+        """
+        self._ensure_loaded()
+        with self.lock:
+            existing = self.users_by_id.get(user["user_id"])
+            if existing is None:
+                existing = user
+                self.users.append(user)
+                self.users_by_id[user["user_id"]] = user
+                self.users_by_ip.setdefault(user.get("ip_address"), user)
+            else:
+                old_ip = existing.get("ip_address")
+                existing.update(user)
+                if existing.get("ip_address") != old_ip:
+                    self._reindex_ip(existing, old_ip)
+            self._mark_dirty()
+            return existing
+
+    def _reindex_ip(self, user, old_ip):
+        """
+        用户的IP地址变化后更新IP索引，调用方需持有锁
+        """
+        if self.users_by_ip.get(old_ip) is user:
+            del self.users_by_ip[old_ip]
+            # 同一IP的其他用户补上
+            for other in self.users:
+                if other.get("ip_address") == old_ip:
+                    self.users_by_ip[old_ip] = other
+                    break
+        self.users_by_ip.setdefault(user.get("ip_address"), user)
+
+    def _mark_dirty(self):
+        """
+        标记有未保存的修改，由定时器合并写入文件。调用方需持有锁
+        """
+        self.writer.mark_dirty()
+
+    def flush(self):
+        """
+        立即写入未保存的修改，写入中途程序退出或断电时原文件保持完整
+        """
+        return self.writer.flush()
+
+class SqliteUserStore(UserStore):
+    """
+    把用户保存在SQLite数据库（WAL模式）中，按用户ID和IP地址的查询由索引完成，
+    启动时不读取所有用户，修改时只写入变化的一行，耗时不随用户数增长。
+    只保存USER_FIELDS中的字段
+    """
+
+    def __init__(self, db_path, json_file=None):
+        """
+        打开或创建数据库，首次打开时导入原来的JSON用户文件
+
+        Args:
+            db_path: 数据库文件路径
+            json_file: 原来的用户缓存文件路径，None表示不导入
+        """
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        # 请求处理线程共用一个连接，由锁保证同一时间只有一个线程使用
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # WAL模式下NORMAL只在检查点时同步，断电最多丢失最近的事务，数据库不会损坏
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        if json_file is not None:
+            self.migrate_from_json(json_file)
+
+    def migrate_from_json(self, json_file):
+        """
+        导入JSON用户文件中的用户，每个数据库只导入一次，之后JSON文件不再使用也不会被修改
+
+        Args:
+            json_file: 用户缓存文件路径
+
+        Returns:
+            int: 导入的用户数，已导入过时返回0
+        """
+        with self.lock, self.connection:
+            if self.connection.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+            users = JsonUserStore(json_file)._load_users()
+            # 按原来的顺序插入，rowid保持创建顺序；同一用户ID出现多次时保留第一个
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO users (user_id, username, ip_address, device_info, last_seen) "
+                "VALUES (?, ?, ?, ?, ?)", [tuple(user.get(field) for field in USER_FIELDS) for user in users])
+            self.connection.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (json_file,))
+        if users:
+            logger.info(f"已从{json_file}导入 {len(users)} 个用户")
+        return len(users)
+
+    def _fetch_one(self, sql, params):
+        with self.lock:
+            row = self.connection.execute(sql, params).fetchone()
+        return dict(row) if row else None
+
+    def get_by_id(self, user_id):
+        return self._fetch_one("SELECT user_id, username, ip_address, device_info, last_seen FROM users "
+                               "WHERE user_id = ?", (user_id,))
+
+    def get_by_ip(self, ip_address):
+        return self._fetch_one("SELECT user_id, username, ip_address, device_info, last_seen FROM users "
+                               "WHERE ip_address = ? ORDER BY rowid LIMIT 1", (ip_address,))
+
+    def get_all(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT user_id, username, ip_address, device_info, last_seen FROM users ORDER BY rowid").fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self):
+        # 用户不会被删除，最大的rowid即为用户数，不需要像COUNT(*)那样遍历整个表
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(MAX(rowid), 0) FROM users").fetchone()[0]
+
+    def save(self, user):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO users (user_id, username, ip_address, device_info, last_seen) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET username = excluded.username, "
+                "ip_address = excluded.ip_address, device_info = excluded.device_info, "
+                "last_seen = excluded.last_seen", tuple(user.get(field) for field in USER_FIELDS))
+        return user
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+        return True
+
+def create_user_store(kind="json", cache_file="users.json", save_interval=DEFAULT_SAVE_INTERVAL):
+    """
+    创建用户信息存储
+
+    Args:
+        kind: json（所有用户保存在一个JSON文件中）或sqlite（SQLite数据库，与JSON文件同名、扩展名为.db）
+        cache_file: JSON用户文件路径，使用sqlite时首次启动从中导入
+        save_interval: JSON文件合并写入的最短间隔（秒）
+
+    Returns:
+        UserStore: 用户信息存储
+
+    Raises:
+        ValueError: 未知的存储方式
+    """
+    if kind == "json":
+        return JsonUserStore(cache_file, save_interval)
+    if kind == "sqlite":
+        return SqliteUserStore(os.path.splitext(cache_file)[0] + ".db", cache_file)
+    raise ValueError(f"未知的用户存储方式: {kind}")
@@ -0,0 +1,237 @@
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .logger import logger
+
+# brotli和zstd为可选依赖，未安装时只生成gzip版本
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 预压缩在后台进行，使用比实时压缩更高的压缩级别
+VARIANT_LEVELS = {"br": 9, "zstd": 12, "gzip": 9}
+# 客户端对多种编码的偏好相同时按此顺序选择，压缩率高的优先
+ENCODING_PREFERENCE = ["br", "zstd", "gzip"]
+# 压缩后不小于原大小的该比例时不保存
+MIN_SAVING_RATIO = 0.9
+# 读取原文件时的缓冲区大小
+READ_SIZE = 1024 * 1024
+
+def available_variant_encodings():
+    """
+    获取当前环境可以生成的预压缩编码
+
+    Returns:
+        list: 编码名称列表，按偏好排序
+    """
+    available = {"gzip"}
+    if brotli is not None:
+        available.add("br")
+    if zstandard is not None:
+        available.add("zstd")
+    return [encoding for encoding in ENCODING_PREFERENCE if encoding in available]
+
+def _compressor(encoding):
+    """
+    创建增量压缩器
+
+    Returns:
+        tuple: (压缩数据的函数, 结束压缩返回剩余数据的函数)
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=VARIANT_LEVELS["br"])
+        return compressor.process, compressor.finish
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=VARIANT_LEVELS["zstd"]).compressobj()
+        return compressor.compress, compressor.flush
+    # wbits=31生成带gzip头的数据
+    compressor = zlib.compressobj(VARIANT_LEVELS["gzip"], zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+class VariantCache:
+    """
+    预压缩版本缓存类，在后台为文本类文件生成gzip、brotli、zstd版本，
+    按内容哈希保存，文件内容变化后哈希不同，旧版本不会再被使用。
+    缓存总大小超出上限时按最近使用时间淘汰
+    """
+
+    def __init__(self, cache_dir, max_size=1024 * 1024 * 1024):
+        """
+        初始化预压缩缓存
+
+        Args:
+            cache_dir: 缓存目录
+            max_size: 缓存总大小上限（字节），0表示不启用
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # (哈希, 编码)到文件大小的映射，按最近使用时间排序
+        self.entries = OrderedDict()
+        self.total_size = 0
+        # 压缩后没有变小的内容，不再重复尝试
+        self.incompressible = set()
+        # 正在等待后台生成的哈希
+        self.pending = set()
+        self.executor = None
+        self._load_entries()
+
+    def _load_entries(self):
+        """
+        扫描缓存目录，按修改时间恢复使用顺序
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                digest, _, encoding = entry.name.partition(".")
+                if entry.is_file() and encoding in VARIANT_LEVELS:
+                    file_stats = entry.stat()
+                    found.append((file_stats.st_mtime, digest, encoding, file_stats.st_size))
+        for _, digest, encoding, size in sorted(found):
+            self.entries[(digest, encoding)] = size
+            self.total_size += size
+
+    def _variant_path(self, digest, encoding):
+        return os.path.join(self.cache_dir, f"{digest}.{encoding}")
+
+    def choose(self, digest, accept_encodings):
+        """
+        选择客户端接受的最佳预压缩版本
+
+        Args:
+            digest: 文件内容哈希
+            accept_encodings: 请求的Accept-Encoding（werkzeug的Accept对象）
+
+        Returns:
+            tuple or None: (编码, 文件路径)，没有可用的版本时返回None
+        """
+        if not self.max_size:
+            return None
+        best = None
+        with self.lock:
+            for rank, encoding in enumerate(ENCODING_PREFERENCE):
+                quality = accept_encodings[encoding]
+                if quality <= 0 or (digest, encoding) not in self.entries:
+                    continue
+                if best is None or (quality, -rank) > best[0]:
+                    best = ((quality, -rank), encoding)
+            if best is None:
+                return None
+            encoding = best[1]
+            self.entries.move_to_end((digest, encoding))
+        return encoding, self._variant_path(digest, encoding)
+
+    def schedule(self, digest, opener, skip=None):
+        """
+        在后台为内容生成缺少的预压缩版本，同一内容不会重复排队
+
+        Args:
+            digest: 文件内容哈希
+            opener: 打开原始内容的函数，返回可读的文件对象
+            skip: 不需要生成的编码，例如文件存储时已使用的压缩编码
+        """
+        if not self.max_size:
+            return
+        with self.lock:
+            missing = [encoding for encoding in available_variant_encodings()
+                       if encoding != skip and (digest, encoding) not in self.entries]
+            if not missing or digest in self.pending or digest in self.incompressible:
+                return
+            self.pending.add(digest)
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="variants")
+        self.executor.submit(self._build, digest, opener, missing)
+
+    def _build(self, digest, opener, encodings):
+        """
+        读取一遍原始内容，同时生成所有缺少的编码版本
+        """
+        temp_paths = {encoding: self._variant_path(digest, encoding) + ".tmp" for encoding in encodings}
+        files = {}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            compressors = {encoding: _compressor(encoding) for encoding in encodings}
+            files = {encoding: open(path, "wb") for encoding, path in temp_paths.items()}
+            hasher = hashlib.sha256()
+            size = 0
+            with opener() as src:
+                while True:
+                    data = src.read(READ_SIZE)
+                    if not data:
+                        break
+                    hasher.update(data)
+                    size += len(data)
+                    for encoding, (compress, _) in compressors.items():
+                        files[encoding].write(compress(data))
+            for encoding, (_, finish) in compressors.items():
+                files[encoding].write(finish())
+                files[encoding].close()
+
+            # 读取期间文件被修改或删除时丢弃结果
+            if hasher.hexdigest() != digest:
+                return
+            for encoding, temp_path in temp_paths.items():
+                variant_size = os.path.getsize(temp_path)
+                if variant_size >= size * MIN_SAVING_RATIO or variant_size > self.max_size:
+                    with self.lock:
+                        self.incompressible.add(digest)
+                    continue
+                os.replace(temp_path, self._variant_path(digest, encoding))
+                self._add_entry(digest, encoding, variant_size)
+                logger.info(f"生成预压缩版本: {digest[:12]}.{encoding} ({size} -> {variant_size} 字节)")
+        except Exception as e:
+            logger.error(f"生成预压缩版本失败: {digest}, {e}")
+        finally:
+            for f in files.values():
+                f.close()
+            for temp_path in temp_paths.values():
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            with self.lock:
+                self.pending.discard(digest)
+
+    def _add_entry(self, digest, encoding, size):
+        """
+        记录新生成的版本，超出缓存上限时淘汰最久未使用的版本
+        """
+        with self.lock:
+            self.entries[(digest, encoding)] = size
+            self.total_size += size
+            evicted = []
+            while self.total_size > self.max_size and self.entries:
+                key, evicted_size = self.entries.popitem(last=False)
+                self.total_size -= evicted_size
+                evicted.append(key)
+        for key in evicted:
+            self._remove_file(*key)
+
+    def _remove_file(self, digest, encoding):
+        try:
+            os.remove(self._variant_path(digest, encoding))
+        except FileNotFoundError:
+            pass
+
+    def remove(self, digest):
+        """
+        删除内容的所有预压缩版本
+
+        Args:
+            digest: 文件内容哈希
+        """
+        with self.lock:
+            keys = [key for key in self.entries if key[0] == digest]
+            for key in keys:
+                self.total_size -= self.entries.pop(key)
+            self.incompressible.discard(digest)
+        for key in keys:
+            self._remove_file(*key)
@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+from .logger import logger
+
+# 两次写入文件的最短间隔（秒），期间的修改合并为一次写入
+DEFAULT_SAVE_INTERVAL = 0.5
+
+class WriteBehindFile:
+    """
+    合并写入的JSON文件。数据修改后调用mark_dirty标记为有未保存的修改，
+    由定时器在距上次写入interval秒后写入，期间的多次修改只写一次。
+    写入时先写临时文件并fsync，再替换原文件，写入中途程序退出或断电时原文件保持完整
+    """
+
+    def __init__(self, path, snapshot, lock, interval=DEFAULT_SAVE_INTERVAL, indent=None):
+        """
+        Args:
+            path: 文件路径，所在目录需已存在
+            snapshot: 返回要写入的数据的函数，持有lock时调用，返回的数据之后不应再被修改
+            lock: 保护数据的可重入锁
+            interval: 两次写入的最短间隔（秒），0表示每次修改立即写入
+            indent: JSON的缩进，None表示不换行
+        """
+        self.path = path
+        self.snapshot = snapshot
+        self.lock = lock
+        self.interval = interval
+        self.indent = indent
+        # 是否有未写入文件的修改
+        self.dirty = False
+        self.timer = None
+        self.last_save = 0.0
+        # 写入文件的锁，以及已生成、已写入和已尝试写入的快照序号，保证较旧的快照不会覆盖较新的
+        self.save_lock = threading.Lock()
+        self.save_done = threading.Condition(self.save_lock)
+        self.snapshot_seq = 0
+        self.saved_seq = 0
+        self.finished_seq = 0
+
+    def mark_dirty(self):
+        """
+        标记有未保存的修改，调用方需持有lock
+        """
+        self.dirty = True
+        if self.interval <= 0:
+            self.flush()
+        elif self.timer is None:
+            delay = max(0.0, self.last_save + self.interval - time.monotonic())
+            self.timer = threading.Timer(delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """
+        立即写入未保存的修改，并等待其他线程正在进行的写入完成
+
+        Returns:
+            bool: 写入成功或没有需要写入的修改返回True
+        """
+        seq = None
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.dirty:
+                # 持有锁时只生成快照，序列化和写文件时不阻塞修改
+                data = self.snapshot()
+                self.dirty = False
+                self.last_save = time.monotonic()
+                self.snapshot_seq += 1
+                seq = self.snapshot_seq
+            target = self.snapshot_seq
+        if seq is not None and not self._write(data, seq):
+            with self.lock:
+                # 下次修改或调用flush时重试
+                self.dirty = True
+        with self.save_done:
+            self.save_done.wait_for(lambda: self.finished_seq >= target)
+            return self.saved_seq >= target
+
+    def _write(self, data, seq):
+        """
+        写入一个快照，已写入更新的快照时跳过
+
+        Returns:
+            bool: 写入成功或已跳过返回True
+        """
+        with self.save_done:
+            try:
+                if seq > self.saved_seq:
+                    tmp_path = self.path + ".tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(data, f, ensure_ascii=False, indent=self.indent)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.path)
+                    self.saved_seq = seq
+                return True
+            except Exception as e:
+                logger.error(f"保存文件失败: {self.path}, {e}")
+                return False
+            finally:
+                self.finished_seq = max(self.finished_seq, seq)
+                self.save_done.notify_all()
@@ -0,0 +1,60 @@
+import time
+import zipfile
+from .compression import is_compressible
+
+# 从文件读取数据的块大小，也决定了每次向客户端发送的数据量
+ZIP_CHUNK_SIZE = 1024 * 1024
+# ZIP格式能表示的最早时间
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+class _ZipSink:
+    """
+    只写的输出缓冲，zipfile写入的数据暂存在这里，由生成器及时取走发送。
+    没有seek和tell，zipfile会改用数据描述符，无需回头修改已发送的文件头
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def iter_zip(entries):
+    """
+    边生成边输出ZIP归档，不使用临时文件，也不在内存中保存整个归档。
+    超过4GB的文件和归档自动使用ZIP64；文本类文件使用deflate压缩，
+    图片、视频、压缩包等已压缩的内容直接存储，不再重复压缩
+
+    Args:
+        entries: 可迭代的(归档内文件名, 原始大小, 修改时间戳, 打开文件的函数)
+
+    Yields:
+        bytes: 归档数据
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as archive:
+        for arcname, size, mtime, opener in entries:
+            info = zipfile.ZipInfo(arcname, date_time=max(time.localtime(mtime)[:6], ZIP_EPOCH))
+            info.compress_type = zipfile.ZIP_DEFLATED if is_compressible(arcname) else zipfile.ZIP_STORED
+            # 预先给出大小，超过ZIP64界限时zipfile会写入ZIP64扩展字段
+            info.file_size = size
+            with opener() as src, archive.open(info, "w") as dst:
+                while True:
+                    data = src.read(ZIP_CHUNK_SIZE)
+                    if not data:
+                        break
+                    dst.write(data)
+                    if sink.chunks:
+                        yield sink.drain()
+            yield sink.drain()
+    # 中央目录
+    yield sink.drain()
@@ -1,15 +1,115 @@
-from flask import Flask
+from flask import Flask, Request
 from flask_socketio import SocketIO
+from utils.file_utils import file_utils
+from utils.compression import resolve_encoding
+from utils.bandwidth import bandwidth_manager, BandwidthMiddleware
+from utils.user_cache import user_cache
+from utils.user_store import create_user_store, DEFAULT_SAVE_INTERVAL
+from utils.file_watcher import create_watcher
+from utils.upload_session import upload_session_manager, DEFAULT_SESSION_TTL, DEFAULT_MAX_SESSIONS_PER_CLIENT
 import os
+import json
+
+# multipart请求体中除文件内容外的表单开销上限，用于按Content-Length估算文件大小
+MULTIPART_OVERHEAD = 64 * 1024
+
+# 读取配置文件
+try:
+    with open("config.json", "r") as f:
+        config = json.load(f)
+except Exception:
+    config = {}
+
+class UploadRequest(Request):
+    """
+    自定义请求类，multipart上传中的文件直接写入上传目录内的临时文件，
+    保存时只需重命名，避免先缓冲到系统临时目录再复制一次。
+    启用存储压缩时值得压缩的文件边接收边压缩，不必保存时再写一遍
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return file_utils.create_temp_file(filename)
+
+def _classify_transfer(environ):
+    """
+    判断请求是否为需要限速的上传或下载，其他请求（包括Socket.IO）不限速
+    
+    Args:
+        environ: WSGI环境
+    
+    Returns:
+        tuple or None: (方向, 用户ID, 名称)，不是传输请求时返回None
+    """
+    path = environ.get('PATH_INFO', '')
+    method = environ.get('REQUEST_METHOD')
+    if (method == 'GET' and path.startswith('/download/')) or path == '/download-zip':
+        direction = 'download'
+    elif method in ('POST', 'PUT') and (path in ('/upload', '/upload/stream', '/upload/delta')
+                                        or (path.startswith('/upload/') and path.endswith('/chunk'))):
+        direction = 'upload'
+    else:
+        return None
+    # 按IP找到对应的用户，尚未连接过Socket.IO的客户端按IP区分
+    ip_address = environ.get('REMOTE_ADDR')
+    user = user_cache.get_user_by_ip(ip_address)
+    user_id = user.get('user_id') if user else ip_address
+    # PATH_INFO按WSGI规范以latin-1解码，还原为UTF-8文件名用于显示
+    name = path.encode('latin-1').decode('utf-8', 'replace')
+    return direction, user_id, name
 
 # 创建Flask应用实例
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['SECRET_KEY'] = 'secret!'
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
+# 分块上传的分块大小
+app.config['UPLOAD_CHUNK_SIZE'] = config.get('upload_chunk_size', 4 * 1024 * 1024)
+# 单个文件大小限制和磁盘最少保留空间
+file_utils.max_file_size = config.get('max_file_size')
+file_utils.min_free_space = config.get('min_free_space', 0)
+# 存储时压缩文本类文件，默认不启用
+file_utils.compression = resolve_encoding(config.get('storage_compression'))
+# 下载用预压缩版本缓存的大小上限，0表示不启用
+file_utils.variants.max_size = config.get('variant_cache_size', 1024 * 1024 * 1024)
+# 缩略图缓存的大小上限，0表示不生成缩略图
+file_utils.thumbnails.max_size = config.get('thumbnail_cache_size', 256 * 1024 * 1024)
+# 上传和下载的带宽限制，运行时可通过管理接口或GUI修改
+bandwidth_manager.update_limits(config.get('bandwidth_limits', {}))
+# 用户信息的存储方式：json（users.json，合并写入的最短间隔为user_save_interval秒）
+# 或sqlite（users.db，首次启动时导入users.json）
+user_cache.set_store(create_user_store(config.get('user_store', 'json'), config.get('user_cache_file', 'users.json'),
+                                       config.get('user_save_interval', DEFAULT_SAVE_INTERVAL)))
+app.wsgi_app = BandwidthMiddleware(app.wsgi_app, bandwidth_manager, _classify_transfer)
+if file_utils.max_file_size is not None:
+    # multipart表单本身还有少量开销
+    app.config['MAX_CONTENT_LENGTH'] = file_utils.max_file_size + MULTIPART_OVERHEAD
+
+# 清理上次运行遗留的未完成上传
+file_utils.cleanup_staging()
+# 分块上传会话闲置upload_session_ttl秒后清理，每个客户端最多同时进行max_upload_sessions个会话
+upload_session_manager.session_ttl = config.get('upload_session_ttl', DEFAULT_SESSION_TTL)
+upload_session_manager.max_sessions_per_client = config.get('max_upload_sessions', DEFAULT_MAX_SESSIONS_PER_CLIENT)
+upload_session_manager.expire_sessions()
+upload_session_manager.start_reaper()
 
 # 创建SocketIO实例
 socketio = SocketIO(app)
 
+def _on_upload_dir_change(filenames):
+    """
+    上传目录在外部发生变化时更新文件列表，有变化时推送给所有客户端。
+    本程序自己保存、删除的文件已在列表中，不会重复推送
+    """
+    if file_utils.sync_files(filenames):
+        from web.socket_events import broadcast_file_changes
+        broadcast_file_changes()
+
+# 监视上传目录，直接复制到目录中的文件无需刷新即可出现
+if config.get('watch_upload_dir', True):
+    upload_dir_watcher = create_watcher(file_utils.upload_dir, _on_upload_dir_change,
+                                        config.get('watch_poll_interval', 2.0))
+    upload_dir_watcher.start()
+
 # 导入路由和事件处理
 from web import routes
 from web import socket_events
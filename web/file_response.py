@@ -0,0 +1,233 @@
+from flask import request, Response
+from werkzeug.http import is_resource_modified
+from urllib.parse import quote
+import mimetypes
+import os
+import ssl
+import uuid
+
+# 单个请求最多返回的区间数，超出时忽略Range返回整个文件
+MAX_RANGES = 16
+# 无法使用sendfile时读取文件的缓冲区大小
+SEND_BUFFER_SIZE = 1024 * 1024
+
+class FileBody:
+    """
+    文件响应体，按区间发送文件内容。
+    在开发服务器上直接对连接调用sendfile，文件数据不经过Python；
+    其他服务器或TLS连接退回到使用固定缓冲区的readinto循环
+    """
+
+    def __init__(self, file_obj, parts, connection=None, transfer=None):
+        """
+        初始化响应体
+
+        Args:
+            file_obj: 以二进制模式打开的文件，发送完毕后关闭
+            parts: 依次发送的内容，bytes为原样发送的数据，(起始位置, 长度)为文件区间
+            connection: 客户端连接的socket，为None时不使用sendfile
+            transfer: 限速用的传输对象，sendfile发送的数据不经过响应迭代，需在这里限速
+        """
+        self.file = file_obj
+        self.parts = parts
+        self.connection = connection
+        self.transfer = transfer
+
+    def __iter__(self):
+        buffer = None
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            start, length = part
+            if self.connection is not None:
+                # 先让服务器发出响应头和之前的数据，再直接写socket
+                yield b""
+                if self.transfer is None:
+                    self.connection.sendfile(self.file, start, length)
+                    continue
+                while length > 0:
+                    size = self.transfer.chunk_size(length)
+                    self.transfer.throttle(size)
+                    self.connection.sendfile(self.file, start, size)
+                    start += size
+                    length -= size
+                continue
+            if buffer is None:
+                buffer = bytearray(SEND_BUFFER_SIZE)
+                view = memoryview(buffer)
+            self.file.seek(start)
+            while length > 0:
+                read = self.file.readinto(view[:min(length, SEND_BUFFER_SIZE)])
+                if not read:
+                    break
+                length -= read
+                yield bytes(view[:read])
+
+    @property
+    def start(self):
+        """
+        第一个文件区间的起始位置，没有文件区间时为None
+        """
+        return next((part[0] for part in self.parts if not isinstance(part, bytes)), None)
+
+    def close(self):
+        self.file.close()
+
+def set_attachment(response, filename):
+    """
+    设置以附件形式下载的Content-Disposition，非ASCII文件名使用RFC 5987编码
+
+    Args:
+        response: 响应对象
+        filename: 下载保存的文件名
+    """
+    try:
+        filename.encode("ascii")
+        names = {"filename": filename}
+    except UnicodeEncodeError:
+        names = {"filename*": f"UTF-8''{quote(filename)}"}
+    response.headers.set("Content-Disposition", "attachment", **names)
+
+def _parse_range_header(value):
+    """
+    解析Range请求头。werkzeug会拒绝重叠或乱序的区间，这里按RFC 7233全部接受，之后再合并
+
+    Args:
+        value: Range请求头的值
+
+    Returns:
+        list or None: [(起始位置, 结束位置)]，结束位置不含在内且可能为None，
+                      后缀区间的起始位置为负数；格式错误或单位不是bytes时返回None
+    """
+    units, _, specs = value.partition("=")
+    if units.strip().lower() != "bytes":
+        return None
+    ranges = []
+    try:
+        for spec in specs.split(","):
+            first, dash, last = spec.strip().partition("-")
+            if not dash:
+                return None
+            if not first:
+                suffix = int(last)
+                if suffix <= 0:
+                    return None
+                ranges.append((-suffix, None))
+            else:
+                begin = int(first)
+                end = int(last) + 1 if last else None
+                if begin < 0 or (end is not None and end <= begin):
+                    return None
+                ranges.append((begin, end))
+    except ValueError:
+        return None
+    return ranges
+
+def _requested_ranges(size, etag, last_modified):
+    """
+    解析请求的Range和If-Range
+
+    Args:
+        size: 文件大小
+        etag: 文件的强校验器
+        last_modified: 文件修改时间（秒）
+
+    Returns:
+        list or None: 按起始位置排序并合并重叠部分后的[(起始位置, 结束位置)]，
+                      没有可满足的区间时返回空列表，应返回整个文件时返回None
+    """
+    requested = _parse_range_header(request.headers.get("Range", ""))
+    if requested is None:
+        return None
+    if_range = request.if_range
+    if if_range.etag is not None:
+        # If-Range只接受强校验器
+        if if_range.etag != etag or request.headers.get("If-Range", "").startswith("W/"):
+            return None
+    elif if_range.date is not None and int(if_range.date.timestamp()) != int(last_modified):
+        return None
+
+    ranges = []
+    for begin, end in requested:
+        if begin < 0:
+            start, stop = max(size + begin, 0), size
+        else:
+            start, stop = begin, size if end is None else min(end, size)
+        if start < stop:
+            ranges.append((start, stop))
+    ranges.sort()
+    merged = []
+    for start, stop in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+        else:
+            merged.append((start, stop))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+def send_file_ranges(file_path, filename, etag, as_attachment=True):
+    """
+    发送文件，支持条件请求以及Range、多区间Range和If-Range，
+    客户端可以断点续传，也可以分段并行下载
+
+    Args:
+        file_path: 文件路径
+        filename: 下载保存的文件名
+        etag: 文件的强校验器，内容变化时必须改变
+        as_attachment: 是否以附件形式下载，False时由浏览器直接显示
+
+    Returns:
+        Response: 200、206、304或416响应
+    """
+    file_stats = os.stat(file_path)
+    size = file_stats.st_size
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    response = Response(mimetype=mimetype)
+    response.set_etag(etag)
+    response.last_modified = int(file_stats.st_mtime)
+    response.accept_ranges = "bytes"
+    if as_attachment:
+        set_attachment(response, filename)
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=response.last_modified):
+        response.status_code = 304
+        return response
+
+    ranges = _requested_ranges(size, etag, file_stats.st_mtime)
+    if ranges == []:
+        response.status_code = 416
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if ranges is None:
+        parts = [(0, size)]
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        response.status_code = 206
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        parts = [(start, stop - start)]
+    else:
+        boundary = uuid.uuid4().hex
+        response.status_code = 206
+        response.content_type = f"multipart/byteranges; boundary={boundary}"
+        parts = []
+        for start, stop in ranges:
+            parts.append((f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n"
+                          f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n").encode())
+            parts.append((start, stop - start))
+        parts.append(f"\r\n--{boundary}--\r\n".encode())
+
+    response.content_length = sum(len(part) if isinstance(part, bytes) else part[1] for part in parts)
+    if request.method == "HEAD":
+        # HEAD请求不发送响应体，不打开文件
+        return response
+    # 开发服务器提供了客户端连接，TLS连接无法使用sendfile
+    connection = request.environ.get("werkzeug.socket")
+    if isinstance(connection, ssl.SSLSocket):
+        connection = None
+    response.response = FileBody(open(file_path, "rb"), parts, connection,
+                                 request.environ.get("bandwidth.transfer") if connection else None)
+    response.direct_passthrough = True
+    return response
@@ -1,9 +1,24 @@
-from flask import render_template, request, jsonify, send_from_directory
-from web import app
-from utils.file_utils import file_utils
+from flask import render_template, request, jsonify, Response
+from web import app, MULTIPART_OVERHEAD
+from web.file_response import FileBody, send_file_ranges, set_attachment
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import FileWrapper
+from utils.file_utils import (file_utils, normalize_path, join_path, UploadTooLargeError, InsufficientSpaceError,
+                              COPY_BUFFER_SIZE)
+from utils.file_index import DEFAULT_PAGE_SIZE, split_path
+from utils.search_index import DEFAULT_SEARCH_LIMIT
 from utils.user_cache import user_cache
+from utils.upload_session import upload_session_manager, TooManySessionsError
+from utils.delta import MIN_BLOCK_SIZE, MAX_BLOCK_SIZE
+from utils.compression import is_compressible
+from utils.zip_stream import iter_zip
+from utils.bandwidth import bandwidth_manager
+from utils.thumbnail import THUMBNAIL_SIZES
 from utils.logger import logger
+import mimetypes
 import os
+import uuid
+from datetime import datetime
 
 @app.route('/')
 def index():
@@ -15,16 +30,295 @@ def index():
     """
     return render_template('index.html')
 
+def _parse_size_arg(args, name):
+    """
+    解析非负整数参数，未提供时返回None
+    
+    Raises:
+        ValueError: 参数不是非负整数
+    """
+    value = args.get(name)
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError(f"参数{name}应为非负整数")
+    return int(value)
+
+def _parse_time_arg(args, name, end_of_day=False):
+    """
+    解析时间参数，可以是Unix时间戳（秒）或ISO格式的日期、时间，按服务器本地时间解释
+    
+    Args:
+        args: 请求参数
+        name: 参数名
+        end_of_day: 只给出日期时是否取当天结束时刻
+    
+    Returns:
+        int or None: 纳秒时间戳，未提供时返回None
+    
+    Raises:
+        ValueError: 无法解析
+    """
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return int(float(value) * 1e9)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"参数{name}应为时间戳或ISO格式的日期")
+    if end_of_day and len(value) == 10:
+        return (int(moment.timestamp()) + 86400) * 10**9 - 1
+    return int(moment.timestamp() * 1e9)
+
+def _request_user_id():
+    """
+    Returns:
+        str or None: 发起请求的用户ID，按IP地址查找，未登录时为None
+    """
+    user = user_cache.get_user_by_ip(request.remote_addr)
+    return user["user_id"] if user else None
+
+def _resolve_upload_file(filename):
+    """
+    将URL中的文件名解析为上传目录中的文件，上级目录以及.meta、.blobs等内部目录中的文件视为不存在
+    
+    Args:
+        filename: URL中的文件名
+    
+    Returns:
+        tuple: (规范化后的文件名, 文件路径)
+    
+    Raises:
+        FileNotFoundError: 文件不存在或不在上传目录中
+    """
+    import urllib.parse
+    try:
+        filename = normalize_path(urllib.parse.unquote(filename))
+    except ValueError:
+        raise FileNotFoundError(filename)
+    file_path = os.path.join(file_utils.upload_dir, filename)
+    if not filename or not os.path.isfile(file_path):
+        raise FileNotFoundError(filename)
+    return filename, file_path
+
+def _parse_file_query(args):
+    """
+    解析文件列表的分页、排序和筛选参数
+    
+    Returns:
+        dict: FileUtils.query_files的参数
+    
+    Raises:
+        ValueError: 参数无效
+    """
+    order = args.get('order')
+    if order not in (None, '', 'asc', 'desc'):
+        raise ValueError("参数order应为asc或desc")
+    limit = _parse_size_arg(args, 'limit')
+    extensions = {ext.strip().lstrip('.').lower() for ext in args.get('ext', '').split(',') if ext.strip()}
+    return {
+        "sort": args.get('sort') or 'mtime',
+        "descending": None if not order else order == 'desc',
+        "limit": DEFAULT_PAGE_SIZE if limit is None else limit,
+        "cursor": args.get('cursor') or None,
+        "extensions": extensions or None,
+        "min_size": _parse_size_arg(args, 'min_size'),
+        "max_size": _parse_size_arg(args, 'max_size'),
+        "since": _parse_time_arg(args, 'since'),
+        "until": _parse_time_arg(args, 'until', end_of_day=True),
+        "prefix": args.get('prefix') or None,
+        "uploader": args.get('uploader') or None,
+        "tag": args.get('tag') or None,
+        "sha256": (args.get('sha256') or '').lower() or None
+    }
+
 @app.route('/api/files')
 def get_files():
     """
-    获取文件列表API
+    分页获取文件夹中的文件列表API，第一页同时返回子文件夹
+    
+    查询参数:
+        folder: 文件夹路径，默认为根目录
+        sort: 排序字段，mtime（默认）、name或size
+        order: asc或desc，默认按修改时间和大小倒序、按名称正序
+        limit: 每页的文件数，默认100
+        cursor: 上一页返回的next_cursor
+        ext: 扩展名，多个用逗号分隔
+        min_size/max_size: 文件大小范围（字节）
+        since/until: 修改时间范围，Unix时间戳或ISO格式的日期
+        prefix: 文件名前缀
+        uploader: 上传者的用户ID
+        tag: 标签
+        sha256: 文件内容的SHA-256
+    
+    Returns:
+        json: 当前文件夹的信息（文件数和大小包括子文件夹）、子文件夹、
+              当前页的文件列表（含上传者、下载次数和标签）、下一页的游标和文件总数
+    """
+    try:
+        folder = normalize_path(request.args.get('folder', ''))
+        query = _parse_file_query(request.args)
+        files, next_cursor, total = file_utils.query_files(folder, **query)
+        folder_info, subfolders = file_utils.get_folder(folder)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({"success": False, "message": "文件夹不存在"}), 404
+    # 子文件夹只随第一页返回
+    if query["cursor"]:
+        subfolders = []
+    return jsonify({"folder": folder_info, "folders": subfolders, "files": files,
+                    "next_cursor": next_cursor, "total": total})
+
+@app.route('/api/search')
+def search_files():
+    """
+    按名称搜索文件和文件夹API，使用服务端的三元组索引，不扫描目录
+    
+    查询参数:
+        q: 查询，匹配名称中的任意位置，不区分大小写；没有完全匹配时也返回相近的名称
+        folder: 搜索范围的文件夹路径，默认为根目录，包括各级子文件夹
+        limit: 最多返回的结果数，默认50
     
     Returns:
-        json: 文件列表
+        json: 按匹配程度排序的结果，type为file的是文件信息，为folder的是文件夹信息
     """
-    files = file_utils.get_file_list()
-    return jsonify({"files": files})
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({"success": False, "message": "没有指定搜索内容"}), 400
+        folder = normalize_path(request.args.get('folder', ''))
+        limit = _parse_size_arg(request.args, 'limit')
+        results = file_utils.search_files(query, folder, DEFAULT_SEARCH_LIMIT if limit is None else limit)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({"success": False, "message": "文件夹不存在"}), 404
+    return jsonify({"query": query, "folder": folder, "results": results})
+
+@app.route('/api/tags/<path:filename>', methods=['PUT'])
+def set_file_tags(filename):
+    """
+    设置文件的标签API，请求体为{"tags": [...]}，替换原有的标签
+    
+    Args:
+        filename: 文件名
+    
+    Returns:
+        json: 更新后的文件信息
+    """
+    try:
+        filename = normalize_path(filename)
+        tags = (request.get_json(silent=True) or {}).get('tags')
+        if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+            return jsonify({"success": False, "message": "标签应为字符串列表"}), 400
+        info = file_utils.set_file_tags(filename, tags)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    if info is None:
+        return jsonify({"success": False, "message": "文件不存在"}), 404
+    return jsonify({"success": True, "file": info})
+
+def _upload_folder(folder):
+    """
+    解析上传的目标文件夹，不存在时创建
+    
+    Args:
+        folder: 请求中的文件夹路径，None或""表示根目录
+    
+    Returns:
+        str: 规范化后的文件夹路径
+    
+    Raises:
+        ValueError: 路径无效或无法创建
+    """
+    folder = normalize_path(folder or '')
+    if folder and not file_utils.create_folder(folder):
+        raise ValueError(f"无法创建文件夹: {folder}")
+    return folder
+
+@app.route('/api/folders', methods=['POST'])
+def create_folder():
+    """
+    创建文件夹API，请求体为json，path为文件夹路径，上级文件夹不存在时一并创建
+    
+    Returns:
+        json: 创建的文件夹信息
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        folder = normalize_path(data.get('path', ''))
+        if not folder:
+            return jsonify({"success": False, "message": "没有指定文件夹"}), 400
+        if not file_utils.create_folder(folder):
+            return jsonify({"success": False, "message": "文件夹创建失败"}), 409
+        from web.socket_events import broadcast_file_changes
+        broadcast_file_changes()
+        return jsonify({"success": True, "message": "文件夹创建成功", "folder": file_utils.get_folder(folder)[0]})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"创建文件夹失败: {e}")
+        return jsonify({"success": False, "message": f"创建文件夹失败: {str(e)}"}), 500
+
+@app.route('/api/folders/<path:folder>', methods=['DELETE'])
+def delete_folder(folder):
+    """
+    删除文件夹及其中的所有文件
+    
+    Args:
+        folder: 文件夹路径
+    
+    Returns:
+        json: 删除结果
+    """
+    try:
+        folder = normalize_path(folder)
+        if not folder:
+            return jsonify({"success": False, "message": "不能删除根目录"}), 400
+        if file_utils.file_index.get_folder(folder) is None:
+            return jsonify({"success": False, "message": "文件夹不存在"}), 404
+        success = file_utils.delete_folder(folder)
+        from web.socket_events import broadcast_file_changes
+        broadcast_file_changes()
+        if success:
+            return jsonify({"success": True, "message": "文件夹删除成功"})
+        return jsonify({"success": False, "message": "文件夹删除失败"}), 500
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"文件夹删除失败: {e}")
+        return jsonify({"success": False, "message": f"文件夹删除失败: {str(e)}"}), 500
+
+@app.route('/api/checksum/<path:filename>')
+def get_file_checksum(filename):
+    """
+    获取文件的SHA-256校验和，文件未变化时直接返回记录的值，不读取文件内容
+    
+    Args:
+        filename: 文件名
+    
+    Returns:
+        json: 校验和
+    """
+    try:
+        import urllib.parse
+        filename = normalize_path(urllib.parse.unquote(filename))
+        
+        sha256 = file_utils.get_checksum(filename)
+        if sha256 is None:
+            return jsonify({"success": False, "message": "文件不存在"}), 404
+        return jsonify({"success": True, "filename": filename, "sha256": sha256})
+    except ValueError:
+        # 上级目录和内部目录中的文件
+        return jsonify({"success": False, "message": "文件不存在"}), 404
+    except Exception as e:
+        logger.error(f"获取校验和失败: {e}")
+        return jsonify({"success": False, "message": f"获取校验和失败: {str(e)}"}), 500
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -34,24 +328,332 @@ def upload_file():
     Returns:
         json: 上传结果
     """
+    upload_key = uuid.uuid4().hex
+    files = None
     try:
-        if 'file' not in request.files:
+        # 读取请求体之前先按Content-Length检查大小和磁盘空间，超出时立即拒绝
+        size = max((request.content_length or 0) - MULTIPART_OVERHEAD, 0)
+        file_utils.reserve_space(upload_key, size)
+        
+        files = request.files
+        if 'file' not in files:
             return jsonify({"success": False, "message": "没有文件上传"}), 400
         
-        file = request.files['file']
+        file = files['file']
         if file.filename == '':
             return jsonify({"success": False, "message": "没有选择文件"}), 400
         
-        success, filename = file_utils.save_file(file, file.filename)
+        folder = _upload_folder(request.values.get('folder'))
+        success, filename = file_utils.save_file(file, join_path(folder, os.path.basename(file.filename)),
+                                                 _request_user_id())
         if success:
-            from web.socket_events import socketio
-            socketio.emit('file_list_update', {"files": file_utils.get_file_list()})
+            from web.socket_events import broadcast_file_changes
+            broadcast_file_changes()
             return jsonify({"success": True, "message": "文件上传成功", "filename": filename})
         else:
             return jsonify({"success": False, "message": "文件上传失败"}), 500
+    except (UploadTooLargeError, RequestEntityTooLarge):
+        return _file_too_large_response()
+    except InsufficientSpaceError:
+        return jsonify({"success": False, "message": "服务器磁盘空间不足"}), 507
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         logger.error(f"文件上传失败: {e}")
         return jsonify({"success": False, "message": f"文件上传失败: {str(e)}"}), 500
+    finally:
+        file_utils.release_space(upload_key)
+        # 清理未被保存的临时文件
+        if files is not None:
+            for file in files.values():
+                file_utils.discard_temp_file(file)
+
+@app.route('/upload/stream', methods=['PUT', 'POST'])
+def upload_file_stream():
+    """
+    流式文件上传路由，请求体为文件的原始数据，文件名通过filename参数指定
+    
+    Returns:
+        json: 上传结果
+    """
+    upload_key = uuid.uuid4().hex
+    try:
+        filename = os.path.basename(request.args.get('filename', ''))
+        if not filename:
+            return jsonify({"success": False, "message": "没有选择文件"}), 400
+        
+        # 读取请求体之前先按Content-Length检查大小和磁盘空间，接收过程中再逐块检查
+        file_utils.reserve_space(upload_key, request.content_length or 0)
+        folder = _upload_folder(request.args.get('folder'))
+        success, filename = file_utils.save_stream(request.stream, join_path(folder, filename), _request_user_id())
+        if success:
+            from web.socket_events import broadcast_file_changes
+            broadcast_file_changes()
+            return jsonify({"success": True, "message": "文件上传成功", "filename": filename})
+        else:
+            return jsonify({"success": False, "message": "文件上传失败"}), 500
+    except (UploadTooLargeError, RequestEntityTooLarge):
+        return _file_too_large_response()
+    except InsufficientSpaceError:
+        return jsonify({"success": False, "message": "服务器磁盘空间不足"}), 507
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"文件上传失败: {e}")
+        return jsonify({"success": False, "message": f"文件上传失败: {str(e)}"}), 500
+    finally:
+        file_utils.release_space(upload_key)
+
+@app.route('/api/signature/<path:filename>')
+def get_file_signature(filename):
+    """
+    获取文件的分块签名，客户端据此只上传新版本中变化的部分
+    
+    Args:
+        filename: 文件名
+    
+    Returns:
+        json: 分块大小、文件大小和每块的弱校验和、强校验和
+    """
+    try:
+        block_size = request.args.get('block_size', type=int)
+        if block_size is not None and not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+            return jsonify({"success": False, "message": "分块大小无效"}), 400
+        filename, _ = _resolve_upload_file(filename)
+        signature = file_utils.get_signature(filename, block_size)
+        return jsonify({"success": True, "filename": filename, **signature})
+    except FileNotFoundError:
+        return jsonify({"success": False, "message": "文件不存在"}), 404
+    except Exception as e:
+        logger.error(f"获取文件签名失败: {e}")
+        return jsonify({"success": False, "message": f"获取文件签名失败: {str(e)}"}), 500
+
+@app.route('/upload/delta', methods=['POST'])
+def upload_file_delta():
+    """
+    增量上传路由，请求体为相对于base文件的增量数据，
+    参数：base为服务端已有的旧版本文件名，filename为新文件名，folder为两者所在的文件夹，
+    block_size为获取签名时的分块大小，size为新文件的大小（用于空间检查）
+    
+    Returns:
+        json: 上传结果
+    """
+    upload_key = uuid.uuid4().hex
+    try:
+        base_filename = os.path.basename(request.args.get('base', ''))
+        filename = os.path.basename(request.args.get('filename', '')) or base_filename
+        block_size = request.args.get('block_size', type=int)
+        size = request.args.get('size', 0, type=int)
+        if not base_filename:
+            return jsonify({"success": False, "message": "没有指定基准文件"}), 400
+        if block_size is None or not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+            return jsonify({"success": False, "message": "分块大小无效"}), 400
+        if size < 0:
+            return jsonify({"success": False, "message": "文件大小无效"}), 400
+        
+        file_utils.reserve_space(upload_key, size)
+        folder = normalize_path(request.args.get('folder', ''))
+        success, filename = file_utils.save_delta(join_path(folder, base_filename), request.stream,
+                                                  join_path(folder, filename), block_size, _request_user_id())
+        if success:
+            from web.socket_events import broadcast_file_changes
+            broadcast_file_changes()
+            return jsonify({"success": True, "message": "文件上传成功", "filename": filename})
+        else:
+            return jsonify({"success": False, "message": "文件上传失败"}), 500
+    except FileNotFoundError:
+        return jsonify({"success": False, "message": "基准文件不存在"}), 404
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except (UploadTooLargeError, RequestEntityTooLarge):
+        return _file_too_large_response()
+    except InsufficientSpaceError:
+        return jsonify({"success": False, "message": "服务器磁盘空间不足"}), 507
+    except Exception as e:
+        logger.error(f"增量上传失败: {e}")
+        return jsonify({"success": False, "message": f"文件上传失败: {str(e)}"}), 500
+    finally:
+        file_utils.release_space(upload_key)
+
+def _file_too_large_response():
+    """
+    生成文件超出大小限制的响应
+    
+    Returns:
+        tuple: (json响应, 413)
+    """
+    return jsonify({
+        "success": False,
+        "message": f"文件超出大小限制（最大 {file_utils.max_file_size} 字节）",
+        "max_file_size": file_utils.max_file_size
+    }), 413
+
+@app.errorhandler(413)
+def handle_request_too_large(e):
+    """
+    请求体超出MAX_CONTENT_LENGTH时返回json格式的错误
+    """
+    return _file_too_large_response()
+
+@app.route('/api/blobs/probe', methods=['POST'])
+def probe_blob():
+    """
+    上传前探测服务端是否已有相同内容的文件，已有时直接创建文件名，无需传输数据
+    
+    Returns:
+        json: exists为True时表示已完成上传
+    """
+    try:
+        data = request.get_json()
+        sha256 = (data.get('sha256') or '').lower()
+        filename = os.path.basename(data.get('filename', ''))
+        if not sha256 or not filename:
+            return jsonify({"success": False, "message": "缺少文件名或哈希"}), 400
+        
+        folder = _upload_folder(data.get('folder'))
+        exists, filename = file_utils.save_blob_reference(sha256, join_path(folder, filename), _request_user_id())
+        if exists:
+            from web.socket_events import broadcast_file_changes
+            broadcast_file_changes()
+            return jsonify({"success": True, "exists": True, "filename": filename})
+        return jsonify({"success": True, "exists": False})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"探测文件失败: {e}")
+        return jsonify({"success": False, "message": f"探测文件失败: {str(e)}"}), 500
+
+@app.route('/upload/init', methods=['POST'])
+def init_chunked_upload():
+    """
+    创建分块上传会话
+    
+    Returns:
+        json: 会话信息，包含upload_id、分块大小和已接收区间
+    """
+    try:
+        data = request.get_json()
+        filename = data.get('filename', '')
+        size = data.get('size')
+        if not filename:
+            return jsonify({"success": False, "message": "没有选择文件"}), 400
+        if not isinstance(size, int) or size < 0:
+            return jsonify({"success": False, "message": "文件大小无效"}), 400
+        
+        folder = _upload_folder(data.get('folder'))
+        # 客户端提供了内容哈希且服务端已有相同内容时直接完成上传
+        sha256 = data.get('sha256')
+        if sha256:
+            exists, saved_name = file_utils.save_blob_reference(sha256.lower(),
+                                                                join_path(folder, os.path.basename(filename)),
+                                                                _request_user_id())
+            if exists:
+                from web.socket_events import broadcast_file_changes
+                broadcast_file_changes()
+                return jsonify({"success": True, "completed": True, "filename": saved_name})
+        
+        # 未登录的客户端按IP地址限制同时进行的会话数
+        uploader = _request_user_id()
+        session = upload_session_manager.create_session(filename, size, app.config['UPLOAD_CHUNK_SIZE'], folder,
+                                                        uploader, uploader or request.remote_addr)
+        return jsonify({"success": True, **session})
+    except UploadTooLargeError:
+        return _file_too_large_response()
+    except InsufficientSpaceError:
+        return jsonify({"success": False, "message": "服务器磁盘空间不足"}), 507
+    except TooManySessionsError as e:
+        return jsonify({"success": False, "message": str(e)}), 429
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"创建上传会话失败: {e}")
+        return jsonify({"success": False, "message": f"创建上传会话失败: {str(e)}"}), 500
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """
+    查询分块上传会话状态，用于断点续传
+    
+    Args:
+        upload_id: 会话ID
+    
+    Returns:
+        json: 会话信息
+    """
+    session = upload_session_manager.get_session(upload_id)
+    if session is None:
+        return jsonify({"success": False, "message": "上传会话不存在"}), 404
+    return jsonify({"success": True, **session})
+
+@app.route('/upload/<upload_id>/chunk', methods=['PUT'])
+def upload_chunk(upload_id):
+    """
+    上传一个分块，请求体为分块的原始数据，偏移量通过offset参数指定，
+    同一会话的多个分块可以并发、乱序上传
+    
+    Args:
+        upload_id: 会话ID
+    
+    Returns:
+        json: 更新后的会话信息
+    """
+    try:
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({"success": False, "message": "缺少分块偏移"}), 400
+        
+        success, result = upload_session_manager.write_chunk(upload_id, offset, request.stream)
+        if success:
+            # 最后一个分块到达后文件已自动提交
+            if result["completed"]:
+                from web.socket_events import broadcast_file_changes
+                broadcast_file_changes()
+            return jsonify({"success": True, **result})
+        else:
+            status = 404 if upload_session_manager.get_session(upload_id) is None else 400
+            return jsonify({"success": False, "message": result}), status
+    except Exception as e:
+        logger.error(f"分块上传失败: {e}")
+        return jsonify({"success": False, "message": f"分块上传失败: {str(e)}"}), 500
+
+@app.route('/upload/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """
+    完成分块上传，合并后的文件进入上传目录
+    
+    Args:
+        upload_id: 会话ID
+    
+    Returns:
+        json: 上传结果
+    """
+    try:
+        success, result = upload_session_manager.complete_session(upload_id)
+        if success:
+            from web.socket_events import broadcast_file_changes
+            broadcast_file_changes()
+            return jsonify({"success": True, "message": "文件上传成功", "filename": result})
+        else:
+            status = 404 if upload_session_manager.get_session(upload_id) is None else 400
+            return jsonify({"success": False, "message": result}), status
+    except Exception as e:
+        logger.error(f"完成分块上传失败: {e}")
+        return jsonify({"success": False, "message": f"文件上传失败: {str(e)}"}), 500
+
+@app.route('/upload/<upload_id>', methods=['DELETE'])
+def cancel_chunked_upload(upload_id):
+    """
+    取消分块上传会话
+    
+    Args:
+        upload_id: 会话ID
+    
+    Returns:
+        json: 取消结果
+    """
+    if upload_session_manager.cancel_session(upload_id):
+        return jsonify({"success": True, "message": "上传已取消"})
+    return jsonify({"success": False, "message": "上传会话不存在"}), 404
 
 @app.route('/download/<path:filename>')
 def download_file(filename):
@@ -65,16 +667,12 @@ def download_file(filename):
         file: 文件流
     """
     try:
-        import urllib.parse
-        # 解码URL中的文件名
-        filename = urllib.parse.unquote(filename)
-        
-        # 使用绝对路径确保文件能被正确找到
-        upload_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', app.config['UPLOAD_FOLDER'])
-        
-        logger.info(f"尝试下载文件: {filename}，路径: {upload_dir}")
-        
-        return send_from_directory(upload_dir, filename, as_attachment=True)
+        logger.info(f"尝试下载文件: {filename}")
+        filename, file_path = _resolve_upload_file(filename)
+        response = _download_response(filename, file_path)
+        if _is_new_download(response):
+            file_utils.record_download(filename)
+        return response
     except FileNotFoundError:
         logger.error(f"文件下载失败: 文件 {filename} 不存在")
         return jsonify({"success": False, "message": "文件不存在"}), 404
@@ -82,6 +680,195 @@ def download_file(filename):
         logger.error(f"文件下载失败: {e}")
         return jsonify({"success": False, "message": f"下载失败: {str(e)}"}), 500
 
+def _download_response(filename, file_path):
+    """
+    生成下载响应，按客户端支持的编码发送原文件、压缩存储的字节或预压缩版本
+    
+    Args:
+        filename: 文件名
+        file_path: 文件路径
+    
+    Returns:
+        Response: 下载响应
+    
+    Raises:
+        FileNotFoundError: 文件不存在时抛出
+    """
+    encoding, size = file_utils.get_file_encoding(filename)
+    etag = file_utils.get_etag(filename)
+    variant = file_utils.get_variant(filename, request.accept_encodings)
+    if variant is not None:
+        # 发送后台生成的预压缩版本，无需每次重新压缩
+        variant_encoding, variant_path = variant
+        try:
+            response = send_file_ranges(variant_path, filename, f"{etag}-{variant_encoding}")
+            response.headers['Content-Encoding'] = variant_encoding
+            response.vary.add('Accept-Encoding')
+            return response
+        except FileNotFoundError:
+            # 预压缩版本刚好被淘汰，发送原文件
+            pass
+    if encoding is None:
+        # 支持断点续传和分段下载，开发服务器上文件内容通过sendfile发送
+        response = send_file_ranges(file_path, filename, etag)
+        if is_compressible(filename):
+            # 预压缩版本生成后响应会随Accept-Encoding变化
+            response.vary.add('Accept-Encoding')
+        return response
+    
+    if request.accept_encodings[encoding]:
+        # 客户端支持该编码，直接发送压缩存储的字节，由客户端解压，Range针对压缩后的字节
+        response = send_file_ranges(file_path, filename, f"{etag}-{encoding}")
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = _decompressed_response(filename, size)
+    response.vary.add('Accept-Encoding')
+    return response
+
+def _is_new_download(response):
+    """
+    响应是否算作一次下载：GET请求收到完整文件（包括If-Range不匹配时重新发送的整个文件），
+    或收到从开头开始的区间。304、416、HEAD以及续传和分段下载的后续请求不计数
+    
+    Args:
+        response: 下载响应
+    
+    Returns:
+        bool: 应计入下载次数时返回True
+    """
+    if request.method != 'GET':
+        return False
+    if response.status_code == 200:
+        return True
+    return (response.status_code == 206 and isinstance(response.response, FileBody)
+            and response.response.start == 0)
+
+def _decompressed_response(filename, size):
+    """
+    边读取边解压压缩存储的文件，用于不支持该编码的客户端
+    
+    Args:
+        filename: 文件名
+        size: 原始大小
+    
+    Returns:
+        Response: 流式响应
+    """
+    stream = file_utils.open_file(filename)
+    # 不使用服务器的wsgi.file_wrapper，它可能按文件描述符直接发送磁盘上的压缩数据
+    response = Response(FileWrapper(stream, COPY_BUFFER_SIZE), direct_passthrough=True,
+                        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.content_length = size
+    # 边解压边发送，无法按位置读取
+    response.accept_ranges = 'none'
+    set_attachment(response, filename)
+    return response
+
+@app.route('/thumb/<path:filename>')
+def get_thumbnail(filename):
+    """
+    获取图片或视频的缩略图，尺寸通过size参数指定（small、medium、large）。
+    缩略图尚未生成时返回202，由线程池在后台生成，客户端稍后重试
+    
+    Args:
+        filename: 文件名
+    
+    Returns:
+        Response: 缩略图，或json格式的状态
+    """
+    try:
+        size_name = request.args.get('size', 'small')
+        if size_name not in THUMBNAIL_SIZES:
+            return jsonify({"success": False, "message": "缩略图尺寸无效"}), 400
+        filename, _ = _resolve_upload_file(filename)
+        
+        status, thumbnail_path = file_utils.get_thumbnail(filename, size_name)
+        if status == "pending":
+            response = jsonify({"success": False, "message": "缩略图生成中"})
+            response.status_code = 202
+            response.headers['Retry-After'] = '1'
+            return response
+        if status == "unsupported":
+            return jsonify({"success": False, "message": "该文件不支持缩略图"}), 415
+        
+        # 缩略图文件名包含内容哈希和尺寸，可直接作为ETag
+        response = send_file_ranges(thumbnail_path, os.path.basename(thumbnail_path),
+                                    os.path.basename(thumbnail_path), as_attachment=False)
+        # 文件名不变时内容可能变化，浏览器每次用ETag确认
+        response.cache_control.no_cache = True
+        return response
+    except FileNotFoundError:
+        return jsonify({"success": False, "message": "文件不存在"}), 404
+    except Exception as e:
+        logger.error(f"获取缩略图失败: {e}")
+        return jsonify({"success": False, "message": f"获取缩略图失败: {str(e)}"}), 500
+
+@app.route('/download-zip', methods=['GET', 'POST'])
+def download_zip():
+    """
+    将多个文件或整个文件夹打包为ZIP下载，归档边生成边发送，不使用临时文件，内存占用与文件数量和大小无关。
+    文件路径通过filenames参数（表单、查询参数或json）传入，归档内的路径为文件名；
+    或者通过folder参数下载文件夹及其各级子文件夹，归档内保留以该文件夹为顶层的目录结构
+    
+    Returns:
+        Response: ZIP归档的流式响应
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        folder = request.values.get('folder', data.get('folder'))
+        archive_name = f"files_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        if folder:
+            folder = normalize_path(folder)
+            parent, name = split_path(folder)
+            filenames = file_utils.list_folder_files(folder)
+            # 归档内的路径相对于文件夹的上级文件夹
+            arcnames = [filename[len(parent) + 1:] if parent else filename for filename in filenames]
+            if name:
+                archive_name = f"{name}.zip"
+        else:
+            filenames = request.values.getlist('filenames') or data.get('filenames', [])
+            arcnames = None
+        
+        entries = []
+        seen = set()
+        used_arcnames = set()
+        for index, filename in enumerate(filenames):
+            try:
+                filename = normalize_path(filename)
+            except ValueError:
+                # 跳过存储用的隐藏目录
+                continue
+            file_path = file_utils.get_file_path(filename) if filename else None
+            # 跳过重复和不存在的文件
+            if filename in seen or file_path is None or not os.path.isfile(file_path):
+                continue
+            seen.add(filename)
+            _, size = file_utils.get_file_encoding(filename)
+            mtime = os.path.getmtime(file_path)
+            if arcnames is not None:
+                arcname = arcnames[index]
+            else:
+                # 选中的文件来自不同文件夹且重名时保留完整路径
+                arcname = split_path(filename)[1]
+                if arcname in used_arcnames:
+                    arcname = filename
+                used_arcnames.add(arcname)
+            entries.append((arcname, size, mtime, lambda name=filename: file_utils.open_file(name)))
+        if not entries:
+            return jsonify({"success": False, "message": "没有选择要下载的文件"}), 400
+        
+        logger.info(f"打包下载 {len(entries)} 个文件")
+        response = Response(iter_zip(entries), mimetype='application/zip')
+        set_attachment(response, archive_name)
+        return response
+    except FileNotFoundError:
+        return jsonify({"success": False, "message": "文件夹不存在"}), 404
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"打包下载失败: {e}")
+        return jsonify({"success": False, "message": f"打包下载失败: {str(e)}"}), 500
+
 @app.route('/api/users')
 def get_users():
     """
@@ -121,6 +908,58 @@ def update_user(user_id):
         logger.error(f"更新用户信息失败: {e}")
         return jsonify({"success": False, "message": "更新失败"}), 500
 
+def _is_local_request():
+    """
+    管理接口只允许运行服务的本机访问
+    """
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/api/admin/bandwidth', methods=['GET', 'PUT'])
+def bandwidth_limits():
+    """
+    查看或修改带宽限制，速率单位为字节/秒，null或0表示不限速。
+    PUT的请求体与返回的limits格式相同，只修改给出的项
+    
+    Returns:
+        json: 当前限制和正在进行的传输
+    """
+    if not _is_local_request():
+        return jsonify({"success": False, "message": "只允许本机访问"}), 403
+    try:
+        if request.method == 'PUT':
+            bandwidth_manager.update_limits(request.get_json(silent=True))
+        return jsonify({
+            "success": True,
+            "limits": bandwidth_manager.get_limits(),
+            "transfers": bandwidth_manager.get_transfers()
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"修改带宽限制失败: {e}")
+        return jsonify({"success": False, "message": f"修改带宽限制失败: {str(e)}"}), 500
+
+@app.route('/api/admin/transfers/<transfer_id>/limit', methods=['PUT'])
+def transfer_limit(transfer_id):
+    """
+    为单个正在进行的传输设置限制，请求体为{"limit": 速率}，null表示恢复使用per_transfer
+    
+    Args:
+        transfer_id: 传输ID
+    
+    Returns:
+        json: 修改结果
+    """
+    if not _is_local_request():
+        return jsonify({"success": False, "message": "只允许本机访问"}), 403
+    try:
+        data = request.get_json(silent=True) or {}
+        if not bandwidth_manager.set_transfer_limit(transfer_id, data.get('limit')):
+            return jsonify({"success": False, "message": "传输不存在"}), 404
+        return jsonify({"success": True, "transfers": bandwidth_manager.get_transfers()})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
 @app.route('/delete/<path:filename>', methods=['DELETE'])
 def delete_file(filename):
     """
@@ -134,15 +973,17 @@ def delete_file(filename):
     """
     try:
         import urllib.parse
-        filename = urllib.parse.unquote(filename)
+        filename = normalize_path(urllib.parse.unquote(filename))
         
         success = file_utils.delete_file(filename)
         if success:
-            from web.socket_events import socketio
-            socketio.emit('file_list_update', {"files": file_utils.get_file_list()})
+            from web.socket_events import broadcast_file_changes
+            broadcast_file_changes()
             return jsonify({"success": True, "message": "文件删除成功"})
         else:
             return jsonify({"success": False, "message": "文件删除失败"}), 500
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         logger.error(f"文件删除失败: {e}")
         return jsonify({"success": False, "message": f"文件删除失败: {str(e)}"}), 500
@@ -164,11 +1005,15 @@ def batch_delete_files():
         
         success_count = 0
         for filename in filenames:
-            if file_utils.delete_file(filename):
+            try:
+                filename = normalize_path(filename)
+            except ValueError:
+                continue
+            if filename and file_utils.delete_file(filename):
                 success_count += 1
         
-        from web.socket_events import socketio
-        socketio.emit('file_list_update', {"files": file_utils.get_file_list()})
+        from web.socket_events import broadcast_file_changes
+        broadcast_file_changes()
         
         return jsonify({"success": True, "message": f"成功删除 {success_count} 个文件", "deleted_count": success_count})
     except Exception as e:
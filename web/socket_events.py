@@ -1,5 +1,6 @@
 from flask import request
 import flask_socketio
+import threading
 from web import socketio
 from utils.user_cache import user_cache
 from utils.file_utils import file_utils
@@ -9,6 +10,34 @@ from datetime import datetime
 # 在线用户字典，key为socket_id，value为user_id
 online_users = {}
 
+# 上次推送文件列表变化时的版本号
+broadcast_version = 0
+broadcast_lock = threading.Lock()
+
+def broadcast_file_changes():
+    """
+    把上次推送以来文件列表的变化合并为一个增量推送给所有客户端，只包含变化的文件。
+    客户端的版本号等于base时直接应用；落后于base时应通过request_file_list重新获取完整列表
+    """
+    global broadcast_version
+    # 持有锁推送，保证客户端按版本顺序收到
+    with broadcast_lock:
+        delta = file_utils.file_index.changes_since(broadcast_version)
+        if delta is None:
+            # 变化太多或索引已重置，通知客户端重新获取完整列表
+            delta = {"base": broadcast_version, "version": file_utils.file_index.version, "reset": True}
+        elif not (delta["added"] or delta["changed"] or delta["removed"]):
+            return
+        broadcast_version = delta["version"]
+        socketio.emit('file_list_delta', delta)
+
+def send_file_list():
+    """
+    向当前客户端发送完整的文件列表及其版本号
+    """
+    files, version = file_utils.file_index.versioned_list()
+    socketio.emit('file_list_update', {"files": files, "version": version}, to=request.sid)
+
 @socketio.on('connect')
 def handle_connect():
     """
@@ -73,9 +102,9 @@ def handle_user_login(data):
     # 返回用户信息
     socketio.emit('login_success', user_data)
     
-    # 发送当前文件列表给当前用户
-    file_list = file_utils.get_file_list()
-    socketio.emit('file_list_update', {"files": file_list})
+    # 发送当前文件列表给当前用户，按页从/api/files获取列表的客户端可以不要
+    if data.get('file_list', True):
+        send_file_list()
     
     # 广播用户列表更新给所有用户，只发送在线用户
     online_users_list = user_cache.get_online_users()
@@ -91,6 +120,13 @@ def handle_user_login(data):
         })
     socketio.emit('user_list_update', {"users": serialized_users})
 
+@socketio.on('request_file_list')
+def handle_request_file_list(data=None):
+    """
+    处理获取完整文件列表事件，客户端错过了增量变化时使用
+    """
+    send_file_list()
+
 @socketio.on('send_message')
 def handle_send_message(data):
     """
@@ -102,11 +138,7 @@ def handle_send_message(data):
     if request.sid in online_users:
         user_id = online_users[request.sid]
         # 获取用户信息
-        user = None
-        for u in user_cache.get_all_users():
-            if u['user_id'] == user_id:
-                user = u
-                break
+        user = user_cache.get_user_by_id(user_id)
         
         if user:
             message = data.get('message', '')